@@ -0,0 +1,62 @@
+"""Crash-safe file replacement.
+
+Writes go to a temp file in the target's own directory, get fsynced, and are then
+os.replace()d over the target, so a reader (or a restart after a crash / full disk)
+sees either the complete old file or the complete new one -- never a truncated
+half-write. Shared by stats_store.py (request counters) and anything else that
+persists onto the data/ volume (image_cache.py stores whole images the same way).
+No Discord/OpenAI/bot side effects.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+
+
+def write_json_atomic(path, obj, **dump_kwargs):
+    """Serialize `obj` to `path` atomically. `dump_kwargs` pass straight through to
+    json.dump (e.g. indent=2, ensure_ascii=False). The temp file is removed if
+    anything fails before the rename, leaving the existing `path` untouched."""
+    _replace_atomic(path, 'w', lambda f: json.dump(obj, f, **dump_kwargs), encoding='utf-8')
+
+
+def copy_file_atomic(path, source):
+    """Copy the readable binary file object `source`, from its current position, to
+    `path` atomically -- same guarantees as write_json_atomic."""
+    _replace_atomic(path, 'wb', lambda f: shutil.copyfileobj(source, f))
+
+
+def _replace_atomic(path, mode, write, **open_kwargs):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, mode, **open_kwargs) as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp creates 0600; match what a plain open(path, 'w') would have left.
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    _fsync_directory(directory)
+
+
+def _fsync_directory(directory):
+    """Persist the rename itself. Best effort: not every platform/filesystem lets a
+    directory be opened for fsync, and the data is already safely in place."""
+    try:
+        dir_fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(dir_fd)
+    except OSError:
+        pass
+    finally:
+        os.close(dir_fd)
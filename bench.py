@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+"""Offline load test for the bot's command pipeline.
+
+Builds the bot with bot_ross.create_bot() without connecting to Discord (timing the
+import, the factory and setup_hook -- the bot's cold start up to connecting), points
+it at a local aiohttp
+server impersonating /v1/images/generations (plain and streamed), /v1/images/edits
+and /v1/chat/completions, and runs each command against a fake Discord context that
+records every send and edit. The fake API's latency, error rate and 429 rate are
+configurable, so a scenario shows how the queue, retries, previews and status
+messages behave under load. For each scenario it reports requests/sec, p50/p95
+latency, outcomes, Discord and API calls, the stage timings perf.py recorded, and
+the process's peak RSS.
+
+Nothing here touches the network beyond 127.0.0.1, and no real keys are needed:
+the bot runs in a scratch directory (its data/ is created there) with dummy
+credentials.
+
+    python bench.py                      # every scenario
+    python bench.py paint remix          # just these
+    python bench.py paint --latency 2 --rate-limit-rate 0.1 --workers 8
+
+Peak RSS is the process-wide high-water mark (ru_maxrss), so it only grows from one
+scenario to the next -- run one scenario per invocation for its own figure. &remix's
+image preprocessing runs in worker processes, which are not included.
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import logging
+import os
+import random
+import resource
+import shutil
+import struct
+import sys
+import tempfile
+import time
+import zlib
+from types import SimpleNamespace
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+SEED_FILES = ("magic_prompts.json", "macros.json")
+
+
+def noise_png(width, height, seed=0):
+    """A valid RGB PNG of random pixels -- incompressible, so its size is about
+    width * height * 3 bytes."""
+    rng = random.Random(seed)
+    rows = b"".join(b"\x00" + rng.randbytes(width * 3) for _ in range(height))
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(rows, 1)) + chunk(b"IEND", b"")
+
+
+def png_of_size(target_bytes, seed=0):
+    """(png, width, height) for a square noise PNG of roughly `target_bytes`."""
+    side = max(int((target_bytes / 3) ** 0.5), 16)
+    return noise_png(side, side, seed), side, side
+
+
+class FakeOpenAI:
+    """A local stand-in for the OpenAI endpoints the bot calls. Every image or chat
+    call takes `latency` seconds (+/- `jitter`, normally distributed); a fraction
+    `error_rate` answers 500 and a fraction `rate_limit_rate` answers 429 with a
+    retry-after of `retry_after` seconds. A streamed generation sends `partials`
+    partial images spread over its latency. Also serves /attachments/<name> for the
+    fake Discord attachments &remix downloads."""
+
+    def __init__(self, latency=0.2, jitter=0.05, error_rate=0.0, rate_limit_rate=0.0, retry_after=0.5,
+                 image_kb=1500, partials=2, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.partials = partials
+        self.rng = random.Random(seed)
+        self.image_b64 = base64.b64encode(png_of_size(image_kb * 1024, seed)[0]).decode()
+        self.partial_b64 = base64.b64encode(noise_png(64, 64, seed)).decode()
+        self.attachments = {}  # name -> bytes
+        self.calls = {}  # endpoint -> count
+        self.errors = 0
+        self.rate_limited = 0
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/v1/images/generations", self.generations)
+        app.router.add_post("/v1/images/edits", self.edits)
+        app.router.add_post("/v1/chat/completions", self.chat)
+        app.router.add_get("/attachments/{name}", self.attachment)
+        self.server = TestServer(app)
+
+    def url(self, path):
+        return str(self.server.make_url(path))
+
+    def reset_counts(self):
+        self.calls, self.errors, self.rate_limited = {}, 0, 0
+
+    def _delay(self):
+        return max(self.rng.gauss(self.latency, self.jitter), 0.0)
+
+    async def _fault(self, endpoint):
+        """Count the call; a 500/429 response if this one is to fail, else None."""
+        self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+        roll = self.rng.random()
+        if roll < self.rate_limit_rate:
+            self.rate_limited += 1
+            await asyncio.sleep(self._delay() / 10)
+            return web.json_response({"error": {"message": "Rate limit reached"}}, status=429,
+                                     headers={"retry-after": f"{self.retry_after:g}"})
+        if roll < self.rate_limit_rate + self.error_rate:
+            self.errors += 1
+            await asyncio.sleep(self._delay() / 4)
+            return web.json_response({"error": {"message": "The server had an error"}}, status=500)
+        return None
+
+    def _images(self, count):
+        return {"created": int(time.time()), "data": [{"b64_json": self.image_b64} for _ in range(count)]}
+
+    async def generations(self, request):
+        payload = await request.json()
+        fault = await self._fault("generations")
+        if fault is not None:
+            return fault
+        count = int(payload.get("n", 1))
+        if not payload.get("stream"):
+            await asyncio.sleep(self._delay())
+            return web.json_response(self._images(count))
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        steps = min(int(payload.get("partial_images", self.partials)), self.partials)
+        delay = self._delay()
+        for index in range(steps):
+            await asyncio.sleep(delay / (steps + 1))
+            event = {"type": "image_generation.partial_image", "b64_json": self.partial_b64,
+                     "partial_image_index": index}
+            await response.write(f"event: {event['type']}\ndata: {json.dumps(event)}\n\n".encode())
+        await asyncio.sleep(delay / (steps + 1))
+        event = {"type": "image_generation.completed", "b64_json": self.image_b64}
+        await response.write(f"event: {event['type']}\ndata: {json.dumps(event)}\n\n".encode())
+        await response.write_eof()
+        return response
+
+    async def edits(self, request):
+        count = 1
+        async for part in await request.multipart():
+            data = await part.read()
+            if part.name == "n":
+                count = int(data)
+        fault = await self._fault("edits")
+        if fault is not None:
+            return fault
+        await asyncio.sleep(self._delay())
+        return web.json_response(self._images(count))
+
+    async def chat(self, request):
+        await request.json()
+        fault = await self._fault("chat")
+        if fault is not None:
+            return fault
+        await asyncio.sleep(self._delay() / 4)
+        content = "A cat in a beret painting a happy little tree, captioned 'no mistakes'"
+        return web.json_response({"choices": [{"message": {"role": "assistant", "content": content}}]})
+
+    async def attachment(self, request):
+        return web.Response(body=self.attachments[request.match_info["name"]], content_type="image/png")
+
+
+class FakeMessage:
+    def __init__(self, channel, content, files):
+        self.channel = channel
+        self.content = content
+        self.attachments = channel.upload(files)
+
+    async def edit(self, content=None, attachments=None):
+        self.channel.calls += 1
+        self.content = content
+        if attachments is not None:
+            self.attachments = self.channel.upload(attachments)
+
+    async def delete(self):
+        self.channel.calls += 1
+
+
+class FakeChannel:
+    """Records what one request sends: every send and edit is one Discord call, and
+    every attached file is read through as an upload would."""
+
+    def __init__(self):
+        self.messages = []
+        self.calls = 0
+        self.uploaded_bytes = 0
+
+    def upload(self, files):
+        names = []
+        for file in files:
+            self.uploaded_bytes += len(file.fp.read())
+            names.append(file.filename)
+        return names
+
+    async def send(self, content=None, *, file=None, files=None):
+        self.calls += 1
+        message = FakeMessage(self, content, ([file] if file is not None else []) + list(files or []))
+        self.messages.append(message)
+        return message
+
+    async def fetch_message(self, message_id):
+        raise LookupError(message_id)
+
+    def painted(self):
+        return any(not name.startswith("preview.") for m in self.messages for name in m.attachments)
+
+
+class FakeContext:
+    def __init__(self, user, attachments=()):
+        self.author = SimpleNamespace(id=user, name=f"bench-user-{user}")
+        self.guild = None
+        self.channel = FakeChannel()
+        self.message = SimpleNamespace(attachments=list(attachments), reference=None)
+
+    async def send(self, content=None, **kwargs):
+        return await self.channel.send(content, **kwargs)
+
+
+class Scenario:
+    def __init__(self, description, command, count, users=25, kwargs=None, attachment_mb=0):
+        self.description = description
+        self.command = command
+        self.count = count
+        self.users = users
+        self.kwargs = kwargs or (lambda i: {})
+        self.attachment_mb = attachment_mb
+
+
+SCENARIOS = {
+    "paint": Scenario("200 concurrent &paint", "paint", 200,
+                      kwargs=lambda i: {"prompt": f"a happy little cabin number {i}"}),
+    "remix": Scenario("50 &remix with 4 MB attachments", "remix", 50, attachment_mb=4,
+                      kwargs=lambda i: {"prompt": f"as a watercolor, take {i}"}),
+    "meme": Scenario("50 concurrent &meme", "meme", 50, kwargs=lambda i: {"prompt": f"mondays, take {i}"}),
+    "release": Scenario("100 identical &release_image (shared and cached)", "release_image", 100,
+                        kwargs=lambda i: {"args": "deadbeef"}),
+    "batch": Scenario("1 &release_image --batch of 60 hashes (2 repeated)", "release_image", 1,
+                      kwargs=lambda i: {"args": "--batch " + " ".join(f"{n % 58:040x}" for n in range(60))}),
+}
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
+
+
+async def run_scenario(bot, perf, api, scenario):
+    api.reset_counts()
+    recorder = perf.PerfRecorder()
+    command = bot.get_command(scenario.command)
+    attachments = []
+    if scenario.attachment_mb:
+        png, width, height = png_of_size(scenario.attachment_mb * 1024 * 1024, seed=1)
+        api.attachments["photo.png"] = png
+        attachments = [SimpleNamespace(url=api.url("/attachments/photo.png"), content_type="image/png",
+                                       size=len(png), width=width, height=height)]
+    contexts = [FakeContext(i % scenario.users, attachments) for i in range(scenario.count)]
+    latencies = []
+
+    async def one(i):
+        perf.begin(recorder, command.name)
+        t0 = time.monotonic()
+        try:
+            await command(contexts[i], **scenario.kwargs(i))
+        finally:
+            perf.end()
+            latencies.append(time.monotonic() - t0)
+
+    t0 = time.monotonic()
+    await asyncio.gather(*(asyncio.create_task(one(i)) for i in range(scenario.count)))
+    wall = time.monotonic() - t0
+
+    painted = sum(ctx.channel.painted() for ctx in contexts)
+    discord_calls = sum(ctx.channel.calls for ctx in contexts)
+    print(f"\n== {scenario.description}")
+    print(f"   {scenario.count} requests in {wall:.2f}s: {scenario.count / wall:.1f} req/s, "
+          f"{painted} painted ({painted / wall:.1f}/s), {scenario.count - painted} without a painting")
+    print(f"   latency p50 {percentile(latencies, 0.5):.2f}s  p95 {percentile(latencies, 0.95):.2f}s  "
+          f"max {max(latencies):.2f}s")
+    print(f"   Discord calls: {discord_calls} ({discord_calls / scenario.count:.1f}/request), "
+          f"{sum(ctx.channel.uploaded_bytes for ctx in contexts) / 2**20:.1f} MB uploaded")
+    calls = ", ".join(f"{endpoint} {count}" for endpoint, count in sorted(api.calls.items())) or "none"
+    print(f"   API calls: {calls} | 500s {api.errors} | 429s {api.rate_limited}")
+    for stage, histogram in recorder.summary():
+        print(f"   {stage:<8} {perf.format_quantiles(histogram)}  (p50/p95/p99, n={histogram.count})")
+    print(f"   peak RSS {peak_rss_mb():.0f} MB")
+
+
+def prepare_workdir():
+    """A scratch directory holding the seed libraries, for the bot's data/."""
+    workdir = tempfile.mkdtemp(prefix="bot_ross_bench_")
+    for name in SEED_FILES:
+        shutil.copy(os.path.join(REPO_DIR, name), workdir)
+    return workdir
+
+
+async def main(args):
+    api = FakeOpenAI(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                     rate_limit_rate=args.rate_limit_rate, retry_after=args.retry_after,
+                     image_kb=args.image_kb, seed=args.seed)
+    await api.server.start_server()
+    workdir = prepare_workdir()
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    sys.path.insert(0, REPO_DIR)
+    try:
+        t0 = time.monotonic()
+        import bot_ross
+        import perf
+        imported = time.monotonic()
+        logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+        if not args.verbose:
+            logging.getLogger("aiohttp.access").setLevel(logging.WARNING)
+        bot = bot_ross.create_bot({
+            **bot_ross.load_config({}),
+            "openai_api_key": "sk-bench",
+            "openai_base_url": api.url("/v1"),
+            "limit": 10 ** 9,
+            "generation_workers": args.workers,
+            "generation_queue_size": args.queue_size,
+            "perf_log_interval": 0,
+        })
+        created = time.monotonic()
+        await bot.setup_hook()
+        try:
+            print(f"Cold start {(time.monotonic() - t0) * 1000:.0f}ms: import {(imported - t0) * 1000:.0f}ms, "
+                  f"create_bot {(created - imported) * 1000:.0f}ms, setup_hook {bot.setup_seconds * 1000:.0f}ms")
+            print(f"Fake OpenAI latency {args.latency}s ±{args.jitter}s, 500s {args.error_rate:.0%}, "
+                  f"429s {args.rate_limit_rate:.0%} | {args.workers} workers, queue {args.queue_size}")
+            for name in args.scenarios or SCENARIOS:
+                await run_scenario(bot, perf, api, SCENARIOS[name])
+        finally:
+            await bot.close()
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+        await api.server.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline load test of the bot's command pipeline.")
+    parser.add_argument("scenarios", nargs="*", choices=[[]] + list(SCENARIOS), metavar="scenario",
+                        help=f"scenarios to run (default: all): {', '.join(SCENARIOS)}")
+    parser.add_argument("--latency", type=float, default=0.2, help="fake API seconds per call (default 0.2)")
+    parser.add_argument("--jitter", type=float, default=0.05, help="standard deviation of that (default 0.05)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls answered 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction of calls answered 429")
+    parser.add_argument("--retry-after", type=float, default=0.5, help="retry-after seconds sent with a 429")
+    parser.add_argument("--image-kb", type=int, default=1500, help="size of each generated image (default 1500)")
+    parser.add_argument("--workers", type=int, default=3, help="GENERATION_WORKERS (default 3, the bot's)")
+    parser.add_argument("--queue-size", type=int, default=1000,
+                        help="GENERATION_QUEUE_SIZE (default 1000, so no scenario is turned away)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="keep the bot's INFO logging")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
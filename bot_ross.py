@@ -1,46 +1,107 @@
 import asyncio
-import aiohttp
+import io
 import time
+import aiohttp
 import discord
 import os
-import json
 from datetime import datetime, date
 from discord.ext import commands
-import openai
 import random
 import logging
 import coloredlogs
-import base64
-import io
 import string
 import re
 import release_image
+import release_batch
 import magic_paint
 import macros
 import image_size
+import openai_client
+import spooled_attachments
+import image_prep
+import image_cache
+import image_stream
+import singleflight
+import compare
+import preview
+import status_message
+import perf
+import metrics
+import job_queue
+import stats_store
+import json_library
+import sqlite_store
+import quota
 from magic_paint import parse_magic_rate, format_magic_rate
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("bot_ross")
-coloredlogs.install(level='INFO', logger=logger, milliseconds=True)
 
-# Load OpenAI API key and Discord bot token from environment variables
-openai.api_key = os.environ['OPENAI_API_KEY']
-DISCORD_BOT_TOKEN = os.environ['DISCORD_BOT_TOKEN']
 
-# Configuration
-LIMIT            = int(os.environ.get('API_LIMIT', 100))
-IMAGE_MODEL      = os.environ.get('IMAGE_MODEL', 'gpt-image-2-low')
-IMAGE_MODERATION = os.environ.get('IMAGE_MODERATION', 'low')
-MEME_MODEL       = os.environ.get('MEME_MODEL', 'gpt-5.4-mini')
+def load_config(environ=None):
+    """The bot's settings, read from `environ` (default: os.environ) into the dict
+    create_bot() takes. Reads nothing but the mapping -- no files, no network -- and
+    doesn't insist on the secrets; main() checks those before connecting, so the
+    module and its pipeline import and run without them (bench.py, the tests)."""
+    env = os.environ if environ is None else environ
+    try:
+        magic_paint_rate = float(env.get('MAGIC_PAINT_RATE', 0.05))
+        if not (0.0 <= magic_paint_rate <= 1.0):
+            raise ValueError
+    except (TypeError, ValueError):
+        magic_paint_rate = 0.05
+    return {
+        'openai_api_key': env.get('OPENAI_API_KEY', ''),
+        'discord_bot_token': env.get('DISCORD_BOT_TOKEN', ''),
+        'limit': int(env.get('API_LIMIT', 100)),
+        'image_model': env.get('IMAGE_MODEL', 'gpt-image-2-low'),
+        'image_moderation': env.get('IMAGE_MODERATION', 'low'),
+        'meme_model': env.get('MEME_MODEL', 'gpt-5.4-mini'),
+        # Where OpenAI requests go: the real API, or a proxy / local stand-in (see bench.py).
+        'openai_base_url': env.get('OPENAI_BASE_URL', openai_client.API_BASE),
+        # 'json' (default): flat files under data/. 'sqlite': one WAL-mode database at
+        # SQLITE_FILE, migrated once from the JSON files (see sqlite_store.py).
+        'storage_backend': env.get('STORAGE_BACKEND', 'json').lower(),
+        # How many OpenAI image calls may run at once, and how many more may wait in line.
+        'generation_workers': int(env.get('GENERATION_WORKERS', 3)),
+        'generation_queue_size': int(env.get('GENERATION_QUEUE_SIZE', 30)),
+        # Downscale/re-encode &remix inputs to the edit size before uploading (needs
+        # Pillow), in a pool of REMIX_PREP_WORKERS processes.
+        'remix_preprocess': env.get('REMIX_PREPROCESS', '1').lower() not in ('0', 'false', 'no', 'off'),
+        'remix_prep_workers': int(env.get('REMIX_PREP_WORKERS', 2)),
+        # Generated images for deterministic prompts (&release_image) are kept under
+        # IMAGE_CACHE_DIR and reused for identical requests, least recently used
+        # evicted past IMAGE_CACHE_MAX_MB (0: off).
+        'image_cache_max_mb': int(env.get('IMAGE_CACHE_MAX_MB', 500)),
+        # Partial images streamed back while a painting is generated (0-3, 0: off), shown
+        # as a low-res preview on the request's status message until the final image
+        # replaces it.
+        'preview_partials': min(max(int(env.get('PREVIEW_PARTIALS', 2)), 0), 3),
+        # Seconds between the stage-latency summary lines in the log (0: off); see &perf.
+        'perf_log_interval': float(env.get('PERF_LOG_INTERVAL', 300)),
+        # Serve Prometheus metrics on METRICS_HOST:METRICS_PORT/metrics (0: off); see metrics.py.
+        'metrics_port': int(env.get('METRICS_PORT', 0)),
+        'metrics_host': env.get('METRICS_HOST', '127.0.0.1'),
+        'magic_paint_rate': magic_paint_rate,
+    }
+
+
+# The settings commands read as globals. create_bot() sets them from its config; until
+# then (a bare import) they hold the defaults.
+_DEFAULTS = load_config({})
+LIMIT            = _DEFAULTS['limit']
+IMAGE_MODEL      = _DEFAULTS['image_model']
+MEME_MODEL       = _DEFAULTS['meme_model']
+PREVIEW_PARTIALS = _DEFAULTS['preview_partials']
+MAGIC_PAINT_RATE = _DEFAULTS['magic_paint_rate']
+
 DATA_FILE        = "data/request_data.json"
+SQLITE_FILE      = "data/bot_ross.db"
+IMAGE_CACHE_DIR  = "data/image_cache"
+PREVIEW_BOX      = (512, 512)
 
-try:
-    MAGIC_PAINT_RATE = float(os.environ.get('MAGIC_PAINT_RATE', 0.05))
-    if not (0.0 <= MAGIC_PAINT_RATE <= 1.0):
-        raise ValueError
-except (TypeError, ValueError):
-    MAGIC_PAINT_RATE = 0.05
+# A Discord message carries at most this many attachments; --n batches beyond it (or
+# past the server's upload size limit) are split across messages.
+DISCORD_MAX_FILES = 10
 
 # The working library lives on the persistent data/ volume so user-added mixins survive
 # redeploys; DEFAULT_MAGIC_PROMPTS_FILE is the seed baked into the image (see _seed_magic_library).
@@ -51,6 +112,11 @@ DEFAULT_MAGIC_PROMPTS_FILE = "magic_prompts.json"
 MACROS_FILE = "data/macros.json"
 DEFAULT_MACROS_FILE = "macros.json"
 
+# Library edits (&magic_*/&macro_*) take effect immediately in memory but are written
+# to disk only after this many quiet seconds, so a burst of edits is a single atomic
+# write (see json_library.save_library). Anything still pending is written on shutdown.
+LIBRARY_SAVE_DELAY = 2.0
+
 MODEL_CONFIGS = {
     "gpt-image-2": {
         "model": "gpt-image-2",
@@ -58,6 +124,8 @@ MODEL_CONFIGS = {
         "has_revised_prompt": False,
         "supports_moderation": True,
         "supports_edit": True,
+        "supports_batch": True,
+        "supports_streaming": True,
     },
     "gpt-image-2-medium": {
         "model": "gpt-image-2",
@@ -65,6 +133,8 @@ MODEL_CONFIGS = {
         "has_revised_prompt": False,
         "supports_moderation": True,
         "supports_edit": True,
+        "supports_batch": True,
+        "supports_streaming": True,
     },
     "gpt-image-2-low": {
         "model": "gpt-image-2",
@@ -72,6 +142,8 @@ MODEL_CONFIGS = {
         "has_revised_prompt": False,
         "supports_moderation": True,
         "supports_edit": True,
+        "supports_batch": True,
+        "supports_streaming": True,
     },
     "dall-e-3": {
         "model": "dall-e-3",
@@ -79,9 +151,16 @@ MODEL_CONFIGS = {
         "has_revised_prompt": True,
         "supports_moderation": False,
         "supports_edit": False,
+        "supports_batch": False,
+        "supports_streaming": False,
     },
 }
 
+# &compare's --models choices, slowest first -- the order the renders are started in
+# (see compare.py). The MODEL_CONFIGS keys themselves are accepted too.
+COMPARE_CHOICES = {"high": "gpt-image-2", "dalle": "dall-e-3", "medium": "gpt-image-2-medium",
+                   "low": "gpt-image-2-low"}
+
 
 def format_duration(seconds):
     if seconds < 1:
@@ -118,11 +197,12 @@ def _load_magic_library():
 
 
 def _apply_random_magic_entry(prompt):
-    return magic_paint.apply_random_magic_entry(prompt, path=MAGIC_PROMPTS_FILE)
+    with perf.stage("magic"):
+        return magic_paint.apply_random_magic_entry(prompt, path=MAGIC_PROMPTS_FILE)
 
 
 def _save_magic_library(entries):
-    magic_paint.save_magic_library(entries, MAGIC_PROMPTS_FILE)
+    magic_paint.save_magic_library(entries, MAGIC_PROMPTS_FILE, delay=LIBRARY_SAVE_DELAY)
 
 
 def _seed_magic_library():
@@ -131,7 +211,8 @@ def _seed_magic_library():
 
 def maybe_apply_magic_paint(prompt):
     """Random-roll magic paint at the live MAGIC_PAINT_RATE. Only reads the library if the roll succeeds."""
-    return magic_paint.maybe_apply_magic_paint(prompt, MAGIC_PAINT_RATE, path=MAGIC_PROMPTS_FILE)
+    with perf.stage("magic"):
+        return magic_paint.maybe_apply_magic_paint(prompt, MAGIC_PAINT_RATE, path=MAGIC_PROMPTS_FILE)
 
 
 # Thin wrappers binding macros.py's pure logic to this module's file paths, mirroring
@@ -142,7 +223,7 @@ def _load_macro_library():
 
 
 def _save_macro_library(entries):
-    macros.save_macro_library(entries, MACROS_FILE)
+    macros.save_macro_library(entries, MACROS_FILE, delay=LIBRARY_SAVE_DELAY)
 
 
 def _seed_macro_library():
@@ -164,22 +245,18 @@ def format_rate_change_time(iso_str):
 
 def _record_rate_change(user, rate):
     """Append a rate-change record to the persisted history (keeps the last 10) and log it."""
-    data = load_data()
-    history = data.get('magic_rate_history', [])
+    history = list(counters.get('magic_rate_history', []))
     history.append({"user": user, "rate": rate, "time": datetime.now().astimezone().isoformat()})
-    data['magic_rate_history'] = history[-10:]
-    save_data(data)
+    counters.set('magic_rate_history', history[-10:])
     logger.info(f"Magic rate changed to {format_magic_rate(rate)} ({rate}) by {user}")
 
 
-async def send_quote(ctx, magic=False):
+def note_quote(status, magic=False):
     quote = get_random_bob_ross_quote()
     if magic:
         quote += " 🖌️"
-        data = load_data()
-        data['magic'] = data.get('magic', 0) + 1
-        save_data(data)
-    await ctx.send(quote)
+        counters.increment('magic')
+    status.note(quote)
 
 
 async def send_long(ctx, text):
@@ -196,7 +273,7 @@ async def send_long(ctx, text):
         await ctx.send(chunk)
 
 
-async def expand_prompt_macros(ctx, prompt):
+def expand_prompt_macros(status, prompt):
     """Expand every ';token' in `prompt` via the macro library (data/macros.json).
 
     The single chokepoint every prompt-bearing command calls, and always the FIRST
@@ -205,91 +282,274 @@ async def expand_prompt_macros(ctx, prompt):
     fully expanded prompt is echoed back on an 'expanded prompt: ...' line -- this is
     the post-macro, PRE-magic-paint prompt, so it deliberately never reveals a magic
     mixin. An unresolved token is swapped for a joke fallback so the prompt stays
-    usable, and every miss is also called out on a leading 🎲 line.
-    Increments the persisted 'macros'/'macro_misses' counters (shown in &stats) by
-    however many tokens actually hit/missed on this call -- if the prompt had no
-    ';tokens' at all, nothing is written to disk and nothing is sent."""
-    prompt, hits, misses = macros.expand_macros(prompt, path=MACROS_FILE)
+    usable, and every miss is also called out on a leading 🎲 line. Both lines are
+    notes on the request's status message (see status_message.py), not messages.
+    Increments the 'macros'/'macro_misses' counters (shown in &stats) by however
+    many tokens actually hit/missed on this call -- if the prompt had no ';tokens'
+    at all, no counter changes and nothing is noted."""
+    with perf.stage("macros"):
+        prompt, hits, misses = macros.expand_macros(prompt, path=MACROS_FILE)
     if hits or misses:
-        lines = []
         if misses:
             tokens = ", ".join(f"`;{m}`" for m in misses)
-            lines.append(f"🎲 {tokens} (macro not found, good luck)")
-        lines.append(f"expanded prompt: {prompt}")
-        await send_long(ctx, "\n".join(lines))
-        data = load_data()
-        data['macros'] = data.get('macros', 0) + len(hits)
-        data['macro_misses'] = data.get('macro_misses', 0) + len(misses)
-        save_data(data)
+            status.note(f"🎲 {tokens} (macro not found, good luck)")
+        status.note(f"expanded prompt: {prompt}")
+        counters.increment('macros', len(hits))
+        counters.increment('macro_misses', len(misses))
     return prompt
 
 
-intents = discord.Intents.default()
-intents.guilds = True
-intents.messages = True
-intents.presences = True
-intents.message_content = True
-bot = commands.Bot(command_prefix='&', intents=intents)
-
-start_time = datetime.now()
+# Every persisted counter lives in memory in `counters`; increments never touch disk on
+# the command path. The store writes data/request_data.json (or, with SQLite storage,
+# just the changed rows) behind the scenes every STATS_FLUSH_INTERVAL seconds and once
+# more at shutdown (see BotRoss below).
+STATS_FLUSH_INTERVAL = 15
+
+# The bot's services, built by create_bot() (and, for the ones that read data/, its
+# setup_hook) and used by the commands as globals. None on a bare import.
+#
+# storage_db: the SQLite database, with STORAGE_BACKEND=sqlite.
+# counters: the persisted counters (stats_store.StatsStore).
+# openai_api: one pooled HTTP session for every OpenAI call (images and the &meme chat
+#   prompt), opened in setup_hook and closed on shutdown, so requests reuse warm
+#   keep-alive connections and never borrow threads from the default executor (see
+#   openai_client.py).
+# generation_queue: every image API call goes through it rather than straight from the
+#   command coroutine -- GENERATION_WORKERS calls at most are in flight, and waiting jobs
+#   are served round-robin per user (see job_queue.py).
+# generation_flights: identical generations in flight at the same time share one API
+#   call (opt-in per command via do_the_art's `dedupe`; see singleflight.py).
+# image_preprocessor: CPU-bound image decoding for &remix in its own processes, off the
+#   event loop (see image_prep.py). None when disabled, or when Pillow isn't installed.
+# perf_recorder: per-stage latency histograms for every image request, read by &perf
+#   and logged every PERF_LOG_INTERVAL seconds (see perf.py).
+# image_store: content-addressed by (prompt, model, size, quality); see image_cache.py.
+# monthly_quota: every image request reserves its slot in the month's API_LIMIT before
+#   it is queued and only commits it once OpenAI has produced the image, so concurrent
+#   requests can never overspend the limit between the check and the count (see
+#   quota.py).
+# metrics_server: /metrics, when METRICS_PORT is set; needs no Discord connection.
+storage_db = None
+counters = None
+openai_api = None
+generation_queue = None
+generation_flights = None
+image_preprocessor = None
+perf_recorder = None
+image_store = None
+monthly_quota = None
+metrics_server = None
+start_time = None
+
+
+def _open_storage(config):
+    """Seed both libraries onto data/ and load the persisted state: the counters, the
+    monthly quota on top of them and the image cache index. With STORAGE_BACKEND=sqlite,
+    first open the database, import the JSON files into it the first time (after
+    seeding, so a fresh deploy imports the defaults), and route both libraries to it."""
+    global storage_db, counters, image_store, monthly_quota
+    os.makedirs(os.path.dirname(DATA_FILE), exist_ok=True)
+    _seed_magic_library()
+    _seed_macro_library()
+    if config['storage_backend'] == 'sqlite':
+        storage_db = sqlite_store.SqliteStore(SQLITE_FILE)
+        storage_db.migrate_from_json(DATA_FILE, {"magic": MAGIC_PROMPTS_FILE, "macro": MACROS_FILE})
+        json_library.attach_library(MAGIC_PROMPTS_FILE, storage_db, "magic")
+        json_library.attach_library(MACROS_FILE, storage_db, "macro")
+    counters = stats_store.StatsStore(DATA_FILE, flush_interval=STATS_FLUSH_INTERVAL, db=storage_db)
+    monthly_quota = quota.MonthlyQuota(counters, LIMIT, month=get_current_month)
+    if config['image_cache_max_mb'] > 0:
+        image_store = image_cache.ImageCache(IMAGE_CACHE_DIR, config['image_cache_max_mb'] * 1024 * 1024)
+
+
+class BotRoss(commands.Bot):
+    """The bot create_bot() builds from `config` (see load_config()). Everything that
+    reads data/ or starts a task, process or socket waits for setup_hook, which runs
+    right before connecting, and is closed again in close()."""
+
+    def __init__(self, config, **kwargs):
+        super().__init__(**kwargs)
+        self.config = config
+        self.created = time.monotonic()
+        self.setup_seconds = None
+        self.startup_seconds = None  # create_bot() to the first on_ready
+
+    async def setup_hook(self):
+        t0 = time.monotonic()
+        _open_storage(self.config)
+        counters.start()
+        await openai_api.start()
+        generation_queue.start()
+        if image_preprocessor is not None:
+            image_preprocessor.start()
+        if self.config['perf_log_interval'] > 0:
+            perf_recorder.start()
+        if metrics_server is not None:
+            await metrics_server.start()
+        self.setup_seconds = time.monotonic() - t0
+
+    async def on_ready(self):
+        if self.startup_seconds is not None:
+            logger.info(f'{self.user.name} has reconnected to Discord.')
+            return
+        self.startup_seconds = time.monotonic() - self.created
+        logger.info(f'{self.user.name} has connected to Discord! Cold start took '
+                    f'{format_duration(self.startup_seconds)} (setup {format_duration(self.setup_seconds or 0)}).')
+
+    async def close(self):
+        if metrics_server is not None:
+            await metrics_server.close()
+        await perf_recorder.close()
+        await generation_queue.close()
+        if image_preprocessor is not None:
+            image_preprocessor.close()
+        await openai_api.close()
+        json_library.flush_pending()
+        if counters is not None:
+            try:
+                await counters.close()
+            except Exception as e:
+                logger.error(f"Failed to flush stats on shutdown: {e}")
+        if storage_db is not None:
+            storage_db.close()
+        await super().close()
+
+
+def create_bot(config=None):
+    """Build the bot from `config` (load_config()'s dict; default: the environment's)
+    without touching disk or the network, and register every command on it. Sets the
+    module's settings and services -- one bot per process."""
+    global LIMIT, IMAGE_MODEL, MEME_MODEL, PREVIEW_PARTIALS, MAGIC_PAINT_RATE, start_time
+    global openai_api, generation_queue, generation_flights, image_preprocessor, perf_recorder, metrics_server
+    config = load_config() if config is None else config
+    LIMIT = config['limit']
+    IMAGE_MODEL = config['image_model']
+    MEME_MODEL = config['meme_model']
+    PREVIEW_PARTIALS = config['preview_partials']
+    MAGIC_PAINT_RATE = config['magic_paint_rate']
+    start_time = datetime.now()
+
+    openai_api = openai_client.OpenAIClient(config['openai_api_key'], moderation=config['image_moderation'],
+                                            base_url=config['openai_base_url'], partial_images=PREVIEW_PARTIALS)
+    generation_queue = job_queue.GenerationQueue(workers=config['generation_workers'],
+                                                 maxsize=config['generation_queue_size'])
+    generation_flights = singleflight.SingleFlight()
+    image_preprocessor = None
+    if config['remix_preprocess']:
+        if image_prep.AVAILABLE:
+            image_preprocessor = image_prep.ImagePreprocessor(workers=config['remix_prep_workers'])
+        else:
+            logger.warning("REMIX_PREPROCESS is on but Pillow isn't installed; remix images are sent as-is")
+    perf_recorder = perf.PerfRecorder(log_interval=config['perf_log_interval'])
+    metrics_server = None
+    if config['metrics_port']:
+        metrics_server = metrics.MetricsServer(_collect_metrics, config['metrics_host'], config['metrics_port'])
+
+    intents = discord.Intents.default()
+    intents.guilds = True
+    intents.messages = True
+    intents.presences = True
+    intents.message_content = True
+    bot = BotRoss(config, command_prefix='&', intents=intents)
+    bot.before_invoke(_begin_trace)
+    bot.after_invoke(_end_trace)
+    for command in COMMANDS:
+        bot.add_command(command)
+    return bot
 
 
-def load_data():
-    if os.path.exists(DATA_FILE):
-        with open(DATA_FILE, 'r') as f:
-            return json.load(f)
-    return {}
+def get_current_month():
+    return datetime.now().strftime("%Y-%m")
 
 
-def save_data(data):
-    with open(DATA_FILE, 'w') as f:
-        json.dump(data, f)
+def _collect_metrics():
+    """Every metric family for a /metrics scrape: the persisted counters, live gauges
+    and the stage-latency histograms (see metrics.py)."""
+    month = get_current_month()
+    in_flight = metrics.Metric("bot_ross_openai_in_flight", "gauge", "Image API calls under way, by model.")
+    for model, count in sorted(openai_api.in_flight.items()):
+        in_flight.add(count, {"model": model})
+
+    def gauge(name, help, value):
+        return metrics.Metric(f"bot_ross_{name}", "gauge", help).add(value)
+
+    gauges = [
+        gauge("queue_depth", "Image requests waiting for a worker.", generation_queue.depth),
+        gauge("queue_running", "Image requests being painted.", generation_queue.running),
+        in_flight,
+        gauge("monthly_quota_limit", "Image requests allowed this month.", LIMIT),
+        gauge("monthly_quota_used", "Image requests made this month.", monthly_quota.used(month)),
+        gauge("monthly_quota_pending", "Image requests reserved but not yet made.", monthly_quota.pending(month)),
+        gauge("monthly_quota_remaining", "Image requests left this month.", monthly_quota.remaining(month)),
+        gauge("magic_paint_rate", "Chance a prompt gets a magic mixin.", MAGIC_PAINT_RATE),
+        gauge("uptime_seconds", "Seconds since the bot started.", (datetime.now() - start_time).total_seconds()),
+    ]
+    return metrics.store_metrics(counters.get) + gauges + metrics.stage_metrics(perf_recorder)
 
 
-def get_current_month():
-    return datetime.now().strftime("%Y-%m")
+# Every command runs inside a perf trace, so the stages it goes through are timed
+# without the trace being passed around (see perf.py).
+async def _begin_trace(ctx):
+    perf.begin(perf_recorder, ctx.command.name)
 
 
-@bot.event
-async def on_ready():
-    logger.info(f'{bot.user.name} has connected to Discord!')
+async def _end_trace(ctx):
+    perf.end()
 
 
-@bot.command(name='ping', help='Check for bot liveness and latency. (ms)')
+@commands.command(name='ping', help='Check for bot liveness and latency. (ms)')
 async def ping(ctx):
-    await ctx.send(f'Pong! {round(bot.latency * 1000)}ms')
+    await ctx.send(f'Pong! {round(ctx.bot.latency * 1000)}ms')
 
 
-@bot.command(name='meme', help='Create an image based on a GPT generated prompt takes suggestions. monthly limit')
+@commands.command(name='meme', help='Create an image based on a GPT generated prompt takes suggestions. monthly limit')
 async def meme(ctx, *, prompt=None):
+    status = _status_message(ctx)
     if prompt:
-        await ctx.send(f"Generating meme prompt based on: {prompt}")
+        await status.update(f"Generating meme prompt based on: {prompt}")
     else:
-        await ctx.send(f"Generating meme prompt based on GPTs wildest imagination.")
+        await status.update(f"Generating meme prompt based on GPTs wildest imagination.")
     gpt_prompt = await get_meme_prompt(prompt)
-    await ctx.send(f"Generated prompt: {gpt_prompt}")
-    if await do_the_art(ctx, gpt_prompt, "meme", IMAGE_MODEL):
-        data = load_data()
-        if 'memes' not in data:
-            data['memes'] = 0
-        data['memes'] += 1
-        save_data(data)
-
-
-async def _prep_generation_size(ctx, raw):
-    """Parse --square/--landscape/--portrait/--res out of a generation command's raw
-    prompt text. Called FIRST, before macro expansion or magic paint, so the flags
-    never reach the image prompt.
-
-    Returns (cleaned_prompt, size) on success. Returns (None, None) after already
-    sending the user an error message, for two failure cases: an invalid --res value,
-    or nothing left to paint once the flags are stripped out. Along the way it may
-    also send an informational (non-error) message: a note when --res overrides an
-    orientation flag given in the same command, and a coercion notice when the
-    resolved size differs from what was literally requested (silent otherwise --
-    orientation presets and an already-valid --res never trigger this notice).
+    status.note(f"Generated prompt: {gpt_prompt}")
+    if await do_the_art(ctx, gpt_prompt, "meme", IMAGE_MODEL, status=status):
+        counters.increment('memes')
+
+
+async def _parse_count(ctx, text):
+    """Strip --n out of a paint/remix command's text. Returns (text, n), or
+    (None, None) after telling the user their --n value isn't one we take."""
+    text, count_raw = image_size.parse_count_flag(text)
+    if count_raw is None:
+        return text, 1
+    try:
+        return text, image_size.parse_count(count_raw)
+    except ValueError:
+        await ctx.send(
+            f"`--n {count_raw}` isn't a number of paintings I can do — use 1 to "
+            f"{image_size.MAX_COUNT}, e.g. `--n 4`."
+        )
+        return None, None
+
+
+async def _prep_generation_size(ctx, raw, status):
+    """Parse --square/--landscape/--portrait/--res and --n out of a generation
+    command's raw prompt text. Called FIRST, before macro expansion or magic paint,
+    so the flags never reach the image prompt.
+
+    Returns (cleaned_prompt, size, n) on success. Returns (None, None, None) after
+    already sending the user an error message, for three failure cases: an invalid
+    --res or --n value, or nothing left to paint once the flags are stripped out.
+    Along the way it may also note informational (non-error) lines on `status`: a
+    note when --res overrides an orientation flag given in the same command, and a
+    coercion notice when the resolved size differs from what was literally requested
+    (silent otherwise -- orientation presets and an already-valid --res never
+    trigger this notice).
     """
-    text, orientation, res_raw = image_size.parse_size_flags(raw)
+    t0 = time.monotonic()
+    text, n = await _parse_count(ctx, raw)
+    if text is None:
+        return None, None, None
+    text, orientation, res_raw = image_size.parse_size_flags(text)
 
     res_wh = None
     if res_raw is not None:
@@ -300,93 +560,110 @@ async def _prep_generation_size(ctx, raw):
                 f"`--res {res_raw}` isn't a size I understand — use `WIDTHxHEIGHT`, "
                 f"e.g. `--res 1920x1080`."
             )
-            return None, None
+            return None, None, None
 
     prompt = text.strip()
     if not prompt:
         await ctx.send("...I need something to paint besides the size flags.")
-        return None, None
+        return None, None, None
 
     size, requested = image_size.resolve_generation_size(orientation, res_wh)
+    _note_size(status, orientation, res_wh, size, requested)
+    perf.record("flags", time.monotonic() - t0)
+    return prompt, size, n
+
+
+def _note_size(status, orientation, res_wh, size, requested):
+    """Note on `status` when --res overrode an orientation flag, or the size was
+    coerced from the one asked for."""
     if res_wh and orientation:
-        await ctx.send(f"(`--res` overrides `--{orientation}`)")
+        status.note(f"(`--res` overrides `--{orientation}`)")
     if requested and requested != size:
-        await ctx.send(f"Using `{size}` (adjusted from `{requested}` to fit the size limits).")
-
-    return prompt, size
+        status.note(f"Using `{size}` (adjusted from `{requested}` to fit the size limits).")
 
 
-@bot.command(name='paint', help='Paint a picture based on a prompt. Flags: --landscape/--portrait/--square, --res WxH. monthly limit')
+@commands.command(name='paint', help='Paint a picture based on a prompt. Flags: --landscape/--portrait/--square, --res WxH, --n N (up to 4 paintings, each counts toward the limit). monthly limit')
 async def paint(ctx, *, prompt):
-    prompt, size = await _prep_generation_size(ctx, prompt)
+    status = _status_message(ctx)
+    prompt, size, n = await _prep_generation_size(ctx, prompt, status)
     if prompt is None:
         return
-    prompt = await expand_prompt_macros(ctx, prompt)
+    prompt = expand_prompt_macros(status, prompt)
     prompt, magic = maybe_apply_magic_paint(prompt)
-    await send_quote(ctx, magic)
-    await do_the_art(ctx, prompt, "paint", IMAGE_MODEL, size=size)
+    note_quote(status, magic)
+    await do_the_art(ctx, prompt, "paint", IMAGE_MODEL, size=size, n=n, status=status)
 
 
-@bot.command(name='hpaint', help='Paint a high quality picture with gpt-image-2. Flags: --landscape/--portrait/--square, --res WxH. monthly limit')
+@commands.command(name='hpaint', help='Paint a high quality picture with gpt-image-2. Flags: --landscape/--portrait/--square, --res WxH, --n N (up to 4 paintings, each counts toward the limit). monthly limit')
 async def hpaint(ctx, *, prompt):
-    prompt, size = await _prep_generation_size(ctx, prompt)
+    status = _status_message(ctx)
+    prompt, size, n = await _prep_generation_size(ctx, prompt, status)
     if prompt is None:
         return
-    prompt = await expand_prompt_macros(ctx, prompt)
-    await ctx.send(get_random_bob_ross_quote())
-    await do_the_art(ctx, prompt, "hpaint", "gpt-image-2", size=size)
+    prompt = expand_prompt_macros(status, prompt)
+    status.note(get_random_bob_ross_quote())
+    await do_the_art(ctx, prompt, "hpaint", "gpt-image-2", size=size, n=n, status=status)
 
 
-@bot.command(name='mpaint', help='Paint a medium quality picture with gpt-image-2. Flags: --landscape/--portrait/--square, --res WxH. monthly limit')
+@commands.command(name='mpaint', help='Paint a medium quality picture with gpt-image-2. Flags: --landscape/--portrait/--square, --res WxH, --n N (up to 4 paintings, each counts toward the limit). monthly limit')
 async def mpaint(ctx, *, prompt):
-    prompt, size = await _prep_generation_size(ctx, prompt)
+    status = _status_message(ctx)
+    prompt, size, n = await _prep_generation_size(ctx, prompt, status)
     if prompt is None:
         return
-    prompt = await expand_prompt_macros(ctx, prompt)
-    await ctx.send(get_random_bob_ross_quote())
-    await do_the_art(ctx, prompt, "mpaint", "gpt-image-2-medium", size=size)
+    prompt = expand_prompt_macros(status, prompt)
+    status.note(get_random_bob_ross_quote())
+    await do_the_art(ctx, prompt, "mpaint", "gpt-image-2-medium", size=size, n=n, status=status)
 
 
-@bot.command(name='lpaint', help='Paint a low quality picture with gpt-image-2. Flags: --landscape/--portrait/--square, --res WxH. monthly limit')
+@commands.command(name='lpaint', help='Paint a low quality picture with gpt-image-2. Flags: --landscape/--portrait/--square, --res WxH, --n N (up to 4 paintings, each counts toward the limit). monthly limit')
 async def lpaint(ctx, *, prompt):
-    prompt, size = await _prep_generation_size(ctx, prompt)
+    status = _status_message(ctx)
+    prompt, size, n = await _prep_generation_size(ctx, prompt, status)
     if prompt is None:
         return
-    prompt = await expand_prompt_macros(ctx, prompt)
-    await ctx.send(get_random_bob_ross_quote())
-    await do_the_art(ctx, prompt, "lpaint", "gpt-image-2-low", size=size)
+    prompt = expand_prompt_macros(status, prompt)
+    status.note(get_random_bob_ross_quote())
+    await do_the_art(ctx, prompt, "lpaint", "gpt-image-2-low", size=size, n=n, status=status)
 
 
-@bot.command(name='dpaint', help='Paint with DALL-E 3. monthly limit')
+@commands.command(name='dpaint', help='Paint with DALL-E 3. monthly limit')
 async def dpaint(ctx, *, prompt):
-    prompt = await expand_prompt_macros(ctx, prompt)
-    await ctx.send(get_random_bob_ross_quote())
-    await do_the_art(ctx, prompt, "dpaint", "dall-e-3")
+    status = _status_message(ctx)
+    prompt = expand_prompt_macros(status, prompt)
+    status.note(get_random_bob_ross_quote())
+    await do_the_art(ctx, prompt, "dpaint", "dall-e-3", status=status)
 
 
 # Hidden always-on variant of &paint. Named xpaint (not mpaint) since &mpaint is
 # already the medium-quality command. Not listed in help; the addition is never revealed.
-@bot.command(name='xpaint', help='Paint a picture, with a little extra magic. Flags: --landscape/--portrait/--square, --res WxH.', hidden=True)
+@commands.command(name='xpaint', help='Paint a picture, with a little extra magic. Flags: --landscape/--portrait/--square, --res WxH, --n N.', hidden=True)
 async def xpaint(ctx, *, prompt):
-    prompt, size = await _prep_generation_size(ctx, prompt)
+    status = _status_message(ctx)
+    prompt, size, n = await _prep_generation_size(ctx, prompt, status)
     if prompt is None:
         return
-    prompt = await expand_prompt_macros(ctx, prompt)
+    prompt = expand_prompt_macros(status, prompt)
     magic_prompt = _apply_random_magic_entry(prompt)
-    await send_quote(ctx, magic=True)
-    await do_the_art(ctx, magic_prompt, "xpaint", IMAGE_MODEL, size=size)
+    note_quote(status, magic=True)
+    await do_the_art(ctx, magic_prompt, "xpaint", IMAGE_MODEL, size=size, n=n, status=status)
 
 
-@bot.command(name='remix', help='Remix an image with a prompt. Attach an image, reply to one, or do both — and add a prompt to guide the transformation. Flags: --landscape/--portrait/--square, --res WxH (coerced to a valid size, same as &paint). Falls back to painting if no image is found. Monthly limit applies.')
+@commands.command(name='remix', help='Remix an image with a prompt. Attach an image, reply to one, or do both — and add a prompt to guide the transformation. Flags: --landscape/--portrait/--square, --res WxH (coerced to a valid size, same as &paint), --n N (up to 4 remixes). Falls back to painting if no image is found. Monthly limit applies.')
 async def remix(ctx, *, prompt=None):
     # Flags are parsed FIRST, before macro expansion/magic paint, exactly like the
     # generation commands' _prep_generation_size -- but remix doesn't use that shared
     # helper because its size resolution differs by which path it ends up on below
     # (edit vs. generation-fallback) and it must still work when there's no prompt at
     # all (image-only remix).
-    orientation, res_wh = None, None
+    status = _status_message(ctx)
+    orientation, res_wh, n = None, None, 1
+    t0 = time.monotonic()
     if prompt:
-        text, orientation, res_raw = image_size.parse_size_flags(prompt)
+        text, n = await _parse_count(ctx, prompt)
+        if text is None:
+            return
+        text, orientation, res_raw = image_size.parse_size_flags(text)
         if res_raw is not None:
             try:
                 res_wh = image_size.parse_resolution(res_raw)
@@ -400,11 +677,12 @@ async def remix(ctx, *, prompt=None):
         # attached image) -- fall back to None so the default "reinterpret this
         # image" path below still runs, while the parsed size flags are still honored.
         prompt = text.strip() or None
+    perf.record("flags", time.monotonic() - t0)
 
     attachments = [a for a in ctx.message.attachments if (a.content_type or "").startswith("image/")]
     skipped = len(ctx.message.attachments) - len(attachments)
     if skipped:
-        await ctx.send(f"Skipping {skipped} attachment(s) that aren't images.")
+        status.note(f"Skipping {skipped} attachment(s) that aren't images.")
 
     if ctx.message.reference:
         try:
@@ -417,48 +695,68 @@ async def remix(ctx, *, prompt=None):
 
     if not attachments:
         if not prompt:
-            await ctx.send("We need a happy little image to work with before we can remix anything. Attach one, or reply to a message that has one!")
+            await status.finish("We need a happy little image to work with before we can remix anything. Attach one, or reply to a message that has one!")
             return
-        prompt = await expand_prompt_macros(ctx, prompt)
+        prompt = expand_prompt_macros(status, prompt)
         prompt, magic = maybe_apply_magic_paint(prompt)
         size, requested = image_size.resolve_generation_size(orientation, res_wh)
-        if res_wh and orientation:
-            await ctx.send(f"(`--res` overrides `--{orientation}`)")
-        if requested and requested != size:
-            await ctx.send(f"Using `{size}` (adjusted from `{requested}` to fit the size limits).")
-        await send_quote(ctx, magic)
-        await do_the_art(ctx, prompt, "remix", IMAGE_MODEL, size=size)
+        _note_size(status, orientation, res_wh, size, requested)
+        note_quote(status, magic)
+        await do_the_art(ctx, prompt, "remix", IMAGE_MODEL, size=size, n=n, status=status)
         return
 
     size, requested = image_size.resolve_edit_size(
         orientation, res_wh, attachments[0].width, attachments[0].height
     )
-    if res_wh and orientation:
-        await ctx.send(f"(`--res` overrides `--{orientation}`)")
-    if requested and requested != size:
-        await ctx.send(f"Using `{size}` (adjusted from `{requested}` to fit the size limits).")
+    _note_size(status, orientation, res_wh, size, requested)
     logger.info(
         f"Remix size: {attachments[0].width}x{attachments[0].height} -> {size} "
         f"({image_size.describe_edit_size(size)})"
     )
 
-    images = [(await a.read(), a.content_type) for a in attachments]
-    if prompt:
-        prompt = await expand_prompt_macros(ctx, prompt)
-        prompt, magic = maybe_apply_magic_paint(prompt)
-    else:
-        prompt = _apply_random_magic_entry("creatively reinterpret this image")
-        magic = True
-
-    await send_quote(ctx, magic)
-    await do_the_art(ctx, prompt, "remix", IMAGE_MODEL, images=images, size=size)
-
-
-@bot.command(name='release_image', help='Generate a deterministic release avatar from a git hash (or any text) — same input always yields the same prompt. Flags: --george, --vN. Monthly limit applies.')
+    # Every image downloads at once, streamed to a spool (temp file past 1 MiB) rather
+    # than read into memory, and is streamed from there into each edits attempt.
+    try:
+        with perf.stage("download"):
+            spooled = await spooled_attachments.fetch_attachments(
+                openai_api.session, [(a.url, a.content_type, a.size) for a in attachments]
+            )
+    except spooled_attachments.AttachmentTooLargeError as e:
+        await status.finish(f"That image is too big to remix — {e}. Try a smaller one!")
+        return
+    except aiohttp.ClientError as e:
+        await status.finish(f"Couldn't download the image to remix: {e}")
+        return
+    try:
+        if prompt:
+            prompt = expand_prompt_macros(status, prompt)
+            prompt, magic = maybe_apply_magic_paint(prompt)
+        else:
+            prompt = _apply_random_magic_entry("creatively reinterpret this image")
+            magic = True
+
+        note_quote(status, magic)
+        if image_preprocessor is not None:
+            with perf.stage("prep"):
+                before, after = await image_preprocessor.prepare(spooled, size)
+            logger.info(f"Remix inputs preprocessed: {before} -> {after} bytes")
+        images = [(image.file, image.content_type) for image in spooled]
+        await do_the_art(ctx, prompt, "remix", IMAGE_MODEL, images=images, size=size, n=n, status=status)
+    finally:
+        for image in spooled:
+            image.close()
+
+
+@commands.command(name='release_image', help='Generate a deterministic release avatar from a git hash (or any text) — same input always yields the same prompt. Flags: --george, --vN, --fresh (paint a new one instead of reusing the cached image), --batch (mint one per hash given, or per line of an attached .txt, as a gallery). Monthly limit applies to new paintings.')
 async def release_image_cmd(ctx, *, args=None):
-    if not args or not args.strip():
+    args, batch = release_batch.parse_batch_flag(args or "")
+    if batch:
+        await _release_image_batch(ctx, args)
+        return
+    if not args:
         await ctx.send("Give me a git hash or any text to immortalize as a release image...")
         return
+    args, fresh = image_cache.parse_fresh_flag(args)
     source, version, georgify = release_image.parse_release_args(args)
     if not source:
         await ctx.send("...I need something to hash besides the flags.")
@@ -466,17 +764,259 @@ async def release_image_cmd(ctx, *, args=None):
     try:
         prompt, seed, ver = release_image.build_release_prompt(source, version, georgify)
     except KeyError:
-        available = ", ".join(sorted(release_image.RELEASE_ALGORITHMS, key=lambda v: int(v)))
+        available = ", ".join(release_image.release_versions())
         await ctx.send(f"Unknown algorithm version. Available: {available}")
         return
-    # Release images are deliberately NOT subject to magic paint, so send a plain quote.
-    await send_quote(ctx)
+    # Release images are deliberately NOT subject to magic paint, so note a plain quote.
+    status = _status_message(ctx)
+    note_quote(status)
     george = " | 🥸 George mode" if georgify else ""
-    await ctx.send(f"Release image for `{source}` | seed {seed} | algo v{ver}{george}\n**Prompt**: {prompt}")
-    await do_the_art(ctx, prompt, "release_image", IMAGE_MODEL)
+    status.note(f"Release image for `{source}` | seed {seed} | algo v{ver}{george}\n**Prompt**: {prompt}")
+    # The prompt is a pure function of the args, so an identical request is served
+    # from the image cache (--fresh paints a new one), or shares the call if the
+    # same one is still being painted.
+    await do_the_art(ctx, prompt, "release_image", IMAGE_MODEL, cache=True, fresh=fresh, dedupe=True,
+                     status=status)
+
+
+async def _release_image_batch(ctx, args):
+    """&release_image --batch: one avatar per hash in `args` and in any attached hash
+    list, painted concurrently and posted as a gallery (see release_batch.py)."""
+    args, fresh = image_cache.parse_fresh_flag(args)
+    words, version, georgify = release_image.parse_release_args(args)
+    sources = words.split()
+    for attachment in ctx.message.attachments:
+        if not release_batch.is_hash_list(attachment.filename, attachment.content_type):
+            continue
+        if attachment.size > release_batch.MAX_FILE_BYTES:
+            await ctx.send(f"`{attachment.filename}` is too big for a hash list "
+                           f"(up to {release_batch.MAX_FILE_BYTES // 1024} KB).")
+            return
+        try:
+            data = await attachment.read()
+        except discord.HTTPException as e:
+            await ctx.send(f"Couldn't read `{attachment.filename}`: {e}")
+            return
+        sources += release_batch.sources_from_file(data.decode("utf-8", errors="replace"))
+    if not sources:
+        await ctx.send("Give me the hashes to mint, e.g. `&release_image --batch 1a2b3c 4d5e6f`, "
+                       "or attach a .txt with one per line.")
+        return
+    if len(sources) > release_batch.MAX_SOURCES:
+        await ctx.send(f"That's {len(sources)} inputs; a batch takes up to {release_batch.MAX_SOURCES}.")
+        return
+    try:
+        built = release_image.build_release_prompts(sources, version, georgify)
+    except KeyError:
+        available = ", ".join(release_image.release_versions())
+        await ctx.send(f"Unknown algorithm version. Available: {available}")
+        return
+    entries = release_batch.group_by_prompt(sources, built)
+    trace = perf.current()
+    if trace is not None:
+        trace.set_model(IMAGE_MODEL)
+
+    cached, to_paint = {}, []
+    for entry in entries:
+        hit = None
+        if image_store is not None and not fresh:
+            hit = image_store.get(_image_cache_key(entry.prompt, IMAGE_MODEL, None))
+        if hit is not None:
+            cached[id(entry)] = hit
+        else:
+            to_paint.append(entry)
+    remaining = monthly_quota.remaining()
+    if len(to_paint) > remaining:
+        for hit in cached.values():
+            hit.file.close()
+        await ctx.send(f"Painting {len(to_paint)} release images takes {len(to_paint)} paint requests, and there "
+                       f"are only {remaining} left this month.")
+        return
+
+    # Release images are deliberately NOT subject to magic paint, so note a plain quote.
+    status = _status_message(ctx)
+    note_quote(status)
+    logger.info(f"Received release_image batch from {ctx.author.name}: {len(sources)} inputs, "
+                f"{len(entries)} prompts, {len(to_paint)} to paint")
+    duplicates = len(sources) - len(entries)
+    folded = f" ({duplicates} duplicates folded in)" if duplicates else ""
+    george = " | 🥸 George mode" if georgify else ""
+    status.note(f"Release batch: {len(sources)} inputs, {len(entries)} images{folded} | "
+                f"{len(cached)} from the cache, {len(to_paint)} to paint | algo v{entries[0].version}{george}")
+    painted = 0
+
+    async def render(entry):
+        nonlocal painted
 
+        async def produce():
+            return await _generate_reserved(ctx, None, entry.prompt, IMAGE_MODEL, None, None)
 
-@bot.command(name='magic_list', help='List the magic mixin ids and authors. Use &magic_show to read a prompt, &magic_update to change it.')
+        # An identical &release_image already painting serves this entry too.
+        flight_key = _image_request(entry.prompt, IMAGE_MODEL, None)
+        waiter = generation_flights.follow(flight_key)
+        if waiter is not None:
+            painting, shared = await waiter, True
+        else:
+            painting, shared = await generation_flights.run(flight_key, produce, share=_share_painting), False
+        painted += 1
+        status.update_soon(f"Painted {painted} of {len(to_paint)}…")
+        return painting, shared
+
+    t0 = time.monotonic()
+    if to_paint:
+        await status.update(f"Painting {len(to_paint)} release images…")
+    outcomes = await release_batch.fan_out_bounded(to_paint, render, generation_queue.workers)
+    wall = time.monotonic() - t0
+    results = {id(outcome.name): outcome for outcome in outcomes}
+    try:
+        await _send_release_gallery(ctx, status, entries, cached, results, wall)
+    finally:
+        for hit in cached.values():
+            hit.file.close()
+        for outcome in outcomes:
+            if outcome.ok:
+                for image_file in outcome.result[0][0]['images']:
+                    image_file.close()
+
+
+async def _send_release_gallery(ctx, status, entries, cached, results, wall):
+    """Post a release batch as a gallery: every entry's image in the order given,
+    DISCORD_MAX_FILES (or the server's upload limit) to a page, each page captioned
+    with its numbered inputs and seeds. The first page finishes `status`; inputs that
+    got no image are listed after the last. Stores new paintings in the image cache
+    and counts them in &stats."""
+    lines, failures, files = {}, [], []
+    new_paintings, shared = 0, 0
+    for number, entry in enumerate(entries, 1):
+        if id(entry) in cached:
+            image_file, note = cached[id(entry)].file, "from the cache"
+        else:
+            outcome = results[id(entry)]
+            if not outcome.ok:
+                if isinstance(outcome.error, openai_client.ImageAPIError):
+                    _record_image_error(outcome.error)
+                failures.append(release_batch.caption(number, entry, _describe_failure(outcome.error)))
+                continue
+            (response, elapsed, _), was_shared = outcome.result
+            image_file, note = response['images'][0], format_duration(elapsed)
+            if was_shared:
+                shared += 1
+                note += ", shared"
+            else:
+                new_paintings += 1
+                if image_store is not None:
+                    await asyncio.to_thread(image_store.put, _image_cache_key(entry.prompt, IMAGE_MODEL, None),
+                                            image_file, response['revised_prompt'],
+                                            {"prompt": entry.prompt, "model": IMAGE_MODEL, "size": None})
+        lines[id(image_file)] = release_batch.caption(number, entry, note)
+        files.append((image_file, f"{number:03d}_{entry.seeds[0]}_v{entry.version}.png", entry.prompt[:1024]))
+
+    header = (f"Minted {len(files)} of {len(entries)} release images in {format_duration(wall)} | "
+              f"Monthly requests: {monthly_quota.used()}")
+    max_bytes = ctx.guild.filesize_limit if ctx.guild else discord.utils.DEFAULT_FILE_SIZE_LIMIT_BYTES
+    pages = image_stream.upload_batches([image_file for image_file, _, _ in files], max_bytes, DISCORD_MAX_FILES)
+    details = {id(image_file): (file_name, description) for image_file, file_name, description in files}
+    with perf.stage("upload"):
+        for number, page in enumerate(pages or [[]], 1):
+            content = "\n".join([f"**Page {number}/{max(len(pages), 1)}**"] +
+                                [lines[id(image_file)] for image_file in page])
+            page_files = [discord.File(image_file, details[id(image_file)][0],
+                                       description=details[id(image_file)][1]) for image_file in page]
+            if number == 1:
+                await status.finish(f"{header}\n{content}", page_files)
+            else:
+                await ctx.send(content, files=page_files)
+    if failures:
+        await send_long(ctx, "No image for:\n" + "\n".join(failures))
+    for key, count in (('release_images', new_paintings), ('shared_paintings', shared), ('cache_hits', len(cached))):
+        if count:
+            counters.increment(key, count)
+
+
+@commands.command(name='compare', help='Paint one prompt with several models at once and post them side by side with how long each took. Flag: --models high,dalle,medium,low (default: all four). Each model counts toward the monthly limit.')
+async def compare_cmd(ctx, *, prompt=None):
+    if not prompt or not prompt.strip():
+        await ctx.send("Give me a prompt to paint with every model, e.g. `&compare a quiet cabin --models high,low`.")
+        return
+    choices = {**{name: name for name in MODEL_CONFIGS}, **COMPARE_CHOICES}
+    try:
+        with perf.stage("flags"):
+            prompt, models = compare.parse_compare_args(prompt, choices)
+    except ValueError as e:
+        await ctx.send(f"{e} — choose from {', '.join(COMPARE_CHOICES)}.")
+        return
+    if not prompt:
+        await ctx.send("...I need something to paint besides the flags.")
+        return
+    models = models or list(COMPARE_CHOICES.values())
+    remaining = monthly_quota.remaining()
+    if remaining < len(models):
+        await ctx.send(f"Comparing {len(models)} models takes {len(models)} paint requests, and there are only "
+                       f"{remaining} left this month.")
+        return
+    # One macro expansion and one magic roll, so every model paints the same prompt.
+    status = _status_message(ctx)
+    prompt = expand_prompt_macros(status, prompt)
+    prompt, magic = maybe_apply_magic_paint(prompt)
+    note_quote(status, magic)
+    logger.info(f"Received compare request from {ctx.author.name} using {', '.join(models)} to paint: {prompt}")
+
+    async def render(model):
+        return await _generate_reserved(ctx, status, prompt, model, None, None)
+
+    t0 = time.monotonic()
+    outcomes = await compare.fan_out(models, render)
+    wall = time.monotonic() - t0
+    try:
+        await _send_comparison(ctx, status, prompt, outcomes, wall)
+    finally:
+        for outcome in outcomes:
+            if outcome.ok:
+                for image_file in outcome.result[0]['images']:
+                    image_file.close()
+    if any(outcome.ok for outcome in outcomes):
+        counters.increment('comparisons')
+
+
+async def _send_comparison(ctx, status, prompt, outcomes, wall):
+    """Finish a comparison's status message as one gallery: every model's image,
+    numbered and labelled in the message with the time that model took, or why it
+    failed."""
+    lines, paintings, revised = [], [], []
+    for number, outcome in enumerate(outcomes, 1):
+        label = compare.model_label(MODEL_CONFIGS[outcome.name])
+        if not outcome.ok:
+            if isinstance(outcome.error, openai_client.ImageAPIError):
+                _record_image_error(outcome.error)
+            lines.append(f"{number}. **{label}** — failed: {_describe_failure(outcome.error)}")
+            continue
+        response, elapsed, _ = outcome.result
+        lines.append(f"{number}. **{label}** — {format_duration(elapsed)}")
+        file_name = f"{number}_{re.sub(r'[^0-9a-zA-Z]', '_', label)}_{generate_file_name(prompt)}"
+        description = f"{label}: {response['revised_prompt'] or prompt}"[:1024]
+        paintings.append((response['images'][0], file_name, description))
+        if response['revised_prompt']:
+            revised.append(f"**Revised prompt** ({label}): {response['revised_prompt']}")
+    slowest = max(outcome.seconds for outcome in outcomes)
+    header = (f"Compared {len(outcomes)} models in {format_duration(wall)} "
+              f"(slowest {format_duration(slowest)}) | Monthly requests: {monthly_quota.used()}")
+    content = "\n".join([header] + lines)
+    with perf.stage("upload"):
+        await _upload_paintings(ctx, status, paintings, content)
+    for text in revised:
+        await send_long(ctx, text)
+
+
+def _describe_failure(error):
+    """A user-facing reason one generation in a multi-model request failed."""
+    if isinstance(error, quota.QuotaExceededError):
+        return "monthly limit reached"
+    if isinstance(error, job_queue.QueueFullError):
+        return "the easel is full"
+    return str(error)
+
+
+@commands.command(name='magic_list', help='List the magic mixin ids and authors. Use &magic_show to read a prompt, &magic_update to change it.')
 async def magic_list(ctx):
     entries = _load_magic_library()
     if not entries:
@@ -488,7 +1028,7 @@ async def magic_list(ctx):
     await send_long(ctx, "\n".join(lines))
 
 
-@bot.command(name='magic_show', help='Show the full text of a magic mixin by id (see &magic_list).')
+@commands.command(name='magic_show', help='Show the full text of a magic mixin by id (see &magic_list).')
 async def magic_show(ctx, entry_id=None):
     if not entry_id:
         await ctx.send("Which one? `&magic_show <id>` — see `&magic_list` for ids.")
@@ -507,7 +1047,7 @@ async def magic_show(ctx, entry_id=None):
     await send_long(ctx, "\n".join(lines))
 
 
-@bot.command(name='magic_update', help="Update a magic mixin's text in place by id (see &magic_list). Records you as editor.")
+@commands.command(name='magic_update', help="Update a magic mixin's text in place by id (see &magic_list). Records you as editor.")
 async def magic_update(ctx, entry_id=None, *, text=None):
     if not entry_id or not text or not text.strip():
         await ctx.send("Usage: `&magic_update <id> <new text>` — see `&magic_list` for ids.")
@@ -525,7 +1065,7 @@ async def magic_update(ctx, entry_id=None, *, text=None):
     await ctx.send(f"Updated magic mixin `{entry_id}`.")
 
 
-@bot.command(name='magic_add', help='Add a magic mixin. The text is appended to prompts when magic fires.')
+@commands.command(name='magic_add', help='Add a magic mixin. The text is appended to prompts when magic fires.')
 async def magic_add(ctx, *, text=None):
     if not text or not text.strip():
         await ctx.send("Give me some happy little text to add, like `&magic_add In the background, a squirrel juggles acorns.`")
@@ -544,7 +1084,7 @@ async def magic_add(ctx, *, text=None):
     await ctx.send(f"Added magic mixin `{new_id}`. Remove it with `&magic_remove {new_id}`.")
 
 
-@bot.command(name='magic_remove', help='Remove a magic mixin by id (see &magic_list).')
+@commands.command(name='magic_remove', help='Remove a magic mixin by id (see &magic_list).')
 async def magic_remove(ctx, entry_id=None):
     if not entry_id:
         await ctx.send("Which one? `&magic_remove <id>` — see `&magic_list` for ids.")
@@ -559,12 +1099,11 @@ async def magic_remove(ctx, entry_id=None):
     await ctx.send(f"Removed magic mixin `{entry_id}`.{note}")
 
 
-@bot.command(name='magic_rate', help='Show or set the magic paint rate. e.g. &magic_rate, &magic_rate 10, &magic_rate .1, &magic_rate 10%, &magic_rate .1%')
+@commands.command(name='magic_rate', help='Show or set the magic paint rate. e.g. &magic_rate, &magic_rate 10, &magic_rate .1, &magic_rate 10%, &magic_rate .1%')
 async def magic_rate(ctx, value=None):
     global MAGIC_PAINT_RATE
     if value is None:
-        data = load_data()
-        history = data.get('magic_rate_history', [])
+        history = counters.get('magic_rate_history', [])
         msg = f"Magic rate: {format_magic_rate(MAGIC_PAINT_RATE)}"
         if history:
             last = history[-1]
@@ -588,7 +1127,7 @@ async def magic_rate(ctx, value=None):
     await ctx.send(f"Magic rate set to {format_magic_rate(rate)}.")
 
 
-@bot.command(name='macro_list', help='List the ;macro ids and authors. Use &macro_show to read one, &macro_update to change it.')
+@commands.command(name='macro_list', help='List the ;macro ids and authors. Use &macro_show to read one, &macro_update to change it.')
 async def macro_list(ctx):
     entries = _load_macro_library()
     if not entries:
@@ -604,7 +1143,7 @@ async def macro_list(ctx):
     await send_long(ctx, "\n".join(lines))
 
 
-@bot.command(name='macro_show', help='Show the full text of a ;macro by id (see &macro_list).')
+@commands.command(name='macro_show', help='Show the full text of a ;macro by id (see &macro_list).')
 async def macro_show(ctx, entry_id=None):
     if not entry_id:
         await ctx.send("Which one? `&macro_show <id>` — see `&macro_list` for ids.")
@@ -624,7 +1163,7 @@ async def macro_show(ctx, entry_id=None):
     await send_long(ctx, "\n".join(lines))
 
 
-@bot.command(name='macro_add', help='Add a ;macro. &macro_add <id> <text> — the id is what you type as ;<id> in a prompt.')
+@commands.command(name='macro_add', help='Add a ;macro. &macro_add <id> <text> — the id is what you type as ;<id> in a prompt.')
 async def macro_add(ctx, macro_id=None, *, text=None):
     if not macro_id or not text or not text.strip():
         await ctx.send("Usage: `&macro_add <id> <text>`, e.g. `&macro_add lasso a cowboy twirling a glowing lasso,`")
@@ -648,7 +1187,7 @@ async def macro_add(ctx, macro_id=None, *, text=None):
     await ctx.send(f"Added macro `;{normalized_id}`. Remove it with `&macro_remove {normalized_id}`.")
 
 
-@bot.command(name='macro_update', help="Update a ;macro's text in place by id (see &macro_list). Records you as editor.")
+@commands.command(name='macro_update', help="Update a ;macro's text in place by id (see &macro_list). Records you as editor.")
 async def macro_update(ctx, entry_id=None, *, text=None):
     if not entry_id or not text or not text.strip():
         await ctx.send("Usage: `&macro_update <id> <new text>` — see `&macro_list` for ids.")
@@ -667,7 +1206,7 @@ async def macro_update(ctx, entry_id=None, *, text=None):
     await ctx.send(f"Updated macro `;{normalized_id}`.")
 
 
-@bot.command(name='macro_remove', help='Remove a ;macro by id (see &macro_list).')
+@commands.command(name='macro_remove', help='Remove a ;macro by id (see &macro_list).')
 async def macro_remove(ctx, entry_id=None):
     if not entry_id:
         await ctx.send("Which one? `&macro_remove <id>` — see `&macro_list` for ids.")
@@ -683,170 +1222,295 @@ async def macro_remove(ctx, entry_id=None):
     await ctx.send(f"Removed macro `;{normalized_id}`.{note}")
 
 
-async def do_the_art(ctx, prompt, request_type, model, images=None, size=None):
+async def do_the_art(ctx, prompt, request_type, model, images=None, size=None, cache=False, fresh=False,
+                     dedupe=False, n=1, status=None):
     # `size` (see image_size.py) is now forwarded on BOTH paths below: fetch_image_edit
     # (images given -- &remix with an attachment) and fetch_image (generation --
     # &paint/&hpaint/&mpaint/&lpaint/&xpaint honoring --res/--landscape/--portrait/
     # --square). None keeps each path's own model-config default size.
     # &dpaint/&meme/&release_image never pass size, so they stay unaffected.
+    # `cache` opts a generation into the image cache (deterministic prompts only --
+    # &release_image); `fresh` skips the lookup but still stores the new image.
+    # `dedupe` lets an identical generation already in flight serve this one too: one
+    # API call and one monthly slot, and everyone who asked gets the image.
+    # `n` (--n) asks for that many images in the one API call, each a monthly slot of
+    # its own. Batches bypass the cache and dedupe, which deal in single images.
+    # `status` is the request's status message (see status_message.py), holding the
+    # command's notes so far; the stages are edited into it and it finishes as the
+    # painting and its summary. A single generation streams partial images into it
+    # as previews (see preview.py) when PREVIEW_PARTIALS is on.
     logger.info(f"Received {request_type} request from {ctx.author.name} using {model} to paint: {prompt}")
-    current_month = get_current_month()
-    data = load_data()
-    if over_limit(data):
-        await ctx.send("Monthly limit reached. Please wait until next month to make more paint requests.")
-        return False
-
-    file_name = generate_file_name(prompt)
-
+    status = status or _status_message(ctx)
+    trace = perf.current()
+    if trace is not None:
+        trace.set_model(model)
+    config = MODEL_CONFIGS.get(get_edit_model(model) if images else model, MODEL_CONFIGS["gpt-image-2"])
+    if n > 1 and not config.get("supports_batch"):
+        status.note(f"{config['model']} only paints one at a time, so you'll get a single painting.")
+        n = 1
+    cache_key = None
+    if cache and image_store is not None and not images and n == 1:
+        cache_key = _image_cache_key(prompt, model, size)
+        if not fresh:
+            hit = image_store.get(cache_key)
+            if hit is not None:
+                await _send_cached(status, prompt, hit)
+                return True
+
+    throttle = None
+    if PREVIEW_PARTIALS and n == 1 and not images and config.get("supports_streaming"):
+        throttle = preview.PreviewThrottle(_preview_publisher(status))
+
+    async def produce():
+        return await _generate_reserved(ctx, status, prompt, model, images, size, n,
+                                        on_partial=throttle.offer if throttle else None)
+
+    shared = False
     try:
-        t0 = time.monotonic()
-        if images:
-            response = await fetch_image_edit(prompt, get_edit_model(model), images, size=size)
+        if dedupe and not images and n == 1:
+            flight_key = _image_request(prompt, model, size)
+            waiter = generation_flights.follow(flight_key)
+            if waiter is not None:
+                shared = True
+                await status.update("That exact painting is already on the easel — you'll get a copy, no extra request needed.")
+                painting = await waiter
+            else:
+                painting = await generation_flights.run(flight_key, produce, share=_share_painting)
         else:
-            response = await fetch_image(prompt, model, size=size)
-        elapsed = time.monotonic() - t0
-        image_data = base64.b64decode(response['image'])
-        image_file = io.BytesIO(image_data)
+            painting = await produce()
+        if throttle is not None:
+            await throttle.close()
+        response, elapsed, monthly_requests = painting
         description = (response['revised_prompt'] or prompt)[:1024]
-        await ctx.send(file=discord.File(image_file, file_name, description=description))
+        image_files = response['images']
+        summary = []
         if response['revised_prompt']:
-            await ctx.send(f"**Revised prompt**: {response['revised_prompt']}")
-        # reload the data for the increment since we are async
-        data = load_data()
-        if current_month not in data:
-            data[current_month] = 0
-        data[current_month] += 1
+            summary.append(f"**Revised prompt**: {response['revised_prompt']}")
+        if shared:
+            summary.append(f"Shared painting, generated in {format_duration(elapsed)} | "
+                           f"Monthly requests: {monthly_requests}")
+        else:
+            painted = f"Generated {len(image_files)} paintings" if len(image_files) > 1 else "Generated"
+            summary.append(f"{painted} in {format_duration(elapsed)} | Monthly requests: {monthly_requests}")
+        try:
+            if cache_key is not None and not shared:
+                await asyncio.to_thread(image_store.put, cache_key, image_files[0], response['revised_prompt'],
+                                        {"prompt": prompt, "model": model, "size": size})
+            paintings = [(image_file, generate_file_name(prompt), description) for image_file in image_files]
+            with perf.stage("upload"):
+                await _upload_paintings(ctx, status, paintings, "\n".join(summary))
+        finally:
+            for image_file in image_files:
+                image_file.close()
+        if shared:
+            counters.increment('shared_paintings')
+            return True
         if request_type == "remix":
-            data['remixes'] = data.get('remixes', 0) + 1
+            counters.increment('remixes')
         if request_type == "release_image":
-            data['release_images'] = data.get('release_images', 0) + 1
-        save_data(data)
-        await ctx.send(f"Generated in {format_duration(elapsed)} | Monthly requests: {data[current_month]}")
+            counters.increment('release_images')
         return True
+    except quota.QuotaExceededError:
+        await _close_preview(throttle)
+        remaining = monthly_quota.remaining()
+        if n > 1 and remaining:
+            await status.finish(f"Only {remaining} paint requests left this month — try a smaller `--n`.")
+        else:
+            await status.finish("Monthly limit reached. Please wait until next month to make more paint requests.")
+        return False
+    except job_queue.QueueFullError:
+        await _close_preview(throttle)
+        await status.finish("The easel is full right now — too many paintings in line. Try again in a little bit.")
+        return False
     except Exception as e:
-        await ctx.send(f"No painting for: {prompt}, exception for this request: {e}")
+        await _close_preview(throttle)
+        # A shared failure was already counted by the request that made the call.
+        if isinstance(e, openai_client.ImageAPIError) and not shared:
+            _record_image_error(e)
+        await status.finish(f"No painting for: {prompt}, exception for this request: {e}")
         return False
 
 
-def get_edit_model(model):
+async def _generate_reserved(ctx, status, prompt, model, images, size, n=1, on_partial=None):
+    """Reserve `n` monthly slots, make one image call for `n` images through the
+    generation queue, and commit a slot per image as soon as OpenAI returns them
+    (they are paid for even if Discord then fails). The queue position and then
+    "Painting…" are shown on `status`, unless it's None (a batch shows its own
+    progress). `on_partial` receives streamed partial images
+    (generations only, see fetch_image). The quota, queue, API and decode stages are
+    timed under `model` (see perf.py). Returns (response, seconds taken, monthly
+    requests). Raises QuotaExceededError, QueueFullError or the API's error; any
+    failure -- including cancellation -- gives the slots back."""
+    with perf.stage("quota", model):
+        reservation = await monthly_quota.reserve(n)
+    try:
+        # The job runs on a queue worker, outside this command's context.
+        trace = perf.current()
+        submitted = time.monotonic()
+
+        async def generate():
+            if trace is not None:
+                trace.record("queue", time.monotonic() - submitted, model)
+            # Not awaited: a queue worker shouldn't wait on Discord.
+            if status is not None:
+                status.update_soon("Painting…")
+            t0 = time.monotonic()
+            if images:
+                response = await fetch_image_edit(prompt, get_edit_model(model), images, size=size, n=n)
+            else:
+                response = await fetch_image(prompt, model, size=size, n=n, on_partial=on_partial)
+            return response, time.monotonic() - t0
+
+        ticket = generation_queue.submit(ctx.author.id, generate)
+        if ticket.waits and status is not None:
+            wait = generation_queue.estimated_wait(ticket.position)
+            await status.update(f"Queued at position {ticket.position} (about {format_duration(wait)} wait).")
+        response, elapsed = await ticket.future
+        monthly_requests = reservation.commit(len(response['images']))
+    finally:
+        # No-op once committed.
+        reservation.release()
+    _record_retries(response['attempts'], response['backoff'])
+    for seconds in response['attempt_seconds']:
+        perf.record("api", seconds, model)
+    perf.record("decode", response['decode_seconds'], model)
+    return response, elapsed, monthly_requests
+
+
+def _share_painting(painting):
+    """A follower's copy of a single-flight result (see do_the_art's `dedupe`): the
+    same response with its own image files, since each caller uploads and closes them."""
+    response, elapsed, monthly_requests = painting
+    images = [image_stream.copy_image(image_file) for image_file in response['images']]
+    return dict(response, images=images), elapsed, monthly_requests
+
+
+async def _upload_paintings(ctx, status, paintings, content):
+    """Finish `status` with `content` and (image_file, file_name, description)
+    paintings -- already-decoded files (see image_stream.py), sent as-is with no
+    copy. Up to DISCORD_MAX_FILES attachments, within the server's upload size
+    limit, go in that one edit; any left over follow in as few messages as fit."""
+    details = {id(image_file): (file_name, description) for image_file, file_name, description in paintings}
+    max_bytes = ctx.guild.filesize_limit if ctx.guild else discord.utils.DEFAULT_FILE_SIZE_LIMIT_BYTES
+    batches = image_stream.upload_batches([painting[0] for painting in paintings], max_bytes, DISCORD_MAX_FILES)
+    for number, batch in enumerate(batches or [[]]):
+        files = [discord.File(image_file, details[id(image_file)][0], description=details[id(image_file)][1])
+                 for image_file in batch]
+        if number == 0:
+            await status.finish(content, files)
+        else:
+            await ctx.send(files=files)
+
+
+def _status_message(ctx):
+    """A StatusMessage (see status_message.py) for one request in ctx's channel."""
+    async def send(content, files):
+        if files:
+            return await ctx.send(content, files=files)
+        return await ctx.send(content)
+    return status_message.StatusMessage(send)
+
+
+def _preview_publisher(status):
+    """A PreviewThrottle publish callback showing each streamed partial image as
+    `status`'s attachment, shrunk to PREVIEW_BOX."""
+    async def publish(frame, index):
+        with frame:
+            data = frame.read()
+        data, ext = await asyncio.to_thread(_preview_image, data)
+        step = f" {index + 1}/{PREVIEW_PARTIALS}" if index is not None else ""
+        await status.update(f"Still painting… (preview{step})",
+                            file=discord.File(io.BytesIO(data), f"preview.{ext}"))
+    return publish
+
+
+def _preview_image(data):
+    """A partial frame shrunk to PREVIEW_BOX for the preview message, as (bytes,
+    extension); the frame as it is if Pillow isn't installed or can't shrink it."""
+    if image_prep.AVAILABLE:
+        try:
+            prepared = image_prep.prepare_image(data, PREVIEW_BOX)
+        except Exception as e:
+            logger.warning(f"Couldn't shrink a preview frame: {e}")
+            prepared = None
+        if prepared is not None:
+            data, content_type = prepared
+            return data, content_type.split("/")[-1]
+    return data, "png"
+
+
+async def _close_preview(throttle):
+    """Stop a painting's previews after a failure; the status message's final edit
+    then takes the last one down."""
+    if throttle is not None:
+        await throttle.close()
+
+
+def _image_request(prompt, model, size):
+    """(model, prompt, size, quality, moderation) exactly as fetch_image will send
+    them for `model`'s config, so equivalent requests compare equal."""
     config = MODEL_CONFIGS.get(model, MODEL_CONFIGS["gpt-image-2"])
-    return model if config.get("supports_edit") else "gpt-image-2"
+    params = config["params"]
+    moderation = openai_api.moderation if config["supports_moderation"] else None
+    return config["model"], prompt, size or params.get("size"), params.get("quality"), moderation
 
 
-async def _classify_image_error(response, prompt):
-    """Shared by fetch_image and fetch_image_edit. Returns ('retry'|'safety'|'stop', error_message)."""
-    error_json = await response.json()
-    error_message = error_json.get("error", {}).get("message") or str(error_json)
-    if response.status == 400:
-        logger.info(f"Request: {prompt} Safety Violation.")
-        data = load_data()
-        if 'safety_trips' not in data:
-            data['safety_trips'] = 0
-        data['safety_trips'] += 1
-        save_data(data)
-        return 'safety', error_message
-    elif response.status in [429, 500, 503]:
-        logger.error(f"Request: {prompt} Trying again. Error: {response.status} {error_message}")
-        return 'retry', error_message
-    else:
-        logger.error(f"Request: {prompt} Error: {response.status}: {error_message}")
-        return 'stop', error_message
+def _image_cache_key(prompt, model, size):
+    """The image cache key for generating `prompt` with `model` at `size`, resolved
+    the way fetch_image resolves them, so equivalent requests share an entry."""
+    model_name, prompt, size, quality, _ = _image_request(prompt, model, size)
+    return image_cache.cache_key(prompt, model_name, size, quality)
+
+
+async def _send_cached(status, prompt, hit):
+    """Finish `status` with a cache hit. No OpenAI call and no monthly slot: it
+    counts as a hit."""
+    description = (hit.revised_prompt or prompt)[:1024]
+    summary = [f"**Revised prompt**: {hit.revised_prompt}"] if hit.revised_prompt else []
+    summary.append(f"Served from the image cache (no API call) | Monthly requests: {monthly_quota.used()}")
+    with hit.file, perf.stage("upload"):
+        await status.finish("\n".join(summary), [
+            discord.File(hit.file, generate_file_name(prompt), description=description)])
+    counters.increment('cache_hits')
 
 
-async def fetch_image(prompt, model, size=None):
+def _record_image_error(error):
+    """Add a failed image request's retry work and safety trip to the &stats counters."""
+    _record_retries(error.attempts, error.backoff)
+    if error.verdict == 'safety':
+        counters.increment('safety_trips')
+
+
+def _record_retries(attempts, backoff):
+    """Add one image request's retry work to the &stats counters."""
+    if attempts > 1:
+        counters.increment('retries', attempts - 1)
+        counters.increment('retry_backoff_seconds', round(backoff, 1))
+
+
+def get_edit_model(model):
+    config = MODEL_CONFIGS.get(model, MODEL_CONFIGS["gpt-image-2"])
+    return model if config.get("supports_edit") else "gpt-image-2"
+
+
+async def fetch_image(prompt, model, size=None, n=1, on_partial=None):
     """`size`, when given, overrides the model config's default generation size (see
     image_size.py -- used by &paint/&hpaint/&mpaint/&lpaint/&xpaint for
-    --res/--landscape/--portrait/--square); None keeps today's behavior of always
-    using the model config's configured size. Copies config["params"] into a local
-    dict before any override so the shared MODEL_CONFIGS entry is never mutated."""
+    --res/--landscape/--portrait/--square); None keeps the model config's size.
+    `n` images come back from the one call (--n). `on_partial`, for models that
+    support streaming, gets each partial image as it arrives."""
     config = MODEL_CONFIGS.get(model, MODEL_CONFIGS["gpt-image-2"])
-    params = dict(config["params"])
-    if size is not None:
-        params["size"] = size
-    payload = {
-        "model": config["model"],
-        "prompt": prompt,
-        "n": 1,
-        "user": "bot_ross",
-        **params,
-    }
-    if config["supports_moderation"]:
-        payload["moderation"] = IMAGE_MODERATION
-
-    async with aiohttp.ClientSession() as session:
-        for _ in range(2):
-            async with session.post(
-                    "https://api.openai.com/v1/images/generations",
-                    headers={
-                        "Authorization": f"Bearer {openai.api_key}",
-                        "Content-Type": "application/json"
-                    },
-                    json=payload,
-            ) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    logger.info(f"Request: {prompt} Success")
-                    item = data["data"][0]
-                    revised = item.get("revised_prompt") if config["has_revised_prompt"] else None
-                    return {"image": item["b64_json"], "revised_prompt": revised}
-                verdict, error_message = await _classify_image_error(response, prompt)
-                if verdict == 'safety':
-                    break
-                if verdict == 'retry':
-                    await asyncio.sleep(5)
-
-        raise Exception(f"response: {response.status}: {error_message}")
-
-
-def _image_extension(content_type):
-    return (content_type or "image/png").split("/")[-1].split(";")[0] or "png"
-
-
-async def fetch_image_edit(prompt, model, images, size=None):
-    """images: list[(bytes, content_type)] of raw image content and its Discord-reported
-    content type (e.g. from discord.Attachment.read()/.content_type).
+    return await openai_api.generate_image(prompt, config, size=size, n=n, on_partial=on_partial)
+
+
+async def fetch_image_edit(prompt, model, images, size=None, n=1):
+    """images: list[(data, content_type)] of image bytes or a spooled file holding them
+    (see spooled_attachments.py) and the Discord-reported content type.
     `size`, when given, overrides the model config's default edit size (see
-    image_size.py, used by &remix to match the first input image's orientation);
-    None keeps today's behavior of always sending the model config's configured size.
-    Returns {"image": b64, "revised_prompt": None} — the edits endpoint has no revised_prompt."""
+    image_size.py, used by &remix to match the first input image's orientation).
+    Returns {"images": [file, ...], "revised_prompt": None} — the edits endpoint has no revised_prompt."""
     config = MODEL_CONFIGS.get(model, MODEL_CONFIGS["gpt-image-2"])
-    async with aiohttp.ClientSession() as session:
-        for _ in range(2):
-            form = aiohttp.FormData()  # rebuilt every attempt: FormData is single-use
-            form.add_field("model", config["model"])
-            form.add_field("prompt", prompt)
-            form.add_field("n", "1")
-            form.add_field("user", "bot_ross")
-            size_value = size if size is not None else config["params"].get("size")
-            if size_value:
-                form.add_field("size", size_value)
-            quality = config["params"].get("quality")
-            if quality:
-                form.add_field("quality", quality)
-            if config["supports_moderation"]:
-                form.add_field("moderation", IMAGE_MODERATION)
-            for i, (img_bytes, content_type) in enumerate(images):
-                ext = _image_extension(content_type)
-                form.add_field("image[]", img_bytes, filename=f"image_{i}.{ext}",
-                                content_type=content_type or "image/png")
-
-            async with session.post(
-                    "https://api.openai.com/v1/images/edits",
-                    headers={"Authorization": f"Bearer {openai.api_key}"},
-                    data=form,
-            ) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    logger.info(f"Edit request: {prompt} Success (size={size_value})")
-                    item = data["data"][0]
-                    return {"image": item["b64_json"], "revised_prompt": None}
-                verdict, error_message = await _classify_image_error(response, prompt)
-                if verdict == 'safety':
-                    break
-                if verdict == 'retry':
-                    await asyncio.sleep(5)
-
-        raise Exception(f"response: {response.status}: {error_message}")
+    return await openai_api.edit_image(prompt, config, images, size=size, n=n)
 
 
 def generate_file_name(prompt):
@@ -855,20 +1519,46 @@ def generate_file_name(prompt):
     return f"{file_name}_{random_string}.png"
 
 
-@bot.command(name='stats', help='Check monthly stats. (limit, requests)')
+@commands.command(name='queue', help='Show how many paintings are waiting and roughly how long a new one would wait.')
+async def queue_status(ctx):
+    wait = generation_queue.estimated_wait()
+    wait_part = f"about {format_duration(wait)}" if wait else "none, a brush is free"
+    await ctx.send(
+        f"Queue: {generation_queue.depth} waiting | "
+        f"{generation_queue.running}/{generation_queue.workers} painting now\n"
+        f"Estimated wait for a new request: {wait_part}"
+    )
+
+
+@commands.command(name='perf', help='Show where painting time goes: p50/p95/p99 of each stage (flags, macros, magic, download, prep, quota, queue, api, decode, upload, total) since startup. Give a command or model name to see only its requests.')
+async def perf_cmd(ctx, name=None):
+    commands_seen, models_seen = perf_recorder.names()
+    if name is None:
+        rows, scope = perf_recorder.summary(), "all requests"
+    elif name.lstrip('&') in commands_seen:
+        name = name.lstrip('&')
+        rows, scope = perf_recorder.summary(command=name), f"&{name}"
+    elif name in models_seen:
+        rows, scope = perf_recorder.summary(model=name), name
+    else:
+        known = ", ".join(sorted(commands_seen | models_seen)) or "none yet"
+        await ctx.send(f"No timings for `{name}` — try one of: {known}.")
+        return
+    if not rows:
+        await ctx.send("Nothing has been painted since startup, so there are no timings yet.")
+        return
+    lines = [f"Stage timings for {scope} since startup — p50 / p95 / p99 (count):"]
+    lines += [f"`{stage:<6}` {perf.format_quantiles(histogram)} ({histogram.count})" for stage, histogram in rows]
+    await send_long(ctx, "\n".join(lines))
+
+
+@commands.command(name='stats', help='Check monthly stats. (limit, requests)')
 async def stats(ctx):
     current_month = get_current_month()
-    data = load_data()
-    if current_month not in data:
-        data[current_month] = 0
-    if 'safety_trips' not in data:
-        data['safety_trips'] = 0
-    if 'memes' not in data:
-        data['memes'] = 0
     uptime_seconds = (datetime.now() - start_time).total_seconds()
     uptime_in_hours = uptime_seconds / 3600
 
-    history = data.get('magic_rate_history', [])
+    history = counters.get('magic_rate_history', [])
     if history:
         last = history[-1]
         last_change = f"by {last['user']} on {format_rate_change_time(last['time'])}"
@@ -878,15 +1568,25 @@ async def stats(ctx):
     # Construct the message parts
     uptime_part = f"Uptime: {format_uptime(uptime_seconds)} ({uptime_in_hours:.2f} hours)"
     limit_part = f"Monthly limit: {LIMIT}"
-    requests_part = f"Monthly requests: {data[current_month]}"
-    memes_part = f"Memes Requested: {data['memes']}"
-    violations_part = f"Safety Violations: {data['safety_trips']}"
+    requests_part = f"Monthly requests: {monthly_quota.used(current_month)}"
+    pending = monthly_quota.pending(current_month)
+    if pending:
+        requests_part += f" (+{pending} in progress)"
+    memes_part = f"Memes Requested: {counters.get('memes', 0)}"
+    violations_part = f"Safety Violations: {counters.get('safety_trips', 0)}"
+    retries_part = (f"Retries: {counters.get('retries', 0)} "
+                    f"({format_duration(counters.get('retry_backoff_seconds', 0))} backing off)")
     magic_rate_part = f"Magic rate: {format_magic_rate(MAGIC_PAINT_RATE)}"
-    magic_part = f"Magic applied: {data.get('magic', 0)}"
-    remixes_part = f"Remixes: {data.get('remixes', 0)}"
-    release_images_part = f"Release images: {data.get('release_images', 0)}"
-    macros_part = f"Macros expanded: {data.get('macros', 0)}"
-    macro_misses_part = f"Macros not found: {data.get('macro_misses', 0)}"
+    magic_part = f"Magic applied: {counters.get('magic', 0)}"
+    remixes_part = f"Remixes: {counters.get('remixes', 0)}"
+    release_images_part = f"Release images: {counters.get('release_images', 0)}"
+    comparisons_part = f"Comparisons: {counters.get('comparisons', 0)}"
+    cache_part = f"Cache hits: {counters.get('cache_hits', 0)}"
+    shared_part = f"Shared paintings: {counters.get('shared_paintings', 0)}"
+    if image_store is not None:
+        cache_part += f" ({len(image_store)} images, {image_store.total_bytes / (1024 * 1024):.1f} MB cached)"
+    macros_part = f"Macros expanded: {counters.get('macros', 0)}"
+    macro_misses_part = f"Macros not found: {counters.get('macro_misses', 0)}"
     last_change_part = f"Last rate change: {last_change}"
 
     # Combine the parts into the final message
@@ -896,10 +1596,14 @@ async def stats(ctx):
         f"{requests_part}\n"
         f"{memes_part}\n"
         f"{violations_part}\n"
+        f"{retries_part}\n"
         f"{magic_rate_part}\n"
         f"{magic_part}\n"
         f"{remixes_part}\n"
         f"{release_images_part}\n"
+        f"{comparisons_part}\n"
+        f"{cache_part}\n"
+        f"{shared_part}\n"
         f"{macros_part}\n"
         f"{macro_misses_part}\n"
         f"{last_change_part}"
@@ -924,28 +1628,15 @@ async def get_meme_prompt(user_prompt):
         {"role": "system", "content": system_message},
         {"role": "user", "content": chat_prompt}
     ]
-    response = await asyncio.get_event_loop().run_in_executor(
-        None, lambda: openai.ChatCompletion.create(model=MEME_MODEL, messages=messages)
-    )
-    logger.debug(f"Meme GPT response: {response}")
-
     try:
-        dall_e_prompt = response['choices'][0]['message']['content'].strip()
-    except Exception:
+        dall_e_prompt = (await openai_api.chat_completion(MEME_MODEL, messages)).strip()
+    except Exception as e:
+        logger.error(f"Meme prompt generation failed, using the fallback prompt: {e}")
         dall_e_prompt = "Two fluffy black cats trying to fix a broken robot based on Bob Ross"
 
     return dall_e_prompt
 
 
-def over_limit(data):
-    current_month = get_current_month()
-    if current_month not in data:
-        data[current_month] = 0
-    if data[current_month] >= LIMIT:
-        return True
-    return False
-
-
 def get_random_bob_ross_quote():
     quotes = [
         "We don't make mistakes, just happy little accidents.",
@@ -973,6 +1664,19 @@ def get_random_bob_ross_quote():
     return random.choice(quotes)
 
 
-_seed_magic_library()
-_seed_macro_library()
-bot.run(DISCORD_BOT_TOKEN)
+# Every command defined above, in definition order; create_bot() registers them.
+COMMANDS = [value for value in list(globals().values()) if isinstance(value, commands.Command)]
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    coloredlogs.install(level='INFO', logger=logger, milliseconds=True)
+    config = load_config()
+    missing = [name for name in ('OPENAI_API_KEY', 'DISCORD_BOT_TOKEN') if not config[name.lower()]]
+    if missing:
+        raise SystemExit(f"Set {' and '.join(missing)} in the environment (see env.example).")
+    create_bot(config).run(config['discord_bot_token'])
+
+
+if __name__ == "__main__":
+    main()
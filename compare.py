@@ -0,0 +1,93 @@
+"""Concurrent fan-out of one prompt across several model configs (&compare).
+
+Comparing the gpt-image-2 qualities and DALL-E 3 used to take four commands
+(&hpaint, &mpaint, &lpaint, &dpaint), each waiting its turn. &compare renders one
+prompt with every chosen config at once: fan_out() starts all of them together and
+gathers the outcomes, so the whole comparison takes about as long as its slowest
+model rather than the sum of them all. A failure (a safety rejection, say) is
+recorded in that model's Outcome and never cancels the others.
+
+Each render still goes through the bot's generation queue, which caps how many
+calls run at once (GENERATION_WORKERS). Choices are run in the order given, so the
+bot lists the slowest configs first: when there are more models than workers, the
+quick ones queue behind them and finish inside the slow ones' time.
+
+No Discord/OpenAI/bot side effects. See test_compare.py.
+"""
+
+import asyncio
+import time
+
+
+class Outcome:
+    """One model's part of a comparison: `result` on success, else `error` (the
+    exception raised). `seconds` is from the start of the fan-out to this model
+    finishing, queue wait included."""
+
+    def __init__(self, name, result=None, error=None, seconds=0.0):
+        self.name = name
+        self.result = result
+        self.error = error
+        self.seconds = seconds
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def parse_compare_args(text, choices):
+    """Split `--models a,b,...` / `--models=a,b,...` out of &compare's text. `choices`
+    maps each accepted name (case-insensitive) to its model. Returns (prompt,
+    models), where `models` lists the chosen models in the order given, without
+    repeats, or is None when no --models was given. Raises ValueError naming any
+    choice that isn't one."""
+    lookup = {name.lower(): model for name, model in choices.items()}
+    words = []
+    picked = None
+    tokens = text.split()
+    i = 0
+    while i < len(tokens):
+        tok = tokens[i]
+        low = tok.lower()
+        if low == "--models" and i + 1 < len(tokens):
+            picked = tokens[i + 1]
+            i += 1
+        elif low.startswith("--models="):
+            picked = tok.split("=", 1)[1]
+        elif low != "--models":
+            words.append(tok)
+        i += 1
+    prompt = " ".join(words)
+    if picked is None:
+        return prompt, None
+    names = [name for name in picked.lower().split(",") if name]
+    unknown = [name for name in names if name not in lookup]
+    if unknown or not names:
+        raise ValueError(f"unknown model choice(s): {', '.join(unknown) or picked!r}")
+    models = []
+    for name in names:
+        if lookup[name] not in models:
+            models.append(lookup[name])
+    return prompt, models
+
+
+def model_label(config):
+    """How a config is labelled in the gallery, e.g. "gpt-image-2 high"."""
+    quality = config["params"].get("quality")
+    return f"{config['model']} {quality}" if quality else config["model"]
+
+
+async def fan_out(names, render):
+    """Run `await render(name)` for every name at once. Returns an Outcome per name,
+    in the order given, once all have finished. Cancelling fan_out cancels every
+    render still running."""
+    started = time.monotonic()
+
+    async def one(name):
+        try:
+            result = await render(name)
+        except Exception as e:
+            return Outcome(name, error=e, seconds=time.monotonic() - started)
+        return Outcome(name, result=result, seconds=time.monotonic() - started)
+
+    return list(await asyncio.gather(*(one(name) for name in names)))
@@ -0,0 +1,165 @@
+"""On-disk, content-addressed cache of generated images.
+
+Some prompts are deterministic -- &release_image builds its prompt as a pure
+function of (source, version, georgify) -- so asking again for the same release
+hash used to spend another API call and another monthly slot on an image we
+already had. ImageCache keeps each generated image under data/image_cache/, named
+by the SHA-256 of the request that produced it (final prompt, model, size,
+quality; see cache_key), so an identical request is answered from disk without
+calling OpenAI at all.
+
+Each entry is two files: `<key>.png` (the image, exactly as the API returned it)
+and `<key>.json` (its revised prompt and request), both written atomically (see
+atomic_write.py); the metadata is written last, so an entry without it is a
+half-finished write and is swept away on load. An image's mtime is its last use:
+hits touch it, and whenever the cache grows past `max_bytes` the least recently
+used entries are deleted until it fits again. That survives restarts without an
+index file to keep in sync. put() fsyncs a few megabytes, so the bot runs it in a
+thread (asyncio.to_thread); the bookkeeping is guarded by a lock for that.
+
+No Discord/OpenAI/bot side effects. See test_image_cache.py.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+
+from atomic_write import copy_file_atomic, write_json_atomic
+
+logger = logging.getLogger("bot_ross.image_cache")
+
+DEFAULT_MAX_BYTES = 500 * 1024 * 1024
+
+FRESH_FLAG = re.compile(r"(?<!\S)--fresh(?!\S)", re.IGNORECASE)
+_KEY = re.compile(r"[0-9a-f]{64}")
+
+
+def cache_key(prompt, model, size, quality):
+    """The content address for one generation request: a hex SHA-256 over its
+    canonical JSON, so any change to the prompt or its parameters is a new key."""
+    canonical = json.dumps([prompt, model, size, quality], ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def parse_fresh_flag(text):
+    """Strip a `--fresh` flag (bypass the cache) from command text. Returns
+    (remaining text, fresh)."""
+    stripped, count = FRESH_FLAG.subn("", text)
+    return " ".join(stripped.split()), bool(count)
+
+
+class CachedImage:
+    """A cache hit: an open image `file` (the caller closes it) and the revised
+    prompt the API returned when it was generated."""
+
+    def __init__(self, file, revised_prompt):
+        self.file = file
+        self.revised_prompt = revised_prompt
+
+
+class ImageCache:
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._entries = {}  # key -> bytes on disk, least recently used first
+        self._lock = threading.Lock()
+        self._load()
+
+    @property
+    def total_bytes(self):
+        with self._lock:
+            return sum(self._entries.values())
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _paths(self, key):
+        base = os.path.join(self.directory, key)
+        return base + ".png", base + ".json"
+
+    def _load(self):
+        found = []
+        for name in os.listdir(self.directory):
+            key, ext = os.path.splitext(name)
+            if ext != ".png" or not _KEY.fullmatch(key):
+                if name.endswith(".tmp"):  # a write interrupted by a crash
+                    self._unlink(os.path.join(self.directory, name))
+                continue
+            image_path, meta_path = self._paths(key)
+            try:
+                image_stat = os.stat(image_path)
+                meta_size = os.path.getsize(meta_path)
+            except FileNotFoundError:
+                self._unlink(image_path)
+                continue
+            found.append((image_stat.st_mtime, key, image_stat.st_size + meta_size))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+        self._evict()
+
+    def get(self, key):
+        """The CachedImage for `key`, or None. A hit becomes the most recently used."""
+        with self._lock:
+            if key not in self._entries:
+                return None
+        image_path, meta_path = self._paths(key)
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            image_file = open(image_path, "rb")
+        except (OSError, ValueError) as e:
+            logger.warning(f"Dropping unreadable image cache entry {key}: {e}")
+            self._remove(key)
+            return None
+        os.utime(image_path)
+        with self._lock:
+            if key in self._entries:
+                self._entries[key] = self._entries.pop(key)
+        return CachedImage(image_file, meta.get("revised_prompt"))
+
+    def put(self, key, image_file, revised_prompt=None, request=None):
+        """Store the image in `image_file` (read from the start; left rewound for
+        the caller) under `key`, then evict down to max_bytes. `request` is kept in
+        the metadata for whoever inspects the directory."""
+        image_path, meta_path = self._paths(key)
+        image_file.seek(0)
+        try:
+            copy_file_atomic(image_path, image_file)
+            write_json_atomic(meta_path, {"revised_prompt": revised_prompt, "request": request},
+                              ensure_ascii=False)
+        except OSError as e:
+            logger.warning(f"Couldn't add image {key} to the cache: {e}")
+            self._remove(key)
+            return
+        finally:
+            image_file.seek(0)
+        size = os.path.getsize(image_path) + os.path.getsize(meta_path)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = size
+        self._evict()
+
+    def _evict(self):
+        while True:
+            with self._lock:
+                if sum(self._entries.values()) <= self.max_bytes or not self._entries:
+                    return
+                key = next(iter(self._entries))
+            self._remove(key)
+
+    def _remove(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+        for path in self._paths(key):
+            self._unlink(path)
+
+    @staticmethod
+    def _unlink(path):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
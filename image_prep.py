@@ -0,0 +1,170 @@
+"""Optional downscale/re-encode of &remix inputs before they are uploaded.
+
+resolve_edit_size (image_size.py) already decides the output size from the first
+attachment's dimensions, but the attachments themselves went to /v1/images/edits
+as uploaded -- a 4032x3024 phone photo is 5-20 MB on the wire for an output that
+is at most 3840x2160, and usually 1536x1024. prepare_image() decodes one input,
+shrinks it to fit the resolved edit size plus EDIT_SIZE_MARGIN (never upscaling),
+applies its EXIF rotation (which the re-encode would otherwise drop), and
+re-encodes it as WebP (PNG if this Pillow build lacks WebP). An input that already
+fits and is small, or that the re-encode would not shrink, is left untouched.
+
+Decoding and resampling a large photo takes a CPU-bound few hundred milliseconds,
+so ImagePreprocessor runs prepare_image in a process pool, off the event loop. At
+most one image per worker is read into memory at a time, so a remix with several
+large attachments still peaks at a few images' worth, not all of them (the point of
+spooling them, see spooled_attachments.py). The workers come from a forkserver, not
+a fork of the bot, which has threads, open sockets and a database connection that
+a forked child would inherit.
+Pillow is an optional dependency: without it AVAILABLE is False and the bot sends
+attachments as they are.
+
+No Discord/bot side effects. See test_image_prep.py.
+"""
+
+import asyncio
+import concurrent.futures
+import io
+import logging
+import multiprocessing
+
+import image_size
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:  # Pillow not installed: preprocessing is unavailable
+    Image = None
+
+logger = logging.getLogger("bot_ross.image_prep")
+
+AVAILABLE = Image is not None
+
+# Inputs are kept up to this factor over the edit size, so the model still has a
+# little more detail than it will paint.
+EDIT_SIZE_MARGIN = 1.25
+# An input that already fits and is no bigger than this is sent as-is: re-encoding
+# it would save little and cost a generation of lossy compression.
+PASSTHROUGH_BYTES = 1024 * 1024
+WEBP_QUALITY = 90
+
+
+def target_box(size, margin=EDIT_SIZE_MARGIN):
+    """(long side, short side) an input should fit within for edit size `size`
+    ("WxH" or "auto"). Orientation-free, so a portrait input for a landscape edit
+    is not squeezed; "auto" (size unknown) falls back to the endpoint's max box."""
+    try:
+        w, h = image_size.parse_resolution(size)
+    except (ValueError, TypeError):
+        return image_size.GEN_MAX_LONG, image_size.GEN_MAX_SHORT
+    return round(max(w, h) * margin), round(min(w, h) * margin)
+
+
+def _fit(width, height, box):
+    """The size box (long, short) allows for a width x height image, or None if it
+    already fits."""
+    long_side, short_side = box
+    if width >= height:
+        limit_w, limit_h = long_side, short_side
+    else:
+        limit_w, limit_h = short_side, long_side
+    scale = min(limit_w / width, limit_h / height)
+    if scale >= 1:
+        return None
+    return max(round(width * scale), 1), max(round(height * scale), 1)
+
+
+def prepare_image(data, box):
+    """Downscale encoded image `data` to fit `box` (see target_box) and re-encode
+    it. Returns (bytes, content_type), or None to send the original as it is.
+    Raises whatever Pillow raises for data it cannot decode."""
+    with Image.open(io.BytesIO(data)) as im:
+        fitted = _fit(im.width, im.height, box)
+        if fitted is None and len(data) <= PASSTHROUGH_BYTES:
+            return None
+        if fitted is not None:
+            # For JPEG, draft() lets the decoder itself scale by 1/2..1/8, so a
+            # phone photo is never fully decoded at its native resolution.
+            im.draft(im.mode, fitted)
+        im = ImageOps.exif_transpose(im)
+        if im.mode not in ("RGB", "RGBA", "L", "LA"):
+            has_alpha = "transparency" in im.info or im.mode.endswith("A")
+            im = im.convert("RGBA" if has_alpha else "RGB")
+        if fitted is not None:
+            im.thumbnail(_fit(im.width, im.height, box) or im.size, Image.LANCZOS)
+        out = io.BytesIO()
+        if features.check("webp"):
+            im.save(out, "WEBP", quality=WEBP_QUALITY, method=0)
+            content_type = "image/webp"
+        else:
+            im.save(out, "PNG", optimize=True)
+            content_type = "image/png"
+    if fitted is None and out.tell() >= len(data):
+        return None
+    return out.getvalue(), content_type
+
+
+class ImagePreprocessor:
+    """Runs prepare_image over SpooledAttachments in a process pool. start() and
+    close() bracket its life like the bot's other shared resources; prepare() is
+    best-effort and never fails a remix -- an image it cannot handle is sent as-is."""
+
+    def __init__(self, workers=2):
+        self.workers = workers
+        self._pool = None
+        self._slots = asyncio.Semaphore(workers)  # images read into memory at once
+
+    def start(self):
+        if self._pool is None:
+            self._pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("forkserver"))
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def prepare(self, images, size):
+        """Shrink each SpooledAttachment in `images` in place (its file, content_type
+        and size are replaced) for edit size `size`, `workers` at a time. Returns
+        (bytes before, bytes after) across all of them."""
+        self.start()
+        box = target_box(size)
+        before = sum(image.size for image in images)
+        await asyncio.gather(*(self._prepare_one(image, box) for image in images))
+        return before, sum(image.size for image in images)
+
+    async def _prepare_one(self, image, box):
+        # Read only once a worker is free to take it, and drop the bytes before
+        # letting the next image in.
+        async with self._slots:
+            result = await self._run(image, box)
+        if result is None:
+            return
+        encoded, content_type = result
+        image.close()
+        image.file = io.BytesIO(encoded)
+        image.content_type = content_type
+        image.size = len(encoded)
+
+    async def _run(self, image, box):
+        """prepare_image(image's bytes, box) in the pool, or None to send it as-is."""
+        image.file.seek(0)
+        data = image.file.read()
+        loop = asyncio.get_running_loop()
+        pool = self._pool
+        try:
+            return await loop.run_in_executor(pool, prepare_image, data, box)
+        except concurrent.futures.process.BrokenProcessPool:
+            # A worker died (e.g. killed decoding a huge image): start a fresh pool.
+            logger.warning("Image preprocessing worker died; sending the original")
+            if self._pool is pool:
+                self._pool = None
+                # Let the broken pool's management thread and forkserver go too.
+                pool.shutdown(wait=False, cancel_futures=True)
+                self.start()
+            return None
+        except Exception as e:
+            logger.warning(f"Couldn't preprocess a remix image, sending the original: {e}")
+            return None
+        finally:
+            image.file.seek(0)
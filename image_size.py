@@ -8,7 +8,8 @@ standard sizes + "auto", but the endpoint honors arbitrary sizes in practice, so
 rather than snapping to a fixed size.
 
 - The command flags (--square/--landscape/--portrait/--res) are parsed here
-  (`parse_size_flags`/`parse_resolution`).
+  (`parse_size_flags`/`parse_resolution`), as is --n, the number of images one
+  request asks for (`parse_count_flag`/`parse_count`).
 - `resolve_generation_size` (paint family) and `resolve_edit_size` (remix) map a
   parsed request to a final size. They differ only in their no-flag default: paint
   defaults to a square, while remix matches the first attachment's own dimensions as
@@ -138,6 +139,54 @@ def parse_size_flags(text):
     return remaining, orientation, res_raw
 
 
+# --n: how many images one paint/remix request asks the API for. The endpoints take up
+# to 10 per call, but each image is a monthly request of its own and a Discord
+# message carries at most 10 attachments, so a handful of variations is the cap.
+MAX_COUNT = 4
+
+
+def parse_count_flag(text):
+    """Split `--n <count>` / `--n=<count>` out of a command's text. Returns
+    (remaining_text, count_raw), with the same tokenize-strip-rejoin shape and rules
+    as parse_size_flags: case-insensitive, the last one wins, `count_raw` is the raw
+    value (see parse_count), a trailing `--n` with no value is dropped, and `text`
+    comes back verbatim when no --n is present."""
+    count_raw = None
+    matched = False
+    words = []
+    tokens = text.split()
+    i = 0
+    while i < len(tokens):
+        tok = tokens[i]
+        low = tok.lower()
+        if low == "--n" and i + 1 < len(tokens):
+            count_raw = tokens[i + 1]
+            matched = True
+            i += 1
+        elif low == "--n":
+            matched = True
+        elif low.startswith("--n="):
+            count_raw = tok.split("=", 1)[1]
+            matched = True
+        else:
+            words.append(tok)
+        i += 1
+    remaining = " ".join(words) if matched else text
+    return remaining, count_raw
+
+
+def parse_count(count_raw):
+    """Parse a raw '--n' value into an int in [1, MAX_COUNT]. Raises ValueError for
+    anything else."""
+    try:
+        count = int((count_raw or "").strip())
+    except ValueError:
+        raise ValueError(f"not a number of images: {count_raw!r}") from None
+    if not 1 <= count <= MAX_COUNT:
+        raise ValueError(f"number of images must be 1 to {MAX_COUNT}: {count_raw!r}")
+    return count
+
+
 _RESOLUTION_RE = re.compile(r"^\s*(\d+)\s*[xX]\s*(\d+)\s*$")
 
 
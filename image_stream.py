@@ -0,0 +1,408 @@
+"""Incremental decoding of OpenAI image responses.
+
+A generated image arrives as base64 inside the JSON body ({"data": [{"b64_json":
+"..."}]}). Reading that with response.json() and then base64-decoding it into a
+BytesIO keeps four copies of a large image alive at once: the raw body, the
+decoded JSON string, the decoded bytes, and the BytesIO copy. For a 3840x2160
+high-quality PNG that is tens of megabytes per request in flight.
+
+ImagePayloadParser instead consumes the body chunk by chunk as it comes off the
+socket. Everything outside a "b64_json" string value is kept as a small JSON
+"skeleton" and parsed normally at the end. The base64 inside is decoded a chunk at
+a time into an ImageSpool, which keeps small images in memory and moves anything
+over SPOOL_MAX_BYTES to an anonymous temp file. The decoded file object takes the
+place of the "b64_json" string in the parsed result, and can be handed straight
+to discord.File without another copy.
+
+A streamed generation ("stream": true) arrives instead as server-sent events:
+low-detail partial images while the model works, then the completed image.
+ImageEventParser splits the event stream and runs each event's JSON through its
+own ImagePayloadParser, handing partial images to a callback as they land (the bot
+turns them into a preview, see preview.py).
+
+Both readers can report how long the decoding itself took -- the time spent in the
+parser, not waiting on the socket -- for the bot's stage timings (see perf.py).
+
+No Discord/bot side effects. See test_image_stream.py.
+"""
+
+import binascii
+import io
+import json
+import tempfile
+import time
+
+# Decoded images up to this size stay in memory; larger ones spill to a temp file.
+SPOOL_MAX_BYTES = 1 << 20
+# How much of the response body to pull off the socket at a time.
+READ_CHUNK_BYTES = 64 * 1024
+
+IMAGE_KEY = "b64_json"
+
+_OUT, _STRING, _BASE64 = range(3)
+
+
+class ImageSpool:
+    """Write-once buffer for one decoded image: a BytesIO until it grows past
+    `max_size`, then a temp file. `finish()` hands back the underlying file (a
+    real io.IOBase in both cases, as discord.File requires), rewound to the start."""
+
+    def __init__(self, max_size=SPOOL_MAX_BYTES):
+        self.max_size = max_size
+        self.size = 0
+        self._file = io.BytesIO()
+        self._on_disk = False
+
+    def write(self, data):
+        if not self._on_disk and self.size + len(data) > self.max_size:
+            spilled = tempfile.TemporaryFile()
+            spilled.write(self._file.getbuffer())
+            self._file.close()
+            self._file = spilled
+            self._on_disk = True
+        self._file.write(data)
+        self.size += len(data)
+
+    def finish(self):
+        self._file.seek(0)
+        return self._file
+
+    def close(self):
+        self._file.close()
+
+
+class _Base64Writer:
+    """Decode a base64 stream fed in arbitrary pieces, four characters at a time."""
+
+    def __init__(self, spool):
+        self.spool = spool
+        self._carry = b""
+
+    def feed(self, data):
+        data = self._carry + data
+        whole = len(data) - len(data) % 4
+        self._carry = data[whole:]
+        if whole:
+            self.spool.write(binascii.a2b_base64(data[:whole]))
+
+    def close(self):
+        if self._carry:
+            self.spool.write(binascii.a2b_base64(self._carry))
+            self._carry = b""
+
+
+class ImagePayloadParser:
+    """Feed the response body with feed(); result() returns the parsed JSON with
+    every "b64_json" value replaced by its decoded image file.
+
+    The scanner only needs to track strings: a string that reads "b64_json",
+    followed by ':' and another string, is an image key, and that second string
+    is decoded instead of copied to the skeleton. Chunk boundaries may fall
+    anywhere, including inside an escape sequence."""
+
+    def __init__(self, spool_max_size=SPOOL_MAX_BYTES):
+        self.spool_max_size = spool_max_size
+        self._skeleton = bytearray()
+        self._state = _OUT
+        self._escape = False
+        self._string = bytearray()  # current skeleton string's content (short prefix only)
+        self._string_length = 0
+        self._after_key = None  # None, or "key" / "colon" while following an image key
+        self._decoder = None
+        self._spools = []
+
+    def feed(self, chunk):
+        pos = 0
+        end = len(chunk)
+        while pos < end:
+            if self._state == _OUT:
+                pos = self._scan_out(chunk, pos)
+            elif self._state == _STRING:
+                pos = self._scan_string(chunk, pos)
+            else:
+                pos = self._scan_base64(chunk, pos)
+
+    def _scan_out(self, chunk, pos):
+        quote = chunk.find(b'"', pos)
+        segment = chunk[pos:] if quote < 0 else chunk[pos:quote]
+        if self._after_key is not None:
+            for byte in segment:
+                if byte == ord(":") and self._after_key == "key":
+                    self._after_key = "colon"
+                elif byte not in b" \t\r\n":
+                    self._after_key = None
+                    break
+        self._skeleton += segment
+        if quote < 0:
+            return len(chunk)
+        self._skeleton += b'"'
+        if self._after_key == "colon":
+            spool = ImageSpool(self.spool_max_size)
+            self._spools.append(spool)
+            self._decoder = _Base64Writer(spool)
+            self._state = _BASE64
+        else:
+            self._string.clear()
+            self._string_length = 0
+            self._state = _STRING
+        self._after_key = None
+        return quote + 1
+
+    def _scan_string(self, chunk, pos):
+        if self._escape:
+            self._escape = False
+            self._skeleton.append(chunk[pos])
+            self._string_length += 2
+            return pos + 1
+        stop = _find_quote_or_backslash(chunk, pos)
+        segment = chunk[pos:] if stop < 0 else chunk[pos:stop]
+        self._skeleton += segment
+        if len(self._string) <= len(IMAGE_KEY):
+            self._string += segment[:len(IMAGE_KEY) + 1]
+        self._string_length += len(segment)
+        if stop < 0:
+            return len(chunk)
+        self._skeleton.append(chunk[stop])
+        if chunk[stop] == ord("\\"):
+            self._escape = True
+            return stop + 1
+        if self._string_length == len(IMAGE_KEY) and self._string == IMAGE_KEY.encode():
+            self._after_key = "key"
+        self._state = _OUT
+        return stop + 1
+
+    def _scan_base64(self, chunk, pos):
+        if self._escape:
+            # JSON may escape '/' as '\/'; no other escape belongs in base64.
+            self._escape = False
+            if chunk[pos] == ord("/"):
+                self._decoder.feed(b"/")
+            return pos + 1
+        stop = _find_quote_or_backslash(chunk, pos)
+        if stop < 0:
+            self._decoder.feed(chunk[pos:])
+            return len(chunk)
+        if stop > pos:
+            self._decoder.feed(chunk[pos:stop])
+        if chunk[stop] == ord("\\"):
+            self._escape = True
+            return stop + 1
+        self._decoder.close()
+        self._decoder = None
+        self._skeleton += b'"'
+        self._state = _OUT
+        return stop + 1
+
+    def result(self):
+        """The parsed response. Raises ValueError if the body was not complete,
+        valid JSON (closing any decoded images first)."""
+        try:
+            if self._state != _OUT:
+                raise ValueError("response body ended inside a string")
+            data = json.loads(self._skeleton.decode("utf-8"))
+            files = iter([spool.finish() for spool in self._spools])
+            _replace_images(data, files)
+        except Exception:
+            self.close()
+            raise
+        return data
+
+    def close(self):
+        for spool in self._spools:
+            spool.close()
+
+
+class ImageStreamError(Exception):
+    """A streamed generation sent an error event instead of finishing."""
+
+
+class ImageEventParser:
+    """Feed a streamed (text/event-stream) image response with feed(); result()
+    returns the completed images in the same shape as a plain response,
+    {"data": [event, ...]}, each completed event's "b64_json" a decoded file.
+
+    Each event's data line is decoded as it arrives by its own ImagePayloadParser,
+    so a completed image is never held as base64 either. Partial-image events
+    ("*.partial_image") are handed to `on_partial(file, index)` as soon as they are
+    complete, which then owns the file; without `on_partial` they are dropped. An
+    "error" event raises ImageStreamError."""
+
+    def __init__(self, on_partial=None, spool_max_size=SPOOL_MAX_BYTES):
+        self.on_partial = on_partial
+        self.spool_max_size = spool_max_size
+        self._name = b""  # the current line's field name, until its ':'
+        self._field = None  # the field name once the ':' has been seen
+        self._strip_space = False  # a single space after the ':' is not part of the value
+        self._event = b""
+        self._payload = None  # ImagePayloadParser for the current event's data lines
+        self._completed = []
+
+    def feed(self, chunk):
+        pos = 0
+        while pos < len(chunk):
+            end = chunk.find(b"\n", pos)
+            self._feed_line(chunk[pos:] if end < 0 else chunk[pos:end])
+            if end < 0:
+                return
+            self._end_line()
+            pos = end + 1
+
+    def _feed_line(self, piece):
+        if self._field is None:
+            colon = piece.find(b":")
+            if colon < 0:
+                self._name += piece
+                return
+            self._field = self._name + piece[:colon]
+            self._strip_space = True
+            piece = piece[colon + 1:]
+        if self._strip_space and piece:
+            self._strip_space = False
+            if piece.startswith(b" "):
+                piece = piece[1:]
+        if self._field == b"data":
+            if self._payload is None:
+                self._payload = ImagePayloadParser(self.spool_max_size)
+            self._payload.feed(piece)
+        elif self._field == b"event":
+            self._event += piece
+
+    def _end_line(self):
+        if self._field is None and self._name.rstrip(b"\r") == b"":
+            self._dispatch()
+        elif self._field == b"data":
+            self._payload.feed(b"\n")  # consecutive data lines join with a newline
+        self._name = b""
+        self._field = None
+
+    def _dispatch(self):
+        payload, self._payload = self._payload, None
+        event, self._event = self._event.strip().decode("utf-8", "replace"), b""
+        if payload is None:
+            return
+        data = payload.result()
+        if not isinstance(data, dict):
+            return
+        kind = data.get("type", event)
+        image = data.get(IMAGE_KEY)
+        if kind.endswith(".completed") and image is not None:
+            self._completed.append(data)
+            return
+        if kind.endswith(".partial_image") and image is not None and self.on_partial is not None:
+            self.on_partial(image, data.get("partial_image_index"))
+            return
+        if image is not None:
+            image.close()
+        if kind == "error" or kind.endswith(".error"):
+            error = data.get("error") or {}
+            raise ImageStreamError(error.get("message") if isinstance(error, dict) else str(error))
+
+    def result(self):
+        """The completed images. Raises ValueError (closing anything decoded) if the
+        stream ended without one."""
+        try:
+            if self._field is not None or self._name:
+                self._end_line()
+            self._dispatch()
+            if not self._completed:
+                raise ValueError("image stream ended without a completed image")
+        except Exception:
+            self.close()
+            raise
+        return {"data": self._completed}
+
+    def close(self):
+        if self._payload is not None:
+            self._payload.close()
+            self._payload = None
+        for data in self._completed:
+            data[IMAGE_KEY].close()
+        self._completed = []
+
+
+def _find_quote_or_backslash(chunk, pos):
+    quote = chunk.find(b'"', pos)
+    backslash = chunk.find(b"\\", pos, quote if quote >= 0 else len(chunk))
+    return backslash if backslash >= 0 else quote
+
+
+def _replace_images(node, files):
+    """Swap each "b64_json" value for the next decoded file, in document order
+    (the order json.loads preserves and the scanner found them in)."""
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key == IMAGE_KEY and value == "":
+                node[key] = next(files)
+            else:
+                _replace_images(value, files)
+    elif isinstance(node, list):
+        for value in node:
+            _replace_images(value, files)
+
+
+def copy_image(file, spool_max_size=SPOOL_MAX_BYTES):
+    """An independent copy of decoded image `file` (from the start), spooled the same
+    way, for a second owner (see singleflight.py). Both are left at position 0."""
+    spool = ImageSpool(spool_max_size)
+    try:
+        file.seek(0)
+        for block in iter(lambda: file.read(READ_CHUNK_BYTES), b""):
+            spool.write(block)
+    except BaseException:
+        spool.close()
+        raise
+    finally:
+        file.seek(0)
+    return spool.finish()
+
+
+def upload_batches(files, max_bytes, max_files):
+    """Split decoded image files into consecutive groups that each fit one upload
+    (one Discord message): at most `max_files` files totalling at most `max_bytes`.
+    A single file over `max_bytes` still gets a group of its own, for the upload to
+    reject. Files are left at position 0."""
+    batches, batch, batch_bytes = [], [], 0
+    for file in files:
+        size = file.seek(0, io.SEEK_END)
+        file.seek(0)
+        if batch and (len(batch) == max_files or batch_bytes + size > max_bytes):
+            batches.append(batch)
+            batch, batch_bytes = [], 0
+        batch.append(file)
+        batch_bytes += size
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+async def _read_with(parser, response, timings):
+    decoding = 0.0
+    try:
+        async for chunk in response.content.iter_chunked(READ_CHUNK_BYTES):
+            t0 = time.perf_counter()
+            parser.feed(chunk)
+            decoding += time.perf_counter() - t0
+    except BaseException:
+        parser.close()
+        raise
+    t0 = time.perf_counter()
+    result = parser.result()
+    if timings is not None:
+        timings["decode"] = decoding + time.perf_counter() - t0
+    return result
+
+
+async def read_image_response(response, spool_max_size=SPOOL_MAX_BYTES, timings=None):
+    """Read an aiohttp response carrying OpenAI image JSON incrementally. Returns
+    the parsed body with each "b64_json" value replaced by a file object holding
+    the decoded image; the caller owns (and must close) those files. Given a
+    `timings` dict, sets its "decode" to the seconds spent decoding."""
+    return await _read_with(ImagePayloadParser(spool_max_size), response, timings)
+
+
+async def read_image_events(response, on_partial=None, spool_max_size=SPOOL_MAX_BYTES, timings=None):
+    """Read a streamed (text/event-stream) image response incrementally, handing
+    each partial image to `on_partial` as it lands (see ImageEventParser). Returns
+    the completed images shaped like read_image_response's result; the caller owns
+    (and must close) those files. `timings` as for read_image_response."""
+    return await _read_with(ImageEventParser(on_partial, spool_max_size), response, timings)
@@ -0,0 +1,205 @@
+"""Bounded generation queue with a fixed worker pool and per-user round-robin.
+
+Every image command used to call OpenAI inline from its own command coroutine, so
+a burst of 30 commands meant 30 simultaneous API requests (and a pile of 429s).
+Instead, bot_ross.py submits each OpenAI call here as a job; a configurable number
+of workers drain the queue, so at most `workers` calls are ever in flight.
+
+Scheduling is round-robin across users rather than FIFO: each user has their own
+line, and workers take one job from each waiting user in turn. Someone who fires
+off ten &paints in a row only gets every Nth slot while others are waiting,
+instead of monopolizing the workers until all ten are done.
+
+No Discord/OpenAI side effects -- a job is just a zero-argument coroutine function.
+See test_job_queue.py.
+"""
+
+import asyncio
+import collections
+import logging
+import math
+import time
+
+logger = logging.getLogger("bot_ross.job_queue")
+
+# Until the first job finishes there is no measured duration to estimate waits
+# from; assume a typical gpt-image-2 generation.
+DEFAULT_JOB_SECONDS = 30.0
+# Weight of the newest job in the moving average of job durations.
+DURATION_SMOOTHING = 0.2
+
+
+class QueueFullError(Exception):
+    """Raised by submit() when `maxsize` jobs are already waiting."""
+
+
+class Ticket:
+    """What submit() hands back. `future` resolves to the job's return value (or
+    raises its exception). `position` is the job's 1-based place among waiting jobs
+    at submission; `waits` is False when an idle worker will pick it up right away."""
+
+    def __init__(self, future, position, waits):
+        self.future = future
+        self.position = position
+        self.waits = waits
+
+
+class _Job:
+    def __init__(self, user, run, future):
+        self.user = user
+        self.run = run
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+
+class GenerationQueue:
+    def __init__(self, workers=3, maxsize=30):
+        self.workers = workers
+        self.maxsize = maxsize
+        self._lines = {}  # user -> deque of that user's waiting jobs
+        self._rotation = collections.deque()  # users with waiting jobs, in service order
+        self._waiting = 0
+        self._running = 0
+        self._avg_duration = None
+        self._wakeup = None
+        self._tasks = []
+
+    # --- Introspection (&queue) ----------------------------------------------
+
+    @property
+    def depth(self):
+        """Jobs waiting for a worker (not counting the ones running)."""
+        return self._waiting
+
+    @property
+    def running(self):
+        return self._running
+
+    @property
+    def idle_workers(self):
+        return max(self.workers - self._running, 0)
+
+    @property
+    def average_job_seconds(self):
+        return self._avg_duration if self._avg_duration is not None else DEFAULT_JOB_SECONDS
+
+    def estimated_wait(self, position=None):
+        """Seconds until a job at 1-based `position` among waiting jobs starts
+        (default: a job submitted now). Jobs ahead of it are spread across every
+        worker; zero when an idle worker would take it immediately."""
+        if position is None:
+            position = self._waiting + 1
+        if position <= self.idle_workers:
+            return 0.0
+        rounds = math.ceil((position - self.idle_workers) / self.workers)
+        return rounds * self.average_job_seconds
+
+    def _position(self, user, index):
+        """1-based service position of `user`'s job at `index` in their line, given
+        round-robin order: every user gives up to `index` jobs before it, plus one
+        more from each user ahead of `user` in the current rotation."""
+        ahead = 0
+        for other in self._rotation:
+            line_length = len(self._lines[other])
+            if other == user:
+                ahead += index
+            else:
+                ahead += min(line_length, index)
+        for other in self._rotation:
+            if other == user:
+                break
+            if len(self._lines[other]) > index:
+                ahead += 1
+        return ahead + 1
+
+    # --- Submission --------------------------------------------------------------
+
+    def submit(self, user, run):
+        """Queue `run` (a zero-argument coroutine function) on behalf of `user` (any
+        hashable id). Raises QueueFullError when `maxsize` jobs are already waiting."""
+        if self._waiting >= self.maxsize:
+            raise QueueFullError(f"{self._waiting} jobs already waiting")
+        future = asyncio.get_running_loop().create_future()
+        job = _Job(user, run, future)
+        line = self._lines.get(user)
+        if line is None:
+            line = self._lines[user] = collections.deque()
+            self._rotation.append(user)
+        line.append(job)
+        self._waiting += 1
+        position = self._position(user, len(line) - 1)
+        waits = position > self.idle_workers
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return Ticket(future, position, waits)
+
+    def _take(self):
+        user = self._rotation.popleft()
+        line = self._lines[user]
+        job = line.popleft()
+        if line:
+            self._rotation.append(user)
+        else:
+            del self._lines[user]
+        self._waiting -= 1
+        return job
+
+    # --- Workers ----------------------------------------------------------------
+
+    async def _worker(self):
+        while True:
+            while not self._rotation:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            job = self._take()
+            if job.future.done():  # the submitter gave up (cancelled) while waiting
+                continue
+            self._running += 1
+            started = time.monotonic()
+            # Run the job as its own task and hand its outcome over, rather than
+            # catching the exception here: a traceback raised through this frame
+            # would pin the long-lived worker coroutine to the submitter's error.
+            task = asyncio.get_running_loop().create_task(job.run())
+            try:
+                await asyncio.wait([task])
+            except asyncio.CancelledError:
+                task.cancel()
+                job.future.cancel()
+                raise
+            finally:
+                self._running -= 1
+                self._record_duration(time.monotonic() - started)
+            error = None if task.cancelled() else task.exception()
+            if job.future.done():
+                continue
+            if task.cancelled():
+                job.future.cancel()
+            elif error is not None:
+                job.future.set_exception(error)
+            else:
+                job.future.set_result(task.result())
+
+    def _record_duration(self, seconds):
+        if self._avg_duration is None:
+            self._avg_duration = seconds
+        else:
+            self._avg_duration += DURATION_SMOOTHING * (seconds - self._avg_duration)
+
+    def start(self):
+        """Spawn the worker tasks. Call from inside the running loop (setup_hook)."""
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Event()
+        if self._rotation:
+            self._wakeup.set()
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def close(self):
+        """Stop the workers and cancel every job still waiting."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        while self._rotation:
+            self._take().future.cancel()
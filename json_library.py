@@ -8,37 +8,182 @@ survive image rebuilds/redeploys. Lifted out of magic_paint.py (the original,
 magic-specific load/save/seed) so a second feature doesn't have to duplicate
 it. No Discord/OpenAI/bot side effects -- every function takes its path(s)
 explicitly.
+
+The prompt hot path (;macro expansion, magic paint) reads its library through
+cached_library() instead of load_library(): a LibraryHandle keeps the parsed
+entries plus a prebuilt index (e.g. macros' id -> text lookup) in memory and only
+re-reads the file when its mtime/size changes (checked at most every
+RECHECK_INTERVAL seconds) or after save_library() writes it, so expanding a prompt
+is a dict lookup with no file I/O in the common case. The &magic_*/&macro_*
+commands keep using load_library()/save_library() directly, and their edits show
+up on the very next prompt.
+
+Saves are crash-safe: the library is written to a temp file, fsynced and renamed
+into place (see atomic_write.py), so a crash or full disk mid-write leaves the old
+library intact instead of a truncated file that would load as empty. A save with a
+`delay` is coalesced: the entries are held in memory (load_library() returns them
+straight away) and written once the delay passes without another save, so a run of
+&macro_add commands costs one write. That write runs in a worker thread
+(asyncio.to_thread) so the fsync never stalls the event loop; if it fails the
+entries stay held and the write is tried again after another `delay`. Saves are
+numbered, and a write never replaces one from a later save, however the threads
+interleave. flush_pending() writes anything still held (the bot calls it on
+shutdown).
+
+With STORAGE_BACKEND=sqlite, attach_library() routes a library path to a table in
+sqlite_store.SqliteStore instead: load_library()/save_library()/cached_library()
+keep the same signatures, but read and diff rows rather than the file.
 """
 
+import asyncio
+import copy
+import itertools
 import json
 import logging
 import os
+import sqlite3
+import threading
+import time
+
+from atomic_write import write_json_atomic
 
 logger = logging.getLogger("bot_ross.json_library")
 
+# How often (seconds) a cached library stats its file to pick up hand edits made
+# outside the bot. save_library() invalidates immediately regardless.
+RECHECK_INTERVAL = 2.0
+
+_handles = {}  # absolute path -> LibraryHandle
+# absolute path -> (entries, timer handle or write task, save number) for coalesced
+# saves not yet written
+_pending = {}
+_save_numbers = itertools.count()
+_written = {}  # absolute path -> number of the last save written to it
+_write_lock = threading.Lock()
+_backends = {}  # absolute path -> (sqlite_store.SqliteStore, library name), see attach_library
+
+
+def attach_library(path, db, library):
+    """Store the library known by `path` in `db` (a sqlite_store.SqliteStore) as
+    `library` from now on. The file at `path` is no longer read or written."""
+    key = os.path.abspath(path)
+    _backends[key] = (db, library)
+    handle = _handles.get(key)
+    if handle is not None:
+        handle.invalidate()
+
 
 def load_library(path, label):
-    """Read a JSON list-of-entry-dicts library fresh from `path`. Not cached in
-    memory. Returns [] (fails open) if the file is missing, malformed, not a
-    list, or empty. `label` (e.g. "magic", "macro") only identifies the caller
-    in log messages."""
+    """Read a JSON list-of-entry-dicts library fresh from `path` (or, if a
+    coalesced save for it hasn't been written yet, a copy of those entries). Not
+    cached in memory. Returns [] (fails open) if the file is missing, malformed,
+    not a list, or empty. `label` (e.g. "magic", "macro") only identifies the
+    caller in log messages."""
+    pending = _pending.get(os.path.abspath(path))
+    if pending is not None:
+        entries = copy.deepcopy(pending[0])
+        if not entries:
+            logger.error(f"{label} library {path} is empty or malformed.")
+        return entries
+    backend = _backends.get(os.path.abspath(path))
     try:
-        with open(path, 'r') as f:
-            entries = json.load(f)
+        if backend is not None:
+            db, library = backend
+            entries = db.load_library(library)
+        else:
+            with open(path, 'r') as f:
+                entries = json.load(f)
         if not isinstance(entries, list) or not entries:
             logger.error(f"{label} library {path} is empty or malformed.")
             return []
         return entries
-    except (OSError, json.JSONDecodeError) as e:
+    except (OSError, json.JSONDecodeError, sqlite3.Error) as e:
         logger.error(f"Failed to load {label} library from {path}: {e}")
         return []
 
 
-def save_library(entries, path):
-    """Write a list-of-entry-dicts library to `path`. Preserves unicode (e.g.
-    ♥️, —) for readability instead of escaping it."""
-    with open(path, 'w', encoding='utf-8') as f:
-        json.dump(entries, f, indent=2, ensure_ascii=False)
+def _write(entries, path):
+    backend = _backends.get(os.path.abspath(path))
+    if backend is not None:
+        db, library = backend
+        db.save_library(library, entries)
+    else:
+        write_json_atomic(path, entries, indent=2, ensure_ascii=False)
+
+
+def _write_save(key, path, entries, number):
+    """_write() save `number`, unless a later save to `key` has been written already."""
+    with _write_lock:
+        if _written.get(key, -1) > number:
+            return
+        _write(entries, path)
+        _written[key] = number
+
+
+def save_library(entries, path, delay=None):
+    """Write a list-of-entry-dicts library to `path` atomically. Preserves
+    unicode (e.g. ♥️, —) for readability instead of escaping it.
+
+    With `delay` (seconds) and a running event loop, the write is coalesced
+    instead: it happens `delay` seconds after the last such save to `path`, and
+    until then load_library() returns these entries. Without either, the write
+    happens now and any pending coalesced save for `path` is superseded."""
+    key = os.path.abspath(path)
+    number = next(_save_numbers)
+    previous = _pending.pop(key, None)
+    if previous is not None:
+        previous[1].cancel()
+    loop = None
+    if delay is not None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            pass
+    if loop is None:
+        _write_save(key, path, entries, number)
+    else:
+        _schedule(loop, key, path, copy.deepcopy(entries), number, delay)
+    handle = _handles.get(key)
+    if handle is not None:
+        handle.invalidate()
+
+
+def _schedule(loop, key, path, entries, number, delay):
+    timer = loop.call_later(delay, _start_flush, loop, key, path, entries, number, delay)
+    _pending[key] = (entries, timer, number)
+
+
+def _start_flush(loop, key, path, entries, number, delay):
+    task = loop.create_task(_flush_one(loop, key, path, entries, number, delay))
+    _pending[key] = (entries, task, number)
+
+
+async def _flush_one(loop, key, path, entries, number, delay):
+    try:
+        await asyncio.to_thread(_write_save, key, path, entries, number)
+    except Exception as e:
+        logger.error(f"Failed to write library {path}: {e}")
+        # Stay pending (load_library keeps serving the new entries) and try again,
+        # unless a newer save has taken over.
+        if _pending.get(key, (None, None, None))[2] == number:
+            _schedule(loop, key, path, entries, number, delay)
+        return
+    if _pending.get(key, (None, None, None))[2] == number:
+        del _pending[key]
+
+
+def flush_pending():
+    """Write every coalesced save that is still waiting, right now."""
+    for key in list(_pending):
+        entries, timer, number = _pending[key]
+        timer.cancel()
+        try:
+            _write_save(key, key, entries, number)
+        except Exception as e:
+            # Stay pending; the next save or flush_pending() tries again.
+            logger.error(f"Failed to write library {key}: {e}")
+            continue
+        del _pending[key]
 
 
 def seed_library(working_path, default_path, label):
@@ -58,3 +203,76 @@ def seed_library(working_path, default_path, label):
         logger.info(f"Seeded {working_path} from {default_path} ({len(entries)} {label} entries).")
     except (OSError, json.JSONDecodeError) as e:
         logger.error(f"Failed to seed {label} library from {default_path}: {e}")
+
+
+def _file_signature(path):
+    """What a cached library compares to notice the file changed on disk (or its
+    SQLite table changed), or None if it can't be stat'ed (missing)."""
+    backend = _backends.get(os.path.abspath(path))
+    if backend is not None:
+        db, library = backend
+        try:
+            return db.library_version(library)
+        except sqlite3.Error:
+            return None
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+class LibraryHandle:
+    """The parsed contents of one library file, kept in memory.
+
+    `entries()` is the list as load_library() would return it and `index()` is
+    `build_index(entries)` (None without a `build_index`), both rebuilt together
+    only when the file changes. Treat what they return as read-only -- it is
+    shared by every caller until the next reload."""
+
+    def __init__(self, path, label, build_index=None, recheck_interval=None):
+        self.path = path
+        self.label = label
+        self.build_index = build_index
+        self.recheck_interval = RECHECK_INTERVAL if recheck_interval is None else recheck_interval
+        self._entries = []
+        self._index = None
+        self._signature = None
+        self._loaded = False
+        self._checked_at = 0.0
+
+    def invalidate(self):
+        """Force the next access to re-read the file."""
+        self._loaded = False
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._loaded and now - self._checked_at < self.recheck_interval:
+            return
+        self._checked_at = now
+        signature = _file_signature(self.path)
+        if self._loaded and signature == self._signature:
+            return
+        entries = load_library(self.path, self.label)
+        self._entries = entries
+        self._index = self.build_index(entries) if self.build_index is not None else None
+        self._signature = signature
+        self._loaded = True
+
+    def entries(self):
+        self._refresh()
+        return self._entries
+
+    def index(self):
+        self._refresh()
+        return self._index
+
+
+def cached_library(path, label, build_index=None):
+    """The shared LibraryHandle for `path`, created on first use. Every caller for
+    the same file gets the same handle, so save_library() invalidates it for all."""
+    key = os.path.abspath(path)
+    handle = _handles.get(key)
+    if handle is None:
+        handle = _handles[key] = LibraryHandle(path, label, build_index=build_index)
+    return handle
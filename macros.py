@@ -68,7 +68,7 @@ def entry_id(entry):
     """Return an entry's normalized id, or None if the entry is malformed (not a
     dict, or its id is missing/blank/not a string). Lets the &macro_* commands
     match/skip hand-corrupted library rows without crashing -- the same fails-open
-    tolerance expand_macros applies when building its lookup table."""
+    tolerance build_lookup applies when building expand_macros' lookup table."""
     if not isinstance(entry, dict):
         return None
     raw_id = entry.get("id")
@@ -89,9 +89,10 @@ def load_macro_library(path):
     return json_library.load_library(path, label="macro")
 
 
-def save_macro_library(entries, path):
-    """Write the macro library to `path`. Preserves unicode for readability."""
-    json_library.save_library(entries, path)
+def save_macro_library(entries, path, delay=None):
+    """Write the macro library to `path` atomically. Preserves unicode for
+    readability. `delay` coalesces rapid saves (see json_library.save_library)."""
+    json_library.save_library(entries, path, delay=delay)
 
 
 def seed_macro_library(working_path, default_path):
@@ -100,14 +101,41 @@ def seed_macro_library(working_path, default_path):
     json_library.seed_library(working_path, default_path, label="macro")
 
 
+def build_lookup(entries):
+    """Build the normalized id -> text lookup expand_macros resolves tokens
+    against.
+
+    Built defensively: a single hand-corrupted row in data/macros.json (a
+    non-dict list item, or an id/text that isn't a string) must not take down
+    expansion for every other, valid macro -- that would violate the fails-open
+    promise. Anything that isn't well-formed is skipped."""
+    lookup = {}
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        raw_id = entry.get("id")
+        text = entry.get("text", "")
+        if not isinstance(raw_id, str) or not raw_id or not isinstance(text, str):
+            continue
+        lookup[normalize_macro_id(raw_id)] = text
+    return lookup
+
+
+def cached_macro_lookup(path):
+    """The id -> text lookup for the library at `path`, kept in memory and only
+    rebuilt when the file changes or is saved (see json_library.cached_library)."""
+    return json_library.cached_library(path, label="macro", build_index=build_lookup).index()
+
+
 def expand_macros(prompt, entries=None, path=None, fallbacks=FALLBACK_EXPANSIONS):
     """Replace every ';token' in `prompt` with its macro text (case-insensitive
     lookup), leaving everything else untouched.
 
     Supply `entries` directly (tests, or an already-loaded list), or `path` to
-    load the library fresh from disk; if neither resolves to a non-empty list,
-    every token is a miss (fails open -- the prompt is still usable, just
-    without expansions).
+    read the library through its in-memory cache (re-read from disk only when
+    the file has changed); if neither resolves to a non-empty list, every token
+    is a miss (fails open -- the prompt is still usable, just without
+    expansions).
 
     A found token's stored text replaces it in place. An entry whose text is
     empty/missing is treated the same as not found (a miss), matching
@@ -122,22 +150,12 @@ def expand_macros(prompt, entries=None, path=None, fallbacks=FALLBACK_EXPANSIONS
     (so counters built on their lengths are honest about how many
     substitutions actually happened).
     """
-    if entries is None:
-        entries = load_macro_library(path) if path is not None else []
-
-    # Build the id -> text lookup defensively: a single hand-corrupted row in
-    # data/macros.json (a non-dict list item, or an id/text that isn't a string)
-    # must not take down expansion for every other, valid macro -- that would
-    # violate the fails-open promise. Skip anything that isn't well-formed.
-    lookup = {}
-    for entry in entries:
-        if not isinstance(entry, dict):
-            continue
-        raw_id = entry.get("id")
-        text = entry.get("text", "")
-        if not isinstance(raw_id, str) or not raw_id or not isinstance(text, str):
-            continue
-        lookup[normalize_macro_id(raw_id)] = text
+    if entries is not None:
+        lookup = build_lookup(entries)
+    elif path is not None:
+        lookup = cached_macro_lookup(path)
+    else:
+        lookup = {}
 
     hits = []
     misses = []
@@ -46,9 +46,10 @@ def load_magic_library(path):
     return json_library.load_library(path, label="magic")
 
 
-def save_magic_library(entries, path):
-    """Write the magic-prompt library to `path`. Preserves unicode (♥️, —) for readability."""
-    json_library.save_library(entries, path)
+def save_magic_library(entries, path, delay=None):
+    """Write the magic-prompt library to `path` atomically. Preserves unicode (♥️, —) for
+    readability. `delay` coalesces rapid saves (see json_library.save_library)."""
+    json_library.save_library(entries, path, delay=delay)
 
 
 def seed_magic_library(working_path, default_path):
@@ -74,11 +75,12 @@ def slugify_magic_id(text, existing_ids):
 def apply_random_magic_entry(prompt, entries=None, path=None):
     """Pick one entry at random and append its text to the prompt.
 
-    Supply `entries` directly (tests, or an already-loaded list), or `path` to load
-    the library fresh from disk. Fails open (returns the unchanged prompt) if the
-    library is missing/empty."""
+    Supply `entries` directly (tests, or an already-loaded list), or `path` to read
+    the library through its in-memory cache (re-read from disk only when the file
+    has changed, see json_library.cached_library). Fails open (returns the
+    unchanged prompt) if the library is missing/empty."""
     if entries is None:
-        entries = load_magic_library(path) if path is not None else []
+        entries = json_library.cached_library(path, label="magic").entries() if path is not None else []
     if not entries:
         return prompt
     text = random.choice(entries).get("text", "")
@@ -88,8 +90,8 @@ def apply_random_magic_entry(prompt, entries=None, path=None):
 def maybe_apply_magic_paint(prompt, rate, entries=None, path=None):
     """Roll against `rate`; on success append a random magic entry.
 
-    The library is only consulted when the roll succeeds (pass `path` for a fresh
-    disk read, or `entries` for an in-memory list). Returns (new_prompt, triggered)."""
+    The library is only consulted when the roll succeeds (pass `path` for the
+    cached library file, or `entries` for an in-memory list). Returns (new_prompt, triggered)."""
     if random.random() < rate:
         return apply_random_magic_entry(prompt, entries=entries, path=path), True
     return prompt, False
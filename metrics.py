@@ -0,0 +1,160 @@
+"""Prometheus-style metrics, served over HTTP from the bot's own event loop.
+
+&stats formats the counters for Discord, which an external monitor can't scrape.
+With METRICS_PORT set, the bot also runs a small aiohttp web app answering
+GET /metrics in the Prometheus text exposition format: the persisted counters
+(safety trips, retries, macro hits/misses, magic applications, ...), live gauges
+(queue depth, in-flight OpenAI calls, monthly quota), and the per-stage latency
+histograms from perf.py, which also give requests by command and model. Each
+scrape calls a collect() callback for a fresh list of Metric families, so nothing
+is computed between scrapes.
+
+No Discord/OpenAI/bot side effects -- the bot supplies collect(). See
+test_metrics.py.
+"""
+
+import logging
+import math
+
+from aiohttp import web
+
+logger = logging.getLogger("bot_ross.metrics")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+METRICS_PATH = "/metrics"
+PREFIX = "bot_ross_"
+
+# The persisted StatsStore counters exported as Prometheus counters:
+# store key -> (metric name, help).
+STORE_COUNTERS = {
+    'memes': ("memes_total", "Meme paintings made."),
+    'remixes': ("remixes_total", "Remixes made."),
+    'release_images': ("release_images_total", "Release images painted."),
+    'comparisons': ("comparisons_total", "&compare requests with at least one painting."),
+    'cache_hits': ("cache_hits_total", "Paintings served from the image cache."),
+    'shared_paintings': ("shared_paintings_total", "Paintings shared from an identical request in flight."),
+    'safety_trips': ("safety_trips_total", "Image requests rejected by the safety system."),
+    'retries': ("retries_total", "Image API attempts retried."),
+    'retry_backoff_seconds': ("retry_backoff_seconds_total", "Seconds spent backing off between retries."),
+    'magic': ("magic_applied_total", "Prompts given a magic mixin."),
+    'macros': ("macro_hits_total", "Macro tokens expanded."),
+    'macro_misses': ("macro_misses_total", "Macro tokens not found."),
+}
+
+
+class Metric:
+    """One metric family; `kind` is 'counter', 'gauge' or 'histogram'."""
+
+    def __init__(self, name, kind, help):
+        self.name = name
+        self.kind = kind
+        self.help = help
+        self.samples = []  # (name suffix, labels, value)
+
+    def add(self, value, labels=None, suffix=""):
+        self.samples.append((suffix, labels or {}, value))
+        return self
+
+    def add_histogram(self, histogram, labels=None):
+        """Add a perf.Histogram as cumulative _bucket samples, _sum and _count."""
+        labels = labels or {}
+        cumulative = 0
+        for bound, count in zip(histogram.bounds, histogram.counts):
+            cumulative += count
+            self.add(cumulative, {**labels, "le": _format_value(bound)}, "_bucket")
+        self.add(histogram.count, {**labels, "le": "+Inf"}, "_bucket")
+        self.add(histogram.total, labels, "_sum")
+        self.add(histogram.count, labels, "_count")
+        return self
+
+
+def store_metrics(get):
+    """The STORE_COUNTERS as Metrics, read with `get(key, default)` (StatsStore.get)."""
+    return [Metric(PREFIX + name, "counter", help).add(get(key, 0))
+            for key, (name, help) in STORE_COUNTERS.items()]
+
+
+def stage_metrics(recorder):
+    """A perf.PerfRecorder's histograms, plus the requests they timed by command and
+    model (each traced request records one "total")."""
+    seconds = Metric(PREFIX + "stage_seconds", "histogram", "Time spent in each stage of a request.")
+    requests = Metric(PREFIX + "requests_total", "counter", "Requests timed since startup, by command and model.")
+    for (stage, command, model), histogram in sorted(recorder.histograms.items()):
+        labels = {"command": command, "model": model}
+        seconds.add_histogram(histogram, {"stage": stage, **labels})
+        if stage == "total":
+            requests.add(histogram.count, labels)
+    return [requests, seconds]
+
+
+def render(metrics):
+    """The text exposition format of `metrics`."""
+    lines = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {_escape_help(metric.help)}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for suffix, labels, value in metric.samples:
+            lines.append(f"{metric.name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def _escape_help(text):
+    return text.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join(f'{key}="{_escape_label(value)}"' for key, value in labels.items())
+    return "{" + pairs + "}"
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value):
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, int):
+        return str(value)
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if math.isnan(value):
+        return "NaN"
+    return repr(float(value))
+
+
+class MetricsServer:
+    """GET METRICS_PATH on host:port answers render(collect()). Start it from inside
+    the running loop (the bot's setup_hook); port 0 picks a free port, read back
+    from `port` once started."""
+
+    def __init__(self, collect, host="127.0.0.1", port=9090):
+        self.collect = collect
+        self.host = host
+        self.port = port
+        self._runner = None
+
+    async def _scrape(self, request):
+        try:
+            body = render(self.collect())
+        except Exception as e:
+            logger.error(f"Couldn't collect metrics: {e}")
+            return web.Response(status=500, text=f"collect failed: {e}\n")
+        return web.Response(body=body.encode("utf-8"), headers={"Content-Type": CONTENT_TYPE})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get(METRICS_PATH, self._scrape)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+        logger.info(f"Serving metrics on http://{self.host}:{self.port}{METRICS_PATH}")
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
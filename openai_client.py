@@ -0,0 +1,333 @@
+"""Async OpenAI HTTP client shared by every image and chat request the bot makes.
+
+Kept separate from bot_ross.py, which holds the Discord commands and the bot's
+state, so the request/retry logic needs neither and can be exercised against a local
+stub server on its own (see test_openai_client.py).
+One OpenAIClient owns one aiohttp.ClientSession for the bot's whole lifetime: it is
+opened in the bot's setup_hook and closed on shutdown, so consecutive generations
+reuse pooled keep-alive connections to api.openai.com instead of paying a fresh
+TCP + TLS handshake per request. Image requests are also paced per model by an
+AdaptiveRateLimiter (see rate_limit.py) fed from every response's rate-limit headers,
+so a burst is held back client-side instead of being answered with 429s, and
+retried per a RetryPolicy (see retry_policy.py) when they do fail transiently.
+Successful image bodies are decoded as they stream in (see image_stream.py) rather
+than buffered whole; a generation can also be streamed with partial images, which
+are passed to the caller as previews while the model works.
+
+The client knows nothing about Discord or the bot's counters. Model configs (the
+MODEL_CONFIGS entries in bot_ross.py) are passed in per call; failures surface as
+ImageAPIError, whose `verdict` tells the caller whether it was a safety rejection.
+"""
+
+import asyncio
+import collections
+import logging
+import time
+
+import aiohttp
+
+from spooled_attachments import part_for
+from image_stream import ImageStreamError, read_image_events, read_image_response
+from rate_limit import AdaptiveRateLimiter, parse_retry_after
+from retry_policy import RetryPolicy
+
+logger = logging.getLogger("bot_ross.openai_client")
+
+API_BASE = "https://api.openai.com/v1"
+
+# Connection pool tuning. Generations are long-lived requests, so a handful of
+# concurrent connections per host is plenty; idle ones are kept warm for a minute
+# and api.openai.com's address is cached instead of re-resolved for every call.
+LIMIT_PER_HOST = 8
+KEEPALIVE_TIMEOUT = 60
+DNS_CACHE_TTL = 300
+
+# The &meme prompt call is small and should be quick: give each attempt its own
+# timeout (independent of the long image-generation requests sharing the session)
+# and retry transient failures a couple of times with a short pause.
+CHAT_TIMEOUT = 30
+CHAT_ATTEMPTS = 3
+CHAT_RETRY_DELAY = 1
+
+# Partial images a streamed image request asks for (the API allows 0-3). Each is a
+# rough preview of the final image: a little extra output, but not another request.
+PARTIAL_IMAGES = 2
+
+
+def create_session(limit_per_host=LIMIT_PER_HOST, keepalive_timeout=KEEPALIVE_TIMEOUT,
+                   dns_cache_ttl=DNS_CACHE_TTL):
+    """Build the pooled session every OpenAI call shares. Must be called from
+    inside the running event loop."""
+    connector = aiohttp.TCPConnector(
+        limit_per_host=limit_per_host,
+        keepalive_timeout=keepalive_timeout,
+        ttl_dns_cache=dns_cache_ttl,
+        use_dns_cache=True,
+    )
+    return aiohttp.ClientSession(connector=connector)
+
+
+class ImageAPIError(Exception):
+    """A non-200 from an image endpoint, after retries. `verdict` is 'safety' for a
+    moderation rejection (400), 'retry' if retryable attempts ran out, else 'stop'.
+    The message keeps the "response: <status>: <detail>" shape users already see.
+    `attempts`/`backoff` record the retry work spent before giving up."""
+
+    def __init__(self, status, message, verdict, attempts=1, backoff=0.0):
+        super().__init__(f"response: {status}: {message}")
+        self.status = status
+        self.message = message
+        self.verdict = verdict
+        self.attempts = attempts
+        self.backoff = backoff
+
+
+class ChatAPIError(Exception):
+    """The chat completion failed after retries: a non-retryable status, or every
+    attempt timed out / errored / came back 429 or 5xx."""
+
+
+def classify_status(status):
+    """Map an image endpoint's HTTP status to 'safety', 'retry', or 'stop'."""
+    if status == 400:
+        return 'safety'
+    if status in (429, 500, 503):
+        return 'retry'
+    return 'stop'
+
+
+def _image_extension(content_type):
+    return (content_type or "image/png").split("/")[-1].split(";")[0] or "png"
+
+
+def _image_files(data):
+    """Every decoded image file in a parsed image response, in order."""
+    return [item["b64_json"] for item in data["data"]]
+
+
+class OpenAIClient:
+    def __init__(self, api_key, moderation="low", base_url=API_BASE, retry_policy=None,
+                 chat_timeout=CHAT_TIMEOUT, chat_retry_delay=CHAT_RETRY_DELAY, rate_limiter=None,
+                 partial_images=PARTIAL_IMAGES):
+        self.api_key = api_key
+        self.moderation = moderation
+        self.base_url = base_url.rstrip("/")
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.chat_timeout = chat_timeout
+        self.chat_retry_delay = chat_retry_delay
+        self.partial_images = partial_images
+        self.rate_limiter = rate_limiter if rate_limiter is not None else AdaptiveRateLimiter()
+        self.in_flight = collections.Counter()  # model -> image attempts under way (for metrics)
+        self.session = None
+
+    async def start(self, session=None):
+        """Open the shared session (or adopt one supplied by the caller)."""
+        if self.session is None:
+            self.session = session if session is not None else create_session()
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def _auth_headers(self):
+        return {"Authorization": f"Bearer {self.api_key}"}
+
+    async def _classify_error(self, response, prompt):
+        """Returns (verdict, error_message) for a non-200 image response."""
+        try:
+            error_json = await response.json(content_type=None)
+            error_message = error_json.get("error", {}).get("message") or str(error_json)
+        except (ValueError, aiohttp.ContentTypeError, AttributeError):
+            error_message = await response.text()
+        verdict = classify_status(response.status)
+        if verdict == 'safety':
+            logger.info(f"Request: {prompt} Safety Violation.")
+        elif verdict == 'retry':
+            logger.error(f"Request: {prompt} Trying again. Error: {response.status} {error_message}")
+        else:
+            logger.error(f"Request: {prompt} Error: {response.status}: {error_message}")
+        return verdict, error_message
+
+    async def _send_paced(self, model, url, request_kwargs, timeout):
+        """POST once the model's rate-limit bucket allows it, waiting at most
+        `timeout` seconds for that (asyncio.TimeoutError past it); the response
+        headers are fed back to the limiter before the response is handed to the
+        caller. Use as `async with await self._send_paced(...) as response`."""
+        stamp = await asyncio.wait_for(self.rate_limiter.acquire(model), timeout)
+        try:
+            response = await self.session.post(url, **request_kwargs)
+        except BaseException:
+            self.rate_limiter.release(model, stamp)
+            raise
+        self.rate_limiter.update(model, response.status, response.headers, stamp)
+        return response
+
+    async def _post_image(self, endpoint, prompt, model, build_request, on_success, on_partial=None):
+        """Shared retry loop for both image endpoints. `build_request()` returns the
+        post() kwargs for one attempt (multipart bodies are single-use, so it is
+        called again per attempt); `on_success(data)` extracts the result from the
+        body as read by image_stream.read_image_response (each "b64_json" already
+        decoded into a file object), to which the request's `attempts`, total
+        `backoff` seconds, `attempt_seconds` (each attempt's, from pacing to the
+        last byte) and `decode_seconds` (see image_stream.py) are added. `model` picks
+        the rate-limit bucket the attempts are paced by. Each attempt may only use
+        what is left of the policy's per-request deadline. A streamed (event-stream)
+        response is read with read_image_events instead, handing its partial images
+        to `on_partial`; an error event fails the request without a retry. A
+        connection error (reset, disconnect) is retried like a 5xx."""
+        if self.session is None:
+            raise RuntimeError("OpenAIClient.start() has not been called")
+        tracker = self.retry_policy.start()
+        attempt_seconds = []
+        while True:
+            remaining = tracker.remaining()
+            if remaining <= 0:
+                # ClientTimeout(total=0) would mean no timeout at all.
+                raise self._deadline_error(prompt, tracker)
+            request_kwargs = build_request()
+            request_kwargs["timeout"] = aiohttp.ClientTimeout(total=remaining)
+            t0 = time.monotonic()
+            self.in_flight[model] += 1
+            try:
+                async with await self._send_paced(model, f"{self.base_url}{endpoint}", request_kwargs,
+                                                  remaining) as response:
+                    if response.status == 200:
+                        timings = {}
+                        if response.content_type == "text/event-stream":
+                            data = await read_image_events(response, on_partial, timings=timings)
+                        else:
+                            data = await read_image_response(response, timings=timings)
+                        attempt_seconds.append(time.monotonic() - t0)
+                        result = on_success(data)
+                        return {**result, "attempts": tracker.attempts, "backoff": tracker.backoff,
+                                "attempt_seconds": attempt_seconds, "decode_seconds": timings["decode"]}
+                    status = response.status
+                    retry_after = parse_retry_after(response.headers.get("retry-after"))
+                    verdict, error_message = await self._classify_error(response, prompt)
+                    attempt_seconds.append(time.monotonic() - t0)
+            except ImageStreamError as e:
+                logger.error(f"Request: {prompt} failed mid-stream: {e}")
+                raise ImageAPIError("stream", str(e), 'stop', tracker.attempts, tracker.backoff)
+            except asyncio.TimeoutError:
+                raise self._deadline_error(prompt, tracker)
+            except aiohttp.ClientError as e:
+                attempt_seconds.append(time.monotonic() - t0)
+                status, error_message = "connection", f"{type(e).__name__}: {e}"
+                retry_after, verdict = None, 'retry'
+                logger.error(f"Request: {prompt} Connection error: {error_message}")
+            finally:
+                self.in_flight[model] -= 1
+            delay = tracker.next_delay(retry_after) if verdict == 'retry' else None
+            if delay is None:
+                raise ImageAPIError(status, error_message, verdict, tracker.attempts, tracker.backoff)
+            await asyncio.sleep(delay)
+
+    def _deadline_error(self, prompt, tracker):
+        logger.error(f"Request: {prompt} ran past its {self.retry_policy.deadline:g}s deadline.")
+        return ImageAPIError("timeout", f"no response within {self.retry_policy.deadline:g}s", 'stop',
+                             tracker.attempts, tracker.backoff)
+
+    async def generate_image(self, prompt, config, size=None, n=1, on_partial=None):
+        """POST /images/generations for one MODEL_CONFIGS entry, asking for `n`
+        images in the one call. `size`, when given, overrides the config's default
+        size; config["params"] is copied first so the shared config is never mutated.
+        Returns {"images": [file, ...], "revised_prompt"}, where each file is a
+        decoded image (see image_stream.py) and is the caller's to close; the revised
+        prompt is the first image's. With `on_partial` and a config that
+        supports_streaming, the image is streamed and each partial image is passed
+        to on_partial(file, index) as it arrives (on_partial then owns the file)."""
+        params = dict(config["params"])
+        if size is not None:
+            params["size"] = size
+        payload = {
+            "model": config["model"],
+            "prompt": prompt,
+            "n": n,
+            "user": "bot_ross",
+            **params,
+        }
+        if config["supports_moderation"]:
+            payload["moderation"] = self.moderation
+        stream = on_partial is not None and config.get("supports_streaming", False)
+        if stream:
+            payload["stream"] = True
+            payload["partial_images"] = self.partial_images
+
+        def build_request():
+            return {"headers": {**self._auth_headers(), "Content-Type": "application/json"}, "json": payload}
+
+        def on_success(data):
+            logger.info(f"Request: {prompt} Success ({len(data['data'])} image(s))")
+            first = data["data"][0]
+            revised = first.get("revised_prompt") if config["has_revised_prompt"] else None
+            return {"images": _image_files(data), "revised_prompt": revised}
+
+        return await self._post_image("/images/generations", prompt, config["model"], build_request, on_success,
+                                      on_partial if stream else None)
+
+    async def edit_image(self, prompt, config, images, size=None, n=1):
+        """POST /images/edits, asking for `n` images. images: list[(data,
+        content_type)], where `data` is the image's bytes or a seekable file holding
+        them (e.g. a SpooledAttachment.file, see spooled_attachments.py) -- files are
+        streamed from the start on every attempt and left open for the caller to
+        close. `size`, when given, overrides the config's default edit size. Returns
+        {"images": [file, ...], "revised_prompt": None} like generate_image -- the
+        edits endpoint has no revised_prompt."""
+        size_value = size if size is not None else config["params"].get("size")
+
+        def build_request():
+            form = aiohttp.FormData()
+            form.add_field("model", config["model"])
+            form.add_field("prompt", prompt)
+            form.add_field("n", str(n))
+            form.add_field("user", "bot_ross")
+            if size_value:
+                form.add_field("size", size_value)
+            quality = config["params"].get("quality")
+            if quality:
+                form.add_field("quality", quality)
+            if config["supports_moderation"]:
+                form.add_field("moderation", self.moderation)
+            for i, (image, content_type) in enumerate(images):
+                ext = _image_extension(content_type)
+                filename = f"image_{i}.{ext}"
+                content_type = content_type or "image/png"
+                form.add_field("image[]", part_for(image, content_type, filename), filename=filename,
+                               content_type=content_type)
+            return {"headers": self._auth_headers(), "data": form}
+
+        def on_success(data):
+            logger.info(f"Edit request: {prompt} Success (size={size_value}, {len(data['data'])} image(s))")
+            return {"images": _image_files(data), "revised_prompt": None}
+
+        return await self._post_image("/images/edits", prompt, config["model"], build_request, on_success)
+
+    async def chat_completion(self, model, messages):
+        """POST /chat/completions natively on the shared session and return the
+        first choice's message content. Each attempt is bounded by `chat_timeout`;
+        timeouts, connection errors, 429 and 5xx are retried up to CHAT_ATTEMPTS
+        times. Raises ChatAPIError once attempts run out or on any other status."""
+        if self.session is None:
+            raise RuntimeError("OpenAIClient.start() has not been called")
+        payload = {"model": model, "messages": messages}
+        headers = {**self._auth_headers(), "Content-Type": "application/json"}
+        timeout = aiohttp.ClientTimeout(total=self.chat_timeout)
+        last_error = None
+        for attempt in range(CHAT_ATTEMPTS):
+            try:
+                async with self.session.post(f"{self.base_url}/chat/completions", headers=headers,
+                                             json=payload, timeout=timeout) as response:
+                    if response.status == 200:
+                        data = await response.json()
+                        logger.debug(f"Chat completion response: {data}")
+                        return data["choices"][0]["message"]["content"]
+                    last_error = f"{response.status}: {await response.text()}"
+                    if response.status != 429 and response.status < 500:
+                        break
+            except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+                last_error = f"{type(e).__name__}: {e}"
+            logger.error(f"Chat completion attempt {attempt + 1} failed: {last_error}")
+            if attempt + 1 < CHAT_ATTEMPTS:
+                await asyncio.sleep(self.chat_retry_delay)
+        raise ChatAPIError(last_error)
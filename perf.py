@@ -0,0 +1,241 @@
+"""Per-stage latency histograms for image requests.
+
+The only timing the bot used to keep was the OpenAI call's `elapsed`, shown once to
+the user and then lost. A Trace follows one command through the pipeline -- flag
+parsing, macro expansion, the magic roll, a remix's download and preprocessing,
+the quota reservation, the queue wait, each API attempt, base64 decoding, the
+Discord upload -- and records every stage's duration into a PerfRecorder, which
+keeps a fixed-bucket Histogram per (stage, command, model). Observing is a bisect
+and three additions, so it runs on every request; &perf and a periodic log line
+read p50/p95/p99 back out of the buckets.
+
+The current request's trace lives in a context variable set around each command
+(begin()/end()), so code anywhere on the command's path records a stage with
+perf.stage(...) or perf.record(...) without the trace being passed around; both are
+no-ops outside a traced command. Code running on another task (a generation-queue
+worker) uses the Trace itself, taken with current() before handing the work off.
+Stages recorded before the request's model is known wait in the trace until
+set_model(), or are filed under "-" when the trace ends without one (&compare).
+
+No Discord/OpenAI/bot side effects. See test_perf.py.
+"""
+
+import asyncio
+import bisect
+import contextlib
+import contextvars
+import logging
+import time
+
+logger = logging.getLogger("bot_ross.perf")
+
+# Bucket upper bounds in seconds; one more bucket holds everything past the last. Fine
+# steps under a second for the local stages, coarse ones out to the API's minutes.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 15, 20,
+           30, 45, 60, 90, 120, 180, 300)
+# Pipeline order, for display; a stage not listed here sorts after these.
+STAGES = ("flags", "macros", "magic", "download", "prep", "quota", "queue", "api", "decode", "upload",
+          "total")
+QUANTILES = (0.5, 0.95, 0.99)
+# How often the bot logs the summary line (only when something new was recorded).
+PERF_LOG_INTERVAL = 300.0
+# Filed under this when a request spans several models, or has none.
+NO_MODEL = "-"
+
+_current = contextvars.ContextVar("bot_ross_perf_trace", default=None)
+
+
+class Histogram:
+    def __init__(self, bounds=BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def merge(self, other):
+        """Add `other`'s observations (same bounds) into this histogram."""
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q):
+        """The q-quantile (0-1) estimated from the buckets: linear within the bucket
+        it falls in, never past the largest value seen. None when empty."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            if count and cumulative + count >= rank:
+                lower = self.bounds[i - 1] if i else 0.0
+                upper = self.bounds[i] if i < len(self.bounds) else self.max
+                return min(lower + (upper - lower) * (rank - cumulative) / count, self.max)
+            cumulative += count
+        return self.max
+
+
+class PerfRecorder:
+    def __init__(self, bounds=BUCKETS, log_interval=PERF_LOG_INTERVAL):
+        self.bounds = bounds
+        self.log_interval = log_interval
+        self.histograms = {}  # (stage, command, model) -> Histogram
+        self.observations = 0
+        self._logged = 0
+        self._log_task = None
+
+    def observe(self, stage, seconds, command=NO_MODEL, model=NO_MODEL):
+        key = (stage, command, model)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(self.bounds)
+        histogram.observe(seconds)
+        self.observations += 1
+
+    def names(self):
+        """(commands, models) that have recorded anything."""
+        commands = {command for _, command, _ in self.histograms}
+        models = {model for _, _, model in self.histograms} - {NO_MODEL}
+        return commands, models
+
+    def summary(self, command=None, model=None):
+        """[(stage, Histogram)] in pipeline order, each merged over every command and
+        model -- or only `command`'s / `model`'s, when given."""
+        merged = {}
+        for (stage, hist_command, hist_model), histogram in self.histograms.items():
+            if command is not None and hist_command != command:
+                continue
+            if model is not None and hist_model != model:
+                continue
+            if stage not in merged:
+                merged[stage] = Histogram(self.bounds)
+            merged[stage].merge(histogram)
+        order = {stage: i for i, stage in enumerate(STAGES)}
+        return sorted(merged.items(), key=lambda item: (order.get(item[0], len(STAGES)), item[0]))
+
+    def log_line(self):
+        """One line with every stage's p50/p95/p99, for the periodic log."""
+        parts = [f"{stage} {format_quantiles(histogram)} (n={histogram.count})"
+                 for stage, histogram in self.summary()]
+        return "Stage latency p50/p95/p99: " + (" | ".join(parts) if parts else "nothing recorded yet")
+
+    async def _log_loop(self):
+        while True:
+            await asyncio.sleep(self.log_interval)
+            if self.observations != self._logged:
+                self._logged = self.observations
+                logger.info(self.log_line())
+
+    def start(self):
+        """Start logging log_line() every `log_interval` seconds. Call from inside the
+        running loop (the bot's setup_hook)."""
+        if self._log_task is None:
+            self._log_task = asyncio.get_running_loop().create_task(self._log_loop())
+
+    async def close(self):
+        if self._log_task is not None:
+            self._log_task.cancel()
+            try:
+                await self._log_task
+            except asyncio.CancelledError:
+                pass
+            self._log_task = None
+
+
+class Trace:
+    """One command's stage timings, recorded under its command and model."""
+
+    def __init__(self, recorder, command):
+        self.recorder = recorder
+        self.command = command
+        self.model = None
+        self.started = time.monotonic()
+        self.recorded = 0
+        self._waiting = []  # (stage, seconds) recorded before the model was known
+
+    def set_model(self, model):
+        """File this request's stages (and those waiting) under `model`."""
+        self.model = model
+        waiting, self._waiting = self._waiting, []
+        for stage, seconds in waiting:
+            self.recorder.observe(stage, seconds, self.command, model)
+
+    def record(self, stage, seconds, model=None):
+        """Record a stage's duration. `model` overrides the request's own, for a
+        stage of one model out of several."""
+        model = model or self.model
+        if model is None:
+            self._waiting.append((stage, seconds))
+        else:
+            self.recorder.observe(stage, seconds, self.command, model)
+        self.recorded += 1
+
+    @contextlib.contextmanager
+    def stage(self, name, model=None):
+        """Time the with-block as stage `name`."""
+        t0 = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record(name, time.monotonic() - t0, model)
+
+    def finish(self):
+        """Record the request's total time, if any stage was recorded, and file the
+        stages still waiting for a model under NO_MODEL."""
+        if self.recorded:
+            self.record("total", time.monotonic() - self.started)
+        if self.model is None:
+            self.set_model(NO_MODEL)
+
+
+def begin(recorder, command):
+    """Start tracing the current command (see end())."""
+    trace = Trace(recorder, command)
+    _current.set(trace)
+    return trace
+
+
+def end():
+    """Finish the current command's trace, if any."""
+    trace = _current.get()
+    if trace is not None:
+        _current.set(None)
+        trace.finish()
+
+
+def current():
+    """The current command's Trace, or None outside a traced command."""
+    return _current.get()
+
+
+def stage(name, model=None):
+    """Time a with-block as stage `name` of the current command (no-op if untraced)."""
+    trace = _current.get()
+    return trace.stage(name, model) if trace is not None else contextlib.nullcontext()
+
+
+def record(name, seconds, model=None):
+    """Record a stage of the current command (no-op if untraced)."""
+    trace = _current.get()
+    if trace is not None:
+        trace.record(name, seconds, model)
+
+
+def format_seconds(seconds):
+    if seconds is None:
+        return "—"
+    if seconds < 1:
+        return f"{seconds * 1000:.0f}ms"
+    return f"{seconds:.1f}s"
+
+
+def format_quantiles(histogram, quantiles=QUANTILES):
+    return " / ".join(format_seconds(histogram.quantile(q)) for q in quantiles)
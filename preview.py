@@ -0,0 +1,83 @@
+"""Throttled, latest-wins publishing of partial-image previews.
+
+A streamed generation (see image_stream.ImageEventParser) hands over partial images
+while the model is still working, so the bot can show a rough preview long before
+the final image lands. Posting every frame the moment it arrives would run into
+Discord's message-edit rate limit, and an upload slower than the frames would leave
+the preview lagging behind a backlog of stale ones. PreviewThrottle publishes at
+most one frame per `interval` seconds; a frame offered while another is still
+waiting replaces it (the stale one is closed unsent), so the preview always jumps
+to the newest frame. close() stops it once the final image is in, letting an edit
+already in progress finish so it cannot land on top of the final image.
+
+No Discord/OpenAI/bot side effects -- publishing is a callback. See test_preview.py.
+"""
+
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger("bot_ross.preview")
+
+# Discord allows roughly five message edits per five seconds per channel; a preview
+# every couple of seconds stays well inside that alongside the bot's other messages.
+PREVIEW_INTERVAL = 2.0
+
+
+class PreviewThrottle:
+    def __init__(self, publish, interval=PREVIEW_INTERVAL):
+        self.publish = publish  # async (frame, index); owns (and closes) the frame
+        self.interval = interval
+        self.published = 0
+        self.dropped = 0
+        self._pending = None  # (frame, index) waiting to be published
+        self._task = None
+        self._last = None  # monotonic time the last publish started
+        self._publishing = False
+        self._closed = False
+
+    def offer(self, frame, index=None):
+        """Make `frame` (anything with close(), e.g. a decoded image file) the next
+        preview to publish. Returns immediately; call it on the event loop."""
+        if self._closed:
+            frame.close()
+            return
+        if self._pending is not None:
+            self._pending[0].close()
+            self.dropped += 1
+        self._pending = (frame, index)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._drain())
+
+    async def _drain(self):
+        while self._pending is not None:
+            if self._last is not None:
+                wait = self._last + self.interval - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+            if self._pending is None:
+                return
+            (frame, index), self._pending = self._pending, None
+            self._last = time.monotonic()
+            self._publishing = True
+            try:
+                await self.publish(frame, index)
+                self.published += 1
+            except Exception as e:
+                logger.warning(f"Couldn't publish preview frame {index}: {e}")
+            finally:
+                self._publishing = False
+
+    async def close(self):
+        """Stop publishing: drop the frame still waiting, if any, and wait for a
+        publish already in progress to finish."""
+        self._closed = True
+        if self._pending is not None:
+            self._pending[0].close()
+            self._pending = None
+        task = self._task
+        if task is None:
+            return
+        if not self._publishing:
+            task.cancel()
+        await asyncio.wait([task])
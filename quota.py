@@ -0,0 +1,98 @@
+"""Race-free monthly API quota: reserve a slot before calling OpenAI, then commit
+it on success or release it on failure.
+
+do_the_art used to check `over_limit()` up front but only bump the month's counter
+once the image came back, so N requests arriving at LIMIT-1 could all pass the check
+and all be paid for. MonthlyQuota counts every outstanding reservation against the
+limit as well as the committed requests, and hands out reservations under an asyncio
+lock, so at most LIMIT requests are ever paid for in a month no matter how many run
+at once.
+
+Committed counts live in the shared StatsStore under the "YYYY-MM" key and are
+persisted write-behind with the rest of the counters; pending reservations are
+in-memory only (a restart simply drops them, which can only free up quota).
+
+No Discord/OpenAI side effects. See test_quota.py.
+"""
+
+import asyncio
+from datetime import datetime
+
+
+def current_month():
+    return datetime.now().strftime("%Y-%m")
+
+
+class QuotaExceededError(Exception):
+    """Raised by reserve() when the month's limit is already used or reserved."""
+
+
+class Reservation:
+    """`amount` requests held against `month`'s quota. Exactly one of commit() or
+    release() takes effect; calling either again (or the other one) is a no-op, so
+    callers can release() unconditionally in a `finally`."""
+
+    def __init__(self, quota, month, amount):
+        self.quota = quota
+        self.month = month
+        self.amount = amount
+        self.settled = False
+
+    def commit(self, amount=None):
+        """Count the reserved requests as spent -- or only `amount` of them (e.g. a
+        batch that came back short), handing the rest back. Returns the month's new
+        committed total (or the current one, if this reservation was already
+        settled)."""
+        if self.settled:
+            return self.quota.used(self.month)
+        self.settled = True
+        self.quota._unhold(self.month, self.amount)
+        spent = self.amount if amount is None else min(amount, self.amount)
+        return self.quota.store.increment(self.month, spent)
+
+    def release(self):
+        """Hand the reserved requests back unspent."""
+        if self.settled:
+            return
+        self.settled = True
+        self.quota._unhold(self.month, self.amount)
+
+
+class MonthlyQuota:
+    def __init__(self, store, limit, month=current_month):
+        self.store = store
+        self.limit = limit
+        self._month = month
+        self._pending = {}  # month -> requests reserved but not yet committed/released
+        self._lock = asyncio.Lock()
+
+    def used(self, month=None):
+        """Committed requests for `month` (default: this month)."""
+        return self.store.get(month or self._month(), 0)
+
+    def pending(self, month=None):
+        """Requests reserved for `month` (default: this month) and still in flight."""
+        return self._pending.get(month or self._month(), 0)
+
+    def remaining(self, month=None):
+        month = month or self._month()
+        return max(self.limit - self.used(month) - self.pending(month), 0)
+
+    async def reserve(self, amount=1):
+        """Hold `amount` requests against this month's quota. Raises
+        QuotaExceededError if that would take committed + pending past the limit."""
+        async with self._lock:
+            month = self._month()
+            if amount > self.remaining(month):
+                raise QuotaExceededError(
+                    f"{self.used(month)} used and {self.pending(month)} pending of {self.limit}"
+                )
+            self._pending[month] = self._pending.get(month, 0) + amount
+            return Reservation(self, month, amount)
+
+    def _unhold(self, month, amount):
+        left = self._pending.get(month, 0) - amount
+        if left > 0:
+            self._pending[month] = left
+        else:
+            self._pending.pop(month, None)
@@ -0,0 +1,214 @@
+"""Client-side pacing for OpenAI image requests, driven by the API's own rate-limit
+headers.
+
+Without pacing, a burst of commands is sent as fast as the worker pool allows and
+the API answers the overflow with 429s, which then get retried. The limiter keeps one
+bucket per model (gpt-image-2 and dall-e-3 have separate OpenAI limits) and holds
+each request back *before* it is sent whenever that bucket is empty:
+
+- Each response's x-ratelimit-limit-requests / x-ratelimit-remaining-requests /
+  x-ratelimit-reset-requests headers set the bucket: the remaining count (less any
+  requests still in flight) becomes the available tokens, and the bucket refills to
+  the full limit once the reset interval has passed. Refilling all at once at the
+  reset point, rather than continuously, is conservative for OpenAI's rolling limits
+  and exact for a fixed-window limit.
+- x-ratelimit-remaining-tokens hitting 0 blocks the model until
+  x-ratelimit-reset-tokens elapses.
+- A 429 blocks the model for its retry-after (or the reset interval, if no
+  retry-after was sent).
+- Requests still in flight when a bucket refills may land in either window, so
+  their slots are held back from the refill; each is returned once its response's
+  reset header shows it was counted in the window that already ended, and a
+  response from the new window updates the bucket as usual.
+- Until a model's first response has been seen, its limits are unknown, so only one
+  request at a time is let through to learn them. A model whose responses carry no
+  rate-limit headers at all is not throttled.
+
+No Discord/bot side effects. See test_rate_limit.py.
+"""
+
+import asyncio
+import email.utils
+import re
+import time
+
+DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+# How long to hold a request when we know we must wait but have no better deadline
+# (e.g. a 429 with neither retry-after nor a reset header). Waiters are also woken
+# early whenever a response updates their bucket.
+FALLBACK_WAIT = 1.0
+
+
+def parse_duration(value):
+    """Parse an OpenAI reset header ("1s", "6m0s", "20ms", "1.5s", or bare seconds)
+    into seconds. Returns None if the value is missing or unparseable."""
+    if value is None:
+        return None
+    value = value.strip()
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    parts = DURATION_PART.findall(value)
+    if not parts or DURATION_PART.sub("", value):
+        return None
+    return sum(float(n) * DURATION_UNITS[unit] for n, unit in parts)
+
+
+def parse_retry_after(value, now=None):
+    """Parse a Retry-After header (delta-seconds or an HTTP-date) into seconds from
+    now. Returns None if missing or unparseable."""
+    if value is None:
+        return None
+    seconds = parse_duration(value)
+    if seconds is not None:
+        return seconds
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    now = time.time() if now is None else now
+    return max(when.timestamp() - now, 0.0)
+
+
+def _header_int(headers, name):
+    try:
+        return int(headers.get(name))
+    except (TypeError, ValueError):
+        return None
+
+
+class _Bucket:
+    def __init__(self):
+        self.known = False  # seen at least one response for this model
+        self.limit = None  # None once known: responses carry no limits -> unthrottled
+        self.tokens = 0
+        self.reset_at = None
+        self.blocked_until = 0.0
+        self.in_flight = 0
+        self.refills = 0  # bumped each time the bucket refills at reset_at
+        self.refilled_at = 0.0
+        self.window = 0.0  # longest reset interval seen: roughly the window length
+        self.held = 0  # slots kept back at the last refill for requests still in flight
+        self.changed = asyncio.Event()
+
+    def try_take(self, now):
+        """Take a slot and return None, or return how many seconds to wait before
+        trying again."""
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.reset_at is not None and now >= self.reset_at:
+            # Requests sent before the refill may not have reached the server yet
+            # and so may still count against the new window: hold their slots back
+            # until their responses say which window they landed in.
+            self.held = min(self.in_flight, self.limit)
+            self.tokens = self.limit - self.held
+            self.reset_at = None
+            self.refills += 1
+            self.refilled_at = now
+        if not self.known:
+            if self.in_flight:
+                return FALLBACK_WAIT
+        elif self.limit is not None:
+            if self.tokens < 1:
+                return self.reset_at - now if self.reset_at is not None else FALLBACK_WAIT
+            self.tokens -= 1
+        self.in_flight += 1
+        return None
+
+    def notify(self):
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+
+class AdaptiveRateLimiter:
+    def __init__(self):
+        self._buckets = {}
+
+    def _bucket(self, key):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = _Bucket()
+        return bucket
+
+    async def acquire(self, key):
+        """Wait until a request for model `key` may be sent. Every acquire() must be
+        followed by exactly one update() (a response arrived) or release() (the
+        request failed before one did). Returns a stamp to pass back to update()."""
+        bucket = self._bucket(key)
+        while True:
+            delay = bucket.try_take(time.monotonic())
+            if delay is None:
+                return bucket.refills
+            changed = bucket.changed
+            try:
+                await asyncio.wait_for(changed.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    @staticmethod
+    def _landed_before_refill(bucket, now, reset):
+        """Whether a response to a request sent before the bucket's last refill was
+        counted in the window before it. Its reset header says when its window ends:
+        close to the refill for the old window, about a window later for the new."""
+        if reset is None:
+            return True
+        return now + reset < bucket.refilled_at + bucket.window / 2
+
+    def release(self, key, stamp=None):
+        """Give back an acquired slot for a request that never got a response."""
+        bucket = self._bucket(key)
+        bucket.in_flight = max(bucket.in_flight - 1, 0)
+        if stamp is not None and stamp < bucket.refills and bucket.held:
+            bucket.held -= 1
+            bucket.tokens = min(bucket.tokens + 1, bucket.limit)
+        bucket.notify()
+
+    def update(self, key, status, headers, stamp=None):
+        """Feed one response's status and headers back into model `key`'s bucket.
+        `stamp` is what acquire() returned for the request; see _landed_before_refill."""
+        bucket = self._bucket(key)
+        now = time.monotonic()
+        bucket.in_flight = max(bucket.in_flight - 1, 0)
+
+        limit = _header_int(headers, "x-ratelimit-limit-requests")
+        remaining = _header_int(headers, "x-ratelimit-remaining-requests")
+        reset = parse_duration(headers.get("x-ratelimit-reset-requests"))
+        if reset is not None:
+            bucket.window = max(bucket.window, reset)
+        stale = stamp is not None and stamp < bucket.refills
+        was_held = stale and bucket.held > 0
+        if was_held:
+            bucket.held -= 1
+        if stale and self._landed_before_refill(bucket, now, reset):
+            # Its counts describe the window that already ended; applying them
+            # would schedule a second refill. Give back the slot held for it, if
+            # one was: otherwise the server never granted it.
+            if was_held and bucket.limit is not None:
+                bucket.tokens = min(bucket.tokens + 1, bucket.limit)
+        elif limit is not None and remaining is not None:
+            bucket.known = True
+            bucket.limit = limit
+            # Requests still in flight may not be counted in `remaining` yet.
+            bucket.tokens = max(remaining - bucket.in_flight, 0)
+            if remaining < limit:
+                bucket.reset_at = now + (reset if reset is not None else FALLBACK_WAIT)
+            else:
+                bucket.reset_at = None
+        elif not bucket.known:
+            bucket.known = True
+            bucket.limit = None
+
+        if _header_int(headers, "x-ratelimit-remaining-tokens") == 0:
+            token_reset = parse_duration(headers.get("x-ratelimit-reset-tokens"))
+            bucket.blocked_until = max(bucket.blocked_until, now + (token_reset or FALLBACK_WAIT))
+
+        if status == 429:
+            retry_after = parse_retry_after(headers.get("retry-after"))
+            if retry_after is None:
+                retry_after = reset if reset is not None else FALLBACK_WAIT
+            bucket.blocked_until = max(bucket.blocked_until, now + retry_after)
+            bucket.tokens = 0
+        bucket.notify()
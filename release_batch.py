@@ -0,0 +1,105 @@
+"""Bulk &release_image: mint avatars for a whole list of git hashes in one command.
+
+Minting avatars for a backlog of tags used to take a command per hash, each posting
+its own quote and prompt. `&release_image --batch <hash> <hash> ...` (or a .txt
+attachment of hashes, one per line -- `git rev-list` or `git log --oneline` output)
+builds every prompt in one go (release_image.build_release_prompts), folds inputs
+that come out as the same prompt into one painting, and paints the rest
+concurrently through the bot's generation queue. fan_out_bounded() keeps at most as
+many of a batch's paintings in the queue as it has workers, so a batch runs as fast
+as the API allows without filling the queue for everyone else. The results are
+posted as a gallery of numbered pages.
+
+No Discord/OpenAI/bot side effects. See test_release_batch.py.
+"""
+
+import asyncio
+import re
+
+import compare
+
+BATCH_FLAG = re.compile(r"(?<!\S)--batch(?!\S)", re.IGNORECASE)
+# More than this many inputs in one batch is turned away.
+MAX_SOURCES = 100
+# A hash-list attachment larger than this isn't read.
+MAX_FILE_BYTES = 64 * 1024
+# Longer inputs are cut to this in the gallery captions.
+SOURCE_LABEL_CHARS = 40
+
+
+class Entry:
+    """One distinct prompt of a batch: every input (`sources`, in the order given,
+    without repeats) that builds it, and the seed of each."""
+
+    def __init__(self, prompt, version):
+        self.prompt = prompt
+        self.version = version
+        self.sources = []
+        self.seeds = []
+
+
+def parse_batch_flag(text):
+    """Strip a `--batch` flag from command text. Returns (remaining text, batch)."""
+    stripped, count = BATCH_FLAG.subn("", text)
+    return " ".join(stripped.split()), bool(count)
+
+
+def is_hash_list(filename, content_type):
+    """Whether an attachment looks like a list of hashes to read."""
+    return (content_type or "").startswith("text/plain") or filename.lower().endswith(".txt")
+
+
+def sources_from_file(text):
+    """The inputs in a hash-list file: the first word of every line that isn't blank
+    or a # comment."""
+    sources = []
+    for line in text.splitlines():
+        words = line.split()
+        if words and not words[0].startswith("#"):
+            sources.append(words[0])
+    return sources
+
+
+def group_by_prompt(sources, built):
+    """Fold `sources` and their build_release_prompts() results into one Entry per
+    distinct prompt, in the order each prompt first appears."""
+    entries = {}
+    for source, (prompt, seed, version) in zip(sources, built):
+        entry = entries.get(prompt)
+        if entry is None:
+            entry = entries[prompt] = Entry(prompt, version)
+        if source not in entry.sources:
+            entry.sources.append(source)
+            entry.seeds.append(seed)
+    return list(entries.values())
+
+
+def source_label(source):
+    """`source` for a gallery caption, cut to SOURCE_LABEL_CHARS."""
+    if len(source) <= SOURCE_LABEL_CHARS:
+        return source
+    return source[:SOURCE_LABEL_CHARS - 1] + "…"
+
+
+def caption(number, entry, note=None):
+    """One gallery line: the painting's number, its first input and seed, any other
+    inputs that build the same prompt, and `note` (e.g. "from the cache")."""
+    line = f"{number}. `{source_label(entry.sources[0])}` seed {entry.seeds[0]}"
+    if len(entry.sources) > 1:
+        others = ", ".join(f"`{source_label(source)}`" for source in entry.sources[1:])
+        line += f" (also {others})"
+    if note:
+        line += f" — {note}"
+    return line
+
+
+async def fan_out_bounded(names, render, limit):
+    """compare.fan_out, with at most `limit` renders running at once: an Outcome per
+    name, in the order given. Each Outcome's `seconds` includes the wait for a turn."""
+    semaphore = asyncio.Semaphore(limit)
+
+    async def bounded(name):
+        async with semaphore:
+            return await render(name)
+
+    return await compare.fan_out(names, bounded)
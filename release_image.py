@@ -15,32 +15,168 @@ possible outputs, so such a change must ship as a NEW version while old versions
 retained. Selection folds the version into the hash key so the same input yields
 different picks per version. Unlike the magic library, this file is static content and
 is never copied onto the data/ volume.
+
+Each version is compiled once, on first use, into a ReleaseAlgorithm (word lists as
+tuples, templates pre-split for %-formatting); build_release_prompts() runs one over
+a whole batch of inputs.
 """
 
+import collections.abc
 import hashlib
 import json
 import os
 import re
+import string
+import struct
 
 # Static, read-only artifact shipped in the image. Resolve relative to this file (not
 # the cwd) so it loads whether run from /app in Docker or from the repo root in tests.
 RELEASE_ALGORITHMS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "release_algorithms.json")
 
+# How a version turns an input into one index per category (its optional "picks" key):
+#   "category" (the default, v1): one sha256 per category, keyed by input, version and
+#     category name -- see _release_index.
+#   "digest": one shake_256 digest per input, keyed by input and version, cut into
+#     SLICE_BYTES-byte slices, one per category in `categories` order. A single hash
+#     instead of one per category, so it's the scheme for new versions.
+PICKS_PER_CATEGORY = "category"
+PICKS_DIGEST = "digest"
+SLICE_BYTES = 8
+
 
 def load_release_algorithms(path=RELEASE_ALGORITHMS_FILE):
-    """Read and return the versioned algorithm artifact as a dict keyed by version string."""
+    """Read and return the versioned algorithm artifact as a dict keyed by version string.
+
+    A version with "extends": "N" starts from the fields of version N (listed earlier
+    in the file) and overrides the ones it gives, so a version that only changes how
+    picks are made doesn't repeat the word lists. Safe because a released version is
+    never edited, so neither is anything built on it."""
     with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+        raw = json.load(f)
+    algorithms = {}
+    for version, spec in raw.items():
+        if "extends" in spec:
+            spec = {**algorithms[spec["extends"]], **{k: v for k, v in spec.items() if k != "extends"}}
+        algorithms[version] = spec
+    return algorithms
+
+
+def _positional(template, names):
+    """`template`'s {name} fields as a %-format string, plus the index into `names` of
+    each field in order -- so filling it is one `%` with a tuple, not a str.format
+    parsing the template and looking every field up by keyword."""
+    parts, fields = [], []
+    for literal, name, _, _ in string.Formatter().parse(template):
+        parts.append(literal.replace("%", "%%"))
+        if name is not None:
+            parts.append("%s")
+            fields.append(names.index(name))
+    return "".join(parts), tuple(fields)
+
+
+class ReleaseAlgorithm:
+    """One version compiled for building prompts: categories and word lists as tuples,
+    the templates pre-split (see _positional), and the digest layout for "digest"
+    picks. build() and build_many() are the pure function of (input, algorithm)."""
+
+    def __init__(self, version, spec):
+        self.version = version
+        self.categories = tuple(spec["categories"])
+        self.word_lists = tuple(tuple(spec["word_lists"][category]) for category in self.categories)
+        self.sizes = tuple(len(word_list) for word_list in self.word_lists)
+        self.picks = spec.get("picks", PICKS_PER_CATEGORY)
+        if self.picks not in (PICKS_PER_CATEGORY, PICKS_DIGEST):
+            raise ValueError(f"v{version}: unknown picks {self.picks!r}")
+        self.template, self.fields = _positional(spec["template"], self.categories)
+        self.georgify_template, _ = _positional(spec["georgify_template"], ("subject",))
+        self.subject = self.categories.index("subject")
+        self._slices = struct.Struct(f">{len(self.categories)}Q")  # big-endian, SLICE_BYTES each
+
+    def indices(self, source):
+        """The index into each category's word list (in `categories` order) for `source`."""
+        source = source.strip()
+        if self.picks == PICKS_PER_CATEGORY:
+            return tuple(_release_index(source, self.version, category, size)
+                         for category, size in zip(self.categories, self.sizes))
+        digest = hashlib.shake_256(f"{source}|{self.version}".encode("utf-8")).digest(self._slices.size)
+        return tuple(n % size for n, size in zip(self._slices.unpack(digest), self.sizes))
+
+    def build(self, source, georgify=False):
+        """The prompt for `source`."""
+        words = [word_list[i] for word_list, i in zip(self.word_lists, self.indices(source))]
+        if georgify:
+            words[self.subject] = self.georgify_template % words[self.subject]
+        return self.template % tuple(words[i] for i in self.fields)
+
+    def build_many(self, sources, georgify=False):
+        """[build(source, georgify)] for every source, with the per-call lookups hoisted
+        out of the loop."""
+        word_lists, fields, template = self.word_lists, self.fields, self.template
+        subject, georgify_template = self.subject, self.georgify_template
+        indices = self.indices
+        prompts = []
+        for source in sources:
+            words = [word_list[i] for word_list, i in zip(word_lists, indices(source))]
+            if georgify:
+                words[subject] = georgify_template % words[subject]
+            prompts.append(template % tuple(words[i] for i in fields))
+        return prompts
+
+
+class _LazyAlgorithms(collections.abc.Mapping):
+    """The artifact as a read-only mapping, read and parsed on first use rather than at
+    import, so importing this module (and the bot with it) costs no file I/O. Keeps the
+    version index, and each version compiled the first time it's asked for."""
+
+    def __init__(self, path=RELEASE_ALGORITHMS_FILE):
+        self.path = path
+        self._algorithms = None
+        self._versions = None
+        self._compiled = {}
+
+    def _load(self):
+        if self._algorithms is None:
+            algorithms = load_release_algorithms(self.path)
+            self._versions = tuple(sorted(algorithms, key=int))
+            self._algorithms = algorithms
+        return self._algorithms
 
+    @property
+    def versions(self):
+        """Every version string, oldest first."""
+        self._load()
+        return self._versions
 
-# Loaded once at import. Safe: this is pure file I/O with no bot side effects.
-RELEASE_ALGORITHMS = load_release_algorithms()
+    def compiled(self, version):
+        """`version`'s ReleaseAlgorithm. Raises KeyError for an unknown version."""
+        algorithm = self._compiled.get(version)
+        if algorithm is None:
+            algorithm = self._compiled[version] = ReleaseAlgorithm(version, self._load()[version])
+        return algorithm
+
+    def __getitem__(self, version):
+        return self._load()[version]
+
+    def __iter__(self):
+        return iter(self._load())
+
+    def __len__(self):
+        return len(self._load())
+
+
+RELEASE_ALGORITHMS = _LazyAlgorithms()
+
+
+def release_versions(algorithms=None):
+    """Every version string, oldest first."""
+    if algorithms is None:
+        return RELEASE_ALGORITHMS.versions
+    return tuple(sorted(algorithms, key=int))
 
 
 def latest_version(algorithms=None):
     """Return the highest numeric version key (as a string)."""
-    algorithms = RELEASE_ALGORITHMS if algorithms is None else algorithms
-    return max(algorithms, key=lambda v: int(v))
+    return release_versions(algorithms)[-1]
 
 
 def get_release_algorithm(version=None, algorithms=None):
@@ -55,13 +191,24 @@ def get_release_algorithm(version=None, algorithms=None):
     return version, algorithms[version]
 
 
+def compile_release_algorithm(version=None, algorithms=None):
+    """The ReleaseAlgorithm for the requested version (default: the latest), compiled
+    once per process for the shipped artifact. Raises KeyError for an unknown version."""
+    if algorithms is None:
+        version = latest_version() if version is None else str(version)
+        return RELEASE_ALGORITHMS.compiled(version)
+    version, algo = get_release_algorithm(version, algorithms)
+    return ReleaseAlgorithm(version, algo)
+
+
 def release_seed(source):
     """The short public seed shown to users: first 8 hex chars of sha256(normalized input)."""
     return hashlib.sha256(source.strip().encode("utf-8")).hexdigest()[:8]
 
 
 def _release_index(source, version, category, n):
-    """Deterministically map (input, version, category) to an index in [0, n).
+    """Deterministically map (input, version, category) to an index in [0, n), for
+    versions with "category" picks.
 
     Hashing each category with its own name keeps categories independent -- adding or
     reordering categories, or editing one word list, won't shift another category's
@@ -72,6 +219,12 @@ def _release_index(source, version, category, n):
     return int.from_bytes(hashlib.sha256(key).digest()[:8], "big") % n
 
 
+def release_indices(source, version=None, algorithms=None):
+    """{category: index into its word list} for `source` under the requested version."""
+    algorithm = compile_release_algorithm(version, algorithms)
+    return dict(zip(algorithm.categories, algorithm.indices(source)))
+
+
 def parse_release_args(args):
     """Split raw command args into (source, version, georgify).
 
@@ -111,13 +264,15 @@ def build_release_prompt(source, version=None, georgify=False, algorithms=None):
     Returns (prompt, seed, version_used). Pure function -- this is the unit of testing.
     Raises KeyError if `version` is not a known algorithm version.
     """
-    version_used, algo = get_release_algorithm(version, algorithms)
-    word_lists = algo["word_lists"]
-    picks = {
-        category: word_lists[category][_release_index(source, version_used, category, len(word_lists[category]))]
-        for category in algo["categories"]
-    }
-    if georgify:
-        picks["subject"] = algo["georgify_template"].format(subject=picks["subject"])
-    prompt = algo["template"].format(**picks)
-    return prompt, release_seed(source), version_used
+    algorithm = compile_release_algorithm(version, algorithms)
+    return algorithm.build(source, georgify), release_seed(source), algorithm.version
+
+
+def build_release_prompts(sources, version=None, georgify=False, algorithms=None):
+    """build_release_prompt for many inputs at once (a whole release history, say):
+    [(prompt, seed, version_used)] in the order of `sources`, compiling the version
+    once. Raises KeyError if `version` is not a known algorithm version."""
+    sources = list(sources)
+    algorithm = compile_release_algorithm(version, algorithms)
+    prompts = algorithm.build_many(sources, georgify)
+    return [(prompt, release_seed(source), algorithm.version) for prompt, source in zip(prompts, sources)]
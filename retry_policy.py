@@ -0,0 +1,94 @@
+"""Retry policy for OpenAI image requests: exponential backoff with full jitter,
+Retry-After, a per-request deadline, and a global retry budget.
+
+The image calls used to retry exactly once after a flat 5s sleep -- too slow for a
+blip of 500s, too aggressive for a sustained 429 storm. A RetryPolicy describes how
+one request may be retried; each request gets its own RetryTracker from
+`policy.start()`, which decides whether (and how long to wait before) the next
+attempt, and records how many attempts were made and how long was spent backing off
+so bot_ross.py can surface them in &stats.
+
+The RetryBudget is shared by every request: each request deposits a fraction of a
+retry into it and each retry withdraws a whole one, so during an outage retries can
+add at most roughly `ratio` extra load instead of multiplying it.
+
+No Discord/OpenAI side effects. See test_retry_policy.py.
+"""
+
+import random
+import time
+
+
+class RetryBudget:
+    """Token bucket shared across requests. Starts full at `capacity`; every request
+    deposits `ratio` (never above `capacity`), every retry needs one whole token."""
+
+    def __init__(self, ratio=0.2, capacity=10.0):
+        self.ratio = ratio
+        self.capacity = capacity
+        self.balance = capacity
+
+    def deposit(self):
+        self.balance = min(self.balance + self.ratio, self.capacity)
+
+    def try_spend(self):
+        if self.balance < 1.0:
+            return False
+        self.balance -= 1.0
+        return True
+
+
+class RetryPolicy:
+    def __init__(self, max_attempts=4, base_delay=1.0, max_delay=30.0, deadline=300.0, budget=None,
+                 rng=random.random):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.budget = budget if budget is not None else RetryBudget()
+        self.rng = rng
+
+    def backoff(self, retry_number, retry_after=None):
+        """Seconds to wait before retry `retry_number` (1 for the first retry): a
+        uniformly random wait in [0, min(max_delay, base_delay * 2**(n-1))], but
+        never less than the server's Retry-After."""
+        ceiling = min(self.max_delay, self.base_delay * (2 ** (retry_number - 1)))
+        delay = self.rng() * ceiling
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def start(self):
+        """Begin tracking one request (counts as its first attempt)."""
+        self.budget.deposit()
+        return RetryTracker(self)
+
+
+class RetryTracker:
+    """Per-request retry bookkeeping: `attempts` made so far and `backoff` seconds
+    spent (or about to be spent) sleeping between them."""
+
+    def __init__(self, policy):
+        self.policy = policy
+        self.started = time.monotonic()
+        self.attempts = 1
+        self.backoff = 0.0
+
+    def remaining(self):
+        """Seconds left before this request's deadline."""
+        return max(self.policy.deadline - (time.monotonic() - self.started), 0.0)
+
+    def next_delay(self, retry_after=None):
+        """Decide on another attempt after a retryable failure. Returns the seconds
+        to sleep first, or None when the request must give up: attempts are used
+        up, the wait would overrun the deadline, or the shared budget is empty."""
+        if self.attempts >= self.policy.max_attempts:
+            return None
+        delay = self.policy.backoff(self.attempts, retry_after)
+        if delay >= self.remaining():
+            return None
+        if not self.policy.budget.try_spend():
+            return None
+        self.attempts += 1
+        self.backoff += delay
+        return delay
@@ -0,0 +1,76 @@
+"""Single-flight de-duplication of identical in-flight work.
+
+When several people fire the same deterministic request within seconds (the same
+`&release_image <hash>`, say), each used to make its own OpenAI call and spend its
+own monthly slot. SingleFlight.run(key, fn) runs fn() for the first caller with a
+given key (the leader); anyone who asks for the same key while that call is still
+running (a follower) waits for the leader's result instead of starting another.
+The key is forgotten as soon as the call finishes, so this only merges requests
+that overlap -- it is not a cache (see image_cache.py for that).
+
+Results that a caller consumes -- an open image file, say -- cannot simply be
+handed to everyone: pass `share`, and each follower gets share(result) instead,
+made before the leader's run() returns (while the leader still owns the
+original). A failure reaches every caller as the same exception; if the leader is
+cancelled, so are its followers.
+
+No Discord/OpenAI/bot side effects. See test_singleflight.py.
+"""
+
+import asyncio
+
+
+class SingleFlight:
+    def __init__(self):
+        self._flights = {}  # key -> futures of the followers waiting on it
+
+    def __contains__(self, key):
+        """Whether a call for `key` is running now, i.e. run(key, ...) would follow."""
+        return key in self._flights
+
+    def __len__(self):
+        return len(self._flights)
+
+    def follow(self, key):
+        """If a call for `key` is running, join it: returns a future for its result
+        (passed through the leader's `share`). Otherwise None. Joining is immediate,
+        so a caller can do other awaits (e.g. tell the user) before awaiting the
+        future without missing the result."""
+        followers = self._flights.get(key)
+        if followers is None:
+            return None
+        waiter = asyncio.get_running_loop().create_future()
+        followers.append(waiter)
+        return waiter
+
+    async def run(self, key, fn, share=None):
+        """Return `await fn()`, or, if a call for `key` is already running, that
+        call's result (passed through its leader's `share`, when given). A follower
+        that is cancelled stops waiting without affecting the leader or anyone else."""
+        waiter = self.follow(key)
+        if waiter is not None:
+            return await waiter
+
+        followers = self._flights[key] = []
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            del self._flights[key]
+            for waiter in followers:
+                waiter.cancel()
+            raise
+        except BaseException as e:
+            del self._flights[key]
+            for waiter in followers:
+                if not waiter.done():
+                    waiter.set_exception(e)
+            raise
+        del self._flights[key]
+        for waiter in followers:
+            if waiter.done():
+                continue
+            try:
+                waiter.set_result(share(result) if share is not None else result)
+            except Exception as e:
+                waiter.set_exception(e)
+        return result
@@ -0,0 +1,126 @@
+"""Streamed ingestion of Discord image attachments for &remix.
+
+&remix used to `await a.read()` every attachment (the command message's and the
+replied-to message's) one after another, holding every image fully in memory, and
+the edits request then copied those bytes into a fresh multipart form on every retry
+attempt.
+
+fetch_attachments() downloads all of them concurrently over the shared pooled
+session, streaming each body into an ImageSpool (see image_stream.py: in memory up to
+1 MiB, a temp file beyond) and refusing anything over the size cap -- up front from
+Discord's reported size, and again while streaming in case that was wrong. The
+SpooledAttachments it returns are sent to /v1/images/edits as ReplayablePart
+multipart parts, which stream straight from the spool and can be rebuilt for every
+retry attempt without re-reading the image into memory. Remix latency and memory
+thus scale with the largest image rather than the sum of all of them.
+
+No Discord/bot side effects -- sources are plain (url, content_type, size) tuples.
+See test_spooled_attachments.py.
+"""
+
+import asyncio
+
+from aiohttp import payload
+
+from image_stream import READ_CHUNK_BYTES, ImageSpool
+
+# Largest single image &remix accepts (OpenAI's edits endpoint takes up to 50 MB
+# per image; anything near that is slow to upload and rarely intended).
+MAX_ATTACHMENT_BYTES = 25 * 1024 * 1024
+
+
+class AttachmentTooLargeError(Exception):
+    """An attachment is bigger than the cap. `size` is what was known when it was
+    refused (the declared size, or how much had been read so far)."""
+
+    def __init__(self, url, size, limit):
+        super().__init__(f"attachment is over {limit // (1024 * 1024)} MB")
+        self.url = url
+        self.size = size
+        self.limit = limit
+
+
+class SpooledAttachment:
+    """One downloaded image: `file` holds `size` bytes of `content_type`."""
+
+    def __init__(self, file, content_type, size):
+        self.file = file
+        self.content_type = content_type
+        self.size = size
+
+    def close(self):
+        self.file.close()
+
+
+async def spool_attachment(session, url, content_type, declared_size=None, max_bytes=MAX_ATTACHMENT_BYTES):
+    """Stream one attachment into a spool. Raises AttachmentTooLargeError without
+    downloading if `declared_size` is over `max_bytes`, or as soon as the body
+    passes it; aiohttp.ClientResponseError on a non-2xx."""
+    if declared_size is not None and declared_size > max_bytes:
+        raise AttachmentTooLargeError(url, declared_size, max_bytes)
+    spool = ImageSpool()
+    try:
+        async with session.get(url) as response:
+            response.raise_for_status()
+            async for chunk in response.content.iter_chunked(READ_CHUNK_BYTES):
+                if spool.size + len(chunk) > max_bytes:
+                    raise AttachmentTooLargeError(url, spool.size + len(chunk), max_bytes)
+                spool.write(chunk)
+    except BaseException:
+        spool.close()
+        raise
+    return SpooledAttachment(spool.finish(), content_type, spool.size)
+
+
+async def fetch_attachments(session, sources, max_bytes=MAX_ATTACHMENT_BYTES):
+    """Download every (url, content_type, declared_size) in `sources` concurrently.
+    Returns SpooledAttachments in the same order, which the caller must close. If
+    any download fails, the others are cancelled or closed and the first error is
+    raised."""
+    tasks = [asyncio.ensure_future(spool_attachment(session, url, content_type, size, max_bytes))
+             for url, content_type, size in sources]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        for result in results:
+            if isinstance(result, SpooledAttachment):
+                result.close()
+        raise
+    return [task.result() for task in tasks]
+
+
+class ReplayablePart(payload.Payload):
+    """A multipart part streamed from a seekable file without consuming it.
+
+    aiohttp's own file payloads read from the file's current position and close it
+    when done, so a retried request would find it empty or closed. This part reads
+    from the start on every write and leaves the file open, so a fresh part can be
+    built from the same spool for each attempt. Its size is known up front, so the
+    request still goes out with a Content-Length rather than chunked."""
+
+    def __init__(self, file, size, **kwargs):
+        super().__init__(file, **kwargs)
+        self._size = size
+
+    async def write(self, writer):
+        self._value.seek(0)
+        while True:
+            chunk = self._value.read(READ_CHUNK_BYTES)
+            if not chunk:
+                break
+            await writer.write(chunk)
+
+
+def part_for(data, content_type, filename):
+    """The multipart value for one edits image: raw bytes as-is, or a ReplayablePart
+    over a file (e.g. SpooledAttachment.file)."""
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return data
+    data.seek(0, 2)
+    size = data.tell()
+    data.seek(0)
+    return ReplayablePart(data, size, content_type=content_type, filename=filename)
+
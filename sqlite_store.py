@@ -0,0 +1,326 @@
+"""Optional SQLite storage engine for the bot's persistent state.
+
+With the default JSON storage every change rewrites a whole file: the full counter
+snapshot (data/request_data.json, including 'magic_rate_history') on every flush,
+and the full library (data/macros.json, data/magic_prompts.json) on every
+&macro_*/&magic_* edit. With STORAGE_BACKEND=sqlite the same state lives in one
+SQLite database in WAL mode (data/bot_ross.db) as indexed tables:
+
+- counters: one row per counter key, so a flush only upserts the keys that changed.
+- rate_history: one row per magic-rate change.
+- library_entries: one row per library entry, ordered by a REAL position, so
+  appending, editing or removing an entry touches only that row (see save_library;
+  the positions are renumbered only when inserts at one spot run out of room).
+
+Nothing above this module changes shape: StatsStore (stats_store.py) takes a
+SqliteStore as its `db`, and json_library routes a library path's load/save here
+once attach_library() has been called for it, so magic_paint/macros and the
+commands keep calling the same functions.
+
+migrate_from_json() does the one-shot import of the existing JSON files (it is a
+no-op once a migration has been recorded, and the JSON files are left untouched),
+and export_json() writes the same three files back out as a backup that the JSON
+storage can load directly:
+
+    python sqlite_store.py export data/bot_ross.db backups/2026-10-18/
+
+No Discord/OpenAI side effects. See test_sqlite_store.py.
+"""
+
+import argparse
+import difflib
+import json
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+from atomic_write import write_json_atomic
+
+logger = logging.getLogger("bot_ross.sqlite_store")
+
+# The counter key whose value is the rate-change list; stored in its own table.
+HISTORY_KEY = "magic_rate_history"
+
+# File names export_json() writes, matching the JSON storage's data/ layout.
+EXPORT_FILES = {"magic": "magic_prompts.json", "macro": "macros.json"}
+EXPORT_COUNTERS_FILE = "request_data.json"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS counters (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rate_history (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    entry TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS library_entries (
+    row_id INTEGER PRIMARY KEY,
+    library TEXT NOT NULL,
+    position REAL NOT NULL,
+    entry_id TEXT,
+    entry TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS library_entries_order ON library_entries (library, position);
+CREATE INDEX IF NOT EXISTS library_entries_id ON library_entries (library, entry_id);
+"""
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _entry_id(entry):
+    if isinstance(entry, dict) and isinstance(entry.get("id"), str):
+        return entry["id"]
+    return None
+
+
+class SqliteStore:
+    """One connection to the database, shared by the event loop and StatsStore's
+    flush thread (every call holds `_lock`)."""
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # WAL + NORMAL: a commit survives an application crash; only an OS crash
+        # can lose the last few commits, and never corrupts the database.
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._versions = {}  # library -> saves made through this connection
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _transaction(self):
+        return _Transaction(self._conn)
+
+    # --- Counters (StatsStore) ----------------------------------------------------
+
+    def load_counters(self):
+        """Every counter as the dict StatsStore keeps in memory, with the rate
+        history (if any) under HISTORY_KEY."""
+        with self._lock:
+            data = {key: json.loads(value) for key, value in self._conn.execute("SELECT key, value FROM counters")}
+            history = [json.loads(entry) for (entry,) in
+                       self._conn.execute("SELECT entry FROM rate_history ORDER BY seq")]
+        if history:
+            data[HISTORY_KEY] = history
+        return data
+
+    def write_counters(self, changes):
+        """Upsert the counters in `changes` (key -> new value) in one transaction.
+        A HISTORY_KEY list is diffed against the stored rows: new entries are
+        appended and dropped ones deleted, rather than rewriting the table."""
+        with self._lock, self._transaction():
+            for key, value in changes.items():
+                if key == HISTORY_KEY:
+                    self._write_history(value)
+                else:
+                    self._conn.execute(
+                        "INSERT INTO counters (key, value) VALUES (?, ?) "
+                        "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                        (key, _dumps(value)),
+                    )
+
+    def _write_history(self, history):
+        rows = list(self._conn.execute("SELECT seq, entry FROM rate_history ORDER BY seq"))
+        stored = [entry for _, entry in rows]
+        wanted = [_dumps(entry) for entry in history]
+        # Usual case: the list was trimmed from the front and appended to the back.
+        # Keep the longest stored suffix that the new list starts with.
+        keep = 0
+        for k in range(min(len(stored), len(wanted)), 0, -1):
+            if stored[-k:] == wanted[:k]:
+                keep = k
+                break
+        for seq, _ in rows[:len(rows) - keep]:
+            self._conn.execute("DELETE FROM rate_history WHERE seq = ?", (seq,))
+        for entry in wanted[keep:]:
+            self._conn.execute("INSERT INTO rate_history (entry) VALUES (?)", (entry,))
+
+    # --- Libraries (json_library) ----------------------------------------------
+
+    def load_library(self, library):
+        with self._lock:
+            return [json.loads(entry) for (entry,) in self._conn.execute(
+                "SELECT entry FROM library_entries WHERE library = ? ORDER BY position", (library,))]
+
+    def save_library(self, library, entries):
+        """Make `library` hold exactly `entries`, in order, touching only the rows
+        that differ: the stored and new lists are diffed, matching runs are left
+        alone, and inserted entries get a position between their neighbours. Once
+        repeated inserts at one spot leave no float between two neighbours, the
+        library's positions are renumbered 1, 2, 3, ... in the same save."""
+        wanted = [_dumps(entry) for entry in entries]
+        with self._lock, self._transaction():
+            rows = list(self._conn.execute(
+                "SELECT row_id, position, entry FROM library_entries WHERE library = ? ORDER BY position",
+                (library,)))
+            stored = [entry for _, _, entry in rows]
+            matcher = difflib.SequenceMatcher(None, stored, wanted, autojunk=False)
+            order = []  # row_id of every entry, in the new order
+            renumber = False
+            for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+                if tag == "equal":
+                    order.extend(row_id for row_id, _, _ in rows[i1:i2])
+                    continue
+                # Overwrite rows pairwise, then delete or insert the leftover.
+                paired = min(i2 - i1, j2 - j1)
+                for offset in range(paired):
+                    row_id = rows[i1 + offset][0]
+                    entry = entries[j1 + offset]
+                    self._conn.execute("UPDATE library_entries SET entry_id = ?, entry = ? WHERE row_id = ?",
+                                       (_entry_id(entry), wanted[j1 + offset], row_id))
+                    order.append(row_id)
+                for row_id, _, _ in rows[i1 + paired:i2]:
+                    self._conn.execute("DELETE FROM library_entries WHERE row_id = ?", (row_id,))
+                inserts = range(j1 + paired, j2)
+                if inserts:
+                    low = rows[i1 + paired - 1][1] if i1 + paired > 0 else None
+                    high = rows[i2][1] if i2 < len(rows) else None
+                    positions = [_between(low, high, n, len(inserts)) for n in range(1, len(inserts) + 1)]
+                    bounds = [p for p in [low, *positions, high] if p is not None]
+                    if any(a >= b for a, b in zip(bounds, bounds[1:])):
+                        renumber = True  # the gap has run out of floats
+                    for position, j in zip(positions, inserts):
+                        cursor = self._conn.execute(
+                            "INSERT INTO library_entries (library, position, entry_id, entry) VALUES (?, ?, ?, ?)",
+                            (library, position, _entry_id(entries[j]), wanted[j]))
+                        order.append(cursor.lastrowid)
+            if renumber:
+                self._conn.executemany("UPDATE library_entries SET position = ? WHERE row_id = ?",
+                                       [(float(n), row_id) for n, row_id in enumerate(order, start=1)])
+            self._versions[library] = self._versions.get(library, 0) + 1
+
+    def library_version(self, library):
+        """Changes whenever `library` may have changed: a save through this store,
+        or a commit by any other connection to the database."""
+        with self._lock:
+            (data_version,) = self._conn.execute("PRAGMA data_version").fetchone()
+        return (data_version, self._versions.get(library, 0))
+
+    # --- Migration and backup ------------------------------------------------------
+
+    def _meta(self, key):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def migrate_from_json(self, counters_path, library_paths):
+        """One-shot import of the JSON storage: the counters file at
+        `counters_path` and each {library: path} in `library_paths`. Runs only if
+        no migration has been recorded yet; returns True if it ran. Missing files
+        import as empty. The JSON files themselves are not modified."""
+        with self._lock:
+            if self._meta("migrated_at") is not None:
+                return False
+        counters = _read_json(counters_path, dict, {})
+        libraries = {library: _read_json(path, list, []) for library, path in library_paths.items()}
+        self.write_counters(counters)
+        for library, entries in libraries.items():
+            self.save_library(library, entries)
+        with self._lock:
+            self._conn.execute("INSERT INTO meta (key, value) VALUES ('migrated_at', ?)",
+                               (datetime.now(timezone.utc).isoformat(),))
+        logger.info(f"Migrated {len(counters)} counters and "
+                    + ", ".join(f"{len(e)} {library} entries" for library, e in libraries.items())
+                    + f" into {self.path}.")
+        return True
+
+    def export_json(self, directory):
+        """Write the counters and every library under `directory` in the JSON
+        storage's format (request_data.json, macros.json, magic_prompts.json),
+        atomically. Returns the paths written."""
+        os.makedirs(directory, exist_ok=True)
+        written = []
+        path = os.path.join(directory, EXPORT_COUNTERS_FILE)
+        write_json_atomic(path, self.load_counters())
+        written.append(path)
+        with self._lock:
+            libraries = [library for (library,) in self._conn.execute(
+                "SELECT DISTINCT library FROM library_entries ORDER BY library")]
+        for library in libraries:
+            path = os.path.join(directory, EXPORT_FILES.get(library, f"{library}.json"))
+            write_json_atomic(path, self.load_library(library), indent=2, ensure_ascii=False)
+            written.append(path)
+        return written
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT (ROLLBACK on error) on an autocommit connection."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type is not None else "COMMIT")
+        return False
+
+
+def _between(low, high, n, count):
+    """Position of the n-th (1-based) of `count` rows inserted between positions
+    `low` and `high` (None: list start / end)."""
+    if low is None and high is None:
+        return float(n)
+    if high is None:
+        return low + n
+    if low is None:
+        return high - (count + 1 - n)
+    return low + (high - low) * n / (count + 1)
+
+
+def _read_json(path, kind, default):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            value = json.load(f)
+    except FileNotFoundError:
+        return default
+    except (OSError, json.JSONDecodeError) as e:
+        logger.error(f"Skipping {path} in migration: {e}")
+        return default
+    if not isinstance(value, kind):
+        logger.error(f"Skipping {path} in migration: not a JSON {kind.__name__}.")
+        return default
+    return value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Back up or migrate Bot Ross's SQLite storage.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="Write the database out as JSON files.")
+    export.add_argument("database")
+    export.add_argument("directory")
+    migrate = sub.add_parser("migrate", help="Import the JSON files from a data/ directory (once).")
+    migrate.add_argument("database")
+    migrate.add_argument("directory")
+    args = parser.parse_args(argv)
+
+    store = SqliteStore(args.database)
+    try:
+        if args.command == "export":
+            for path in store.export_json(args.directory):
+                print(path)
+        else:
+            libraries = {library: os.path.join(args.directory, name) for library, name in EXPORT_FILES.items()}
+            ran = store.migrate_from_json(os.path.join(args.directory, EXPORT_COUNTERS_FILE), libraries)
+            print("migrated" if ran else "already migrated")
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""In-process owner of the persisted request counters (data/request_data.json).
+
+The bot used to re-read and re-serialize the whole file for every counter bump --
+several synchronous round-trips per &paint, racing between concurrent commands.
+StatsStore instead loads the file once, applies every increment/set in memory, and
+writes the full snapshot back behind the hot path: periodically from a background
+task, and once more at shutdown. Each write is atomic (see atomic_write.py), so a
+crash mid-flush leaves the previous snapshot intact.
+
+The keys are whatever bot_ross.py stores: a "YYYY-MM" monthly request count plus
+'memes', 'safety_trips', 'magic', 'remixes', 'release_images', 'comparisons',
+'cache_hits', 'shared_paintings', 'macros', 'macro_misses' and the
+'magic_rate_history' list. No Discord/OpenAI side effects.
+
+Given a `db` (a sqlite_store.SqliteStore, STORAGE_BACKEND=sqlite) the counters are
+loaded from and flushed to its tables instead of the file, and a flush only writes
+the keys that changed since the last one.
+"""
+
+import asyncio
+import copy
+import json
+import logging
+import os
+
+from atomic_write import write_json_atomic
+
+logger = logging.getLogger("bot_ross.stats_store")
+
+DEFAULT_FLUSH_INTERVAL = 15.0
+
+
+class StatsStore:
+    def __init__(self, path, flush_interval=DEFAULT_FLUSH_INTERVAL, db=None):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.db = db
+        self._data = self._load()
+        self._dirty_keys = set()
+        self._flush_lock = asyncio.Lock()
+        self._flush_task = None
+
+    def _load(self):
+        if self.db is not None:
+            return self.db.load_counters()
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        return {}
+
+    # --- Hot path: pure in-memory, never touches disk ---------------------------
+
+    def get(self, key, default=None):
+        return self._data.get(key, default)
+
+    def increment(self, key, amount=1):
+        """Add `amount` to the integer counter at `key` (created at 0) and return
+        the new value."""
+        self._data[key] = self._data.get(key, 0) + amount
+        self._dirty_keys.add(key)
+        return self._data[key]
+
+    def set(self, key, value):
+        self._data[key] = value
+        self._dirty_keys.add(key)
+
+    def snapshot(self):
+        """A deep copy of every counter, safe to serialize off the event loop while
+        increments keep landing on the live dict."""
+        return copy.deepcopy(self._data)
+
+    @property
+    def dirty(self):
+        return bool(self._dirty_keys)
+
+    def _take_changes(self):
+        """What the next write needs -- the full snapshot for the file, just the
+        changed keys for the database -- and the keys it covers."""
+        keys = self._dirty_keys
+        self._dirty_keys = set()
+        if self.db is not None:
+            return {key: copy.deepcopy(self._data[key]) for key in keys}, keys
+        return self.snapshot(), keys
+
+    def _write(self, changes):
+        if self.db is not None:
+            self.db.write_counters(changes)
+        else:
+            write_json_atomic(self.path, changes)
+
+    # --- Write-behind persistence ------------------------------------------------
+
+    def flush(self):
+        """Synchronously persist the current snapshot if anything changed since the
+        last flush. On a failed write the store stays dirty so the next flush
+        retries -- no increment is dropped."""
+        if not self._dirty_keys:
+            return
+        changes, keys = self._take_changes()
+        try:
+            self._write(changes)
+        except Exception:
+            self._dirty_keys |= keys
+            raise
+
+    async def flush_async(self):
+        """Like flush(), but the file write runs in a worker thread. The snapshot is
+        taken on the event loop, so increments made while the write is in flight
+        simply mark the store dirty again for the next flush."""
+        async with self._flush_lock:
+            if not self._dirty_keys:
+                return
+            changes, keys = self._take_changes()
+            try:
+                await asyncio.to_thread(self._write, changes)
+            except Exception:
+                self._dirty_keys |= keys
+                raise
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush_async()
+            except Exception as e:
+                logger.error(f"Failed to flush stats to {self.path}: {e}")
+
+    def start(self):
+        """Start the periodic background flush. Call from inside the running loop
+        (the bot's setup_hook)."""
+        if self._flush_task is None:
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_loop())
+
+    async def close(self):
+        """Stop the periodic flush and write out anything still pending."""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush_async()
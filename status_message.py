@@ -0,0 +1,111 @@
+"""One status message per image request, edited in place as the request advances.
+
+A &paint used to post a quote, maybe an "expanded prompt" line and a size notice,
+maybe a queue position, then the image, then the revised prompt, then "Generated in
+... | Monthly requests" -- each its own Discord REST call, and each counting against
+the channel's rate limit. StatusMessage collects the informational lines as notes
+instead, posts a single message when the request first has something to show
+(queued, or painting), edits the stage into it as the request advances (streamed
+previews ride along as its attachment, see preview.py), and finish() turns it into
+the result: the notes, the summary and the image in that same message, one edit.
+
+Stage edits are best-effort: one that comes less than `min_interval` after the last
+post or edit is folded into the next one instead of sent, and a failed edit is
+logged rather than failing the painting. finish() always goes out, and once it has,
+later updates are ignored.
+
+No Discord/OpenAI/bot side effects -- posting is a callback, and the message it
+returns only needs an async edit(content=..., attachments=...). See
+test_status_message.py.
+"""
+
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger("bot_ross.status_message")
+
+# Discord's cap on a message's text.
+MESSAGE_LIMIT = 2000
+# Stage edits closer together than this are folded into the next one.
+STATUS_EDIT_INTERVAL = 1.0
+
+
+class StatusMessage:
+    def __init__(self, send, min_interval=STATUS_EDIT_INTERVAL):
+        self._send = send  # async (content, files) -> the posted message
+        self.min_interval = min_interval
+        self.notes = []
+        self.stage = None
+        self.message = None
+        self.calls = 0  # Discord calls made: the post plus every edit
+        self.finished = False
+        self._edited_at = None
+        self._lock = asyncio.Lock()
+        self._background = set()
+
+    def note(self, text):
+        """Add an informational line (a quote, a notice), shown from the next post
+        or edit on."""
+        self.notes.append(text)
+
+    def render(self, tail=None):
+        """The message text: the notes, then `tail` (default: the current stage),
+        with the notes cut short if the whole would pass MESSAGE_LIMIT."""
+        tail = self.stage if tail is None else tail
+        notes = "\n".join(self.notes)
+        if not tail:
+            return notes[:MESSAGE_LIMIT]
+        budget = MESSAGE_LIMIT - len(tail) - 1
+        if len(notes) > budget:
+            notes = (notes[:budget - 1] + "…") if budget > 1 else ""
+        return f"{notes}\n{tail}" if notes else tail[:MESSAGE_LIMIT]
+
+    async def update(self, stage, file=None):
+        """Show `stage` -- and `file` as the attachment, replacing any before it.
+        Posts the message the first time; after that edits it, unless the last
+        call was under min_interval ago and there is no file to show, in which case
+        the stage waits for the next edit. Never raises for a failed edit."""
+        async with self._lock:
+            if self.finished:
+                if file is not None:
+                    file.close()
+                return
+            self.stage = stage
+            now = time.monotonic()
+            try:
+                if self.message is None:
+                    self.message = await self._send(self.render(), [file] if file is not None else [])
+                elif file is not None or now - self._edited_at >= self.min_interval:
+                    edit = {"content": self.render()}
+                    if file is not None:
+                        edit["attachments"] = [file]
+                    await self.message.edit(**edit)
+                else:
+                    return
+            except Exception as e:
+                logger.warning(f"Couldn't update the status message to {stage!r}: {e}")
+                return
+            self.calls += 1
+            self._edited_at = now
+
+    def update_soon(self, stage):
+        """update(stage) without waiting for it, for code that shouldn't be held up
+        by a Discord call (e.g. a generation-queue job)."""
+        task = asyncio.get_running_loop().create_task(self.update(stage))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def finish(self, summary, files=()):
+        """Show the result: the notes and `summary`, with `files` as the
+        attachments (none removes a preview). Edits the status message, or posts
+        it if it never was, in one call either way. Raises what the call raises."""
+        files = list(files)
+        async with self._lock:
+            self.finished = True
+            content = self.render(summary)
+            if self.message is None:
+                self.message = await self._send(content, files)
+            else:
+                await self.message.edit(content=content, attachments=files)
+            self.calls += 1
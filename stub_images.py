@@ -0,0 +1,41 @@
+"""A local stand-in for the OpenAI images API, shared by the tests that need one to
+answer slowly.
+
+SlowImagesStub serves /v1/images/generations on an aiohttp TestServer, holding every
+request until its `release` event is set so a test can look at the bot while calls
+are still under way. Test helper only: not part of the bot, and not copied into the
+image.
+"""
+
+import asyncio
+import base64
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+PNG_BYTES = b"\x89PNG fake image bytes"
+
+
+class SlowImagesStub:
+    """/v1/images/generations that holds each request until `release` is set,
+    recording every request's body. `arrived` is set once the first one comes in."""
+
+    def __init__(self):
+        self.payloads = []
+        self.arrived = asyncio.Event()
+        self.release = asyncio.Event()
+        app = web.Application()
+        app.router.add_post("/v1/images/generations", self.generations)
+        self.server = TestServer(app)
+
+    @property
+    def base_url(self):
+        return str(self.server.make_url("/v1"))
+
+    async def generations(self, request):
+        payload = await request.json()
+        self.payloads.append(payload)
+        self.arrived.set()
+        await self.release.wait()
+        image = base64.b64encode(PNG_BYTES).decode()
+        return web.json_response({"data": [{"b64_json": image}] * payload.get("n", 1)})
@@ -0,0 +1,73 @@
+"""Tests for building the bot with its application factory.
+
+These import bot_ross with no secrets in the environment and build a bot with
+create_bot() in a scratch directory, never connecting to Discord: the import reads no
+files and opens nothing, load_config() parses the environment's settings, create_bot()
+registers every command and applies the settings, and setup_hook() seeds the
+libraries and loads the counters onto data/ before close() writes them back.
+
+Run from the repo root:  python -m unittest test_bot_ross -v
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import bot_ross
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class LoadConfigTest(unittest.TestCase):
+    def test_defaults_and_overrides(self):
+        self.assertEqual(bot_ross.load_config({}), bot_ross._DEFAULTS)
+        config = bot_ross.load_config({"API_LIMIT": "7", "MAGIC_PAINT_RATE": "2", "PREVIEW_PARTIALS": "9",
+                                       "REMIX_PREPROCESS": "off", "STORAGE_BACKEND": "SQLite"})
+        self.assertEqual((config["limit"], config["magic_paint_rate"], config["preview_partials"]), (7, 0.05, 3))
+        self.assertEqual((config["remix_preprocess"], config["storage_backend"]), (False, "sqlite"))
+        self.assertEqual(config["openai_api_key"], "")
+
+    def test_import_opens_nothing(self):
+        # In a fresh interpreter: other tests in this process may have built a bot.
+        check = ("import bot_ross; "
+                 "assert bot_ross.counters is None and bot_ross.openai_api is None; "
+                 "assert bot_ross.release_image.RELEASE_ALGORITHMS._algorithms is None")
+        env = {k: v for k, v in os.environ.items() if k not in ("OPENAI_API_KEY", "DISCORD_BOT_TOKEN")}
+        result = subprocess.run([sys.executable, "-c", check], cwd=REPO_DIR, env=env,
+                                capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+
+class CreateBotTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workdir, ignore_errors=True)
+        for name in (bot_ross.DEFAULT_MAGIC_PROMPTS_FILE, bot_ross.DEFAULT_MACROS_FILE):
+            shutil.copy(os.path.join(REPO_DIR, name), workdir)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(workdir)
+
+    async def test_setup_loads_data_and_close_writes_it_back(self):
+        config = bot_ross.load_config({"API_LIMIT": "12", "PERF_LOG_INTERVAL": "0", "REMIX_PREPROCESS": "0"})
+        bot = bot_ross.create_bot(config)
+        self.assertEqual(bot_ross.LIMIT, 12)
+        self.assertEqual({command.name for command in bot.commands} - {"help"},
+                         {command.name for command in bot_ross.COMMANDS})
+        self.assertIn("paint", {command.name for command in bot_ross.COMMANDS})
+        self.assertFalse(os.path.exists("data"))
+
+        await bot.setup_hook()
+        self.assertTrue(os.path.exists(bot_ross.MAGIC_PROMPTS_FILE))
+        self.assertTrue(os.path.exists(bot_ross.MACROS_FILE))
+        self.assertEqual(bot_ross.monthly_quota.remaining(bot_ross.get_current_month()), 12)
+        self.assertIsNotNone(bot.setup_seconds)
+        bot_ross.counters.increment('memes')
+        await bot.close()
+        self.assertTrue(os.path.exists(bot_ross.DATA_FILE))
+
+
+if __name__ == "__main__":
+    unittest.main()
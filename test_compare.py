@@ -0,0 +1,89 @@
+"""Unit tests for the &compare fan-out.
+
+These exercise compare.py in isolation (no Discord/OpenAI), asserting: --models is
+parsed into the chosen models in order (aliases, case, repeats, unknown names),
+gallery labels name the model and quality, a comparison takes about as long as its
+slowest model rather than the sum, one model failing leaves the others' images
+intact, and through a generation queue with fewer workers than models the quick
+models queue behind the slow ones without adding to the wall time.
+
+Run from the repo root:  python -m unittest test_compare -v
+"""
+
+import asyncio
+import time
+import unittest
+
+from compare import fan_out, model_label, parse_compare_args
+from job_queue import GenerationQueue
+
+CHOICES = {"high": "gpt-image-2", "low": "gpt-image-2-low", "dalle": "dall-e-3", "dall-e-3": "dall-e-3"}
+# Seconds each model takes to render, slowest first (the order &compare runs them in).
+RENDER_SECONDS = {"gpt-image-2": 0.4, "dall-e-3": 0.25, "gpt-image-2-medium": 0.15, "gpt-image-2-low": 0.1}
+
+
+class ParseTest(unittest.TestCase):
+    def test_no_models_flag(self):
+        self.assertEqual(parse_compare_args("a  quiet barn", CHOICES), ("a quiet barn", None))
+
+    def test_models_in_order_without_repeats(self):
+        self.assertEqual(parse_compare_args("a barn --models LOW,dalle,dall-e-3", CHOICES),
+                         ("a barn", ["gpt-image-2-low", "dall-e-3"]))
+        self.assertEqual(parse_compare_args("--models=high a barn", CHOICES), ("a barn", ["gpt-image-2"]))
+
+    def test_unknown_choice_is_named(self):
+        with self.assertRaisesRegex(ValueError, "ultra"):
+            parse_compare_args("a barn --models high,ultra", CHOICES)
+        with self.assertRaises(ValueError):
+            parse_compare_args("a barn --models ,", CHOICES)
+
+    def test_labels(self):
+        self.assertEqual(model_label({"model": "gpt-image-2", "params": {"quality": "low"}}), "gpt-image-2 low")
+        self.assertEqual(model_label({"model": "dall-e-2", "params": {}}), "dall-e-2")
+
+
+async def _render(model):
+    await asyncio.sleep(RENDER_SECONDS[model])
+    return f"painting by {model}"
+
+
+class FanOutTest(unittest.IsolatedAsyncioTestCase):
+    async def test_wall_time_is_the_slowest_model_not_the_sum(self):
+        started = time.monotonic()
+        outcomes = await fan_out(list(RENDER_SECONDS), _render)
+        wall = time.monotonic() - started
+        self.assertEqual([o.result for o in outcomes], [f"painting by {m}" for m in RENDER_SECONDS])
+        self.assertLess(wall, max(RENDER_SECONDS.values()) + 0.1)
+        self.assertLess(wall, sum(RENDER_SECONDS.values()) * 0.6)
+        for outcome in outcomes:
+            self.assertGreaterEqual(outcome.seconds, RENDER_SECONDS[outcome.name] - 0.01)
+
+    async def test_a_failure_stays_with_its_model(self):
+        async def render(model):
+            if model == "dall-e-3":
+                raise ValueError("safety system")
+            return await _render(model)
+
+        outcomes = await fan_out(list(RENDER_SECONDS), render)
+        self.assertEqual([o.ok for o in outcomes], [True, False, True, True])
+        self.assertIsInstance(outcomes[1].error, ValueError)
+
+    async def test_through_a_queue_with_fewer_workers_than_models(self):
+        queue = GenerationQueue(workers=3)
+        queue.start()
+        try:
+            async def render(model):
+                return await queue.submit("one user", lambda: _render(model)).future
+
+            started = time.monotonic()
+            outcomes = await fan_out(list(RENDER_SECONDS), render)
+            wall = time.monotonic() - started
+        finally:
+            await queue.close()
+        self.assertTrue(all(o.ok for o in outcomes))
+        # The fourth model waits for a worker, but finishes inside the slowest one's time.
+        self.assertLess(wall, max(RENDER_SECONDS.values()) + 0.1)
+
+
+if __name__ == "__main__":
+    unittest.main()
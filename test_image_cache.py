@@ -0,0 +1,119 @@
+"""Unit tests for the content-addressed image cache.
+
+These exercise image_cache.py in isolation (no Discord/OpenAI), asserting: the key
+covers every request parameter, an image round-trips byte for byte with its revised
+prompt, eviction drops the least recently used entries once the byte budget is
+exceeded (a hit counts as a use, across restarts too), half-written entries are
+swept on load, and `--fresh` is parsed out of command text.
+
+Run from the repo root:  python -m unittest test_image_cache -v
+"""
+
+import io
+import os
+import tempfile
+import time
+import unittest
+
+from image_cache import ImageCache, cache_key, parse_fresh_flag
+
+
+def _image(n, size=1000):
+    return io.BytesIO(bytes([n % 256]) * size)
+
+
+class KeyTest(unittest.TestCase):
+    def test_every_parameter_is_part_of_the_key(self):
+        base = cache_key("a barn", "gpt-image-2", "1024x1024", "low")
+        self.assertEqual(base, cache_key("a barn", "gpt-image-2", "1024x1024", "low"))
+        variants = [
+            cache_key("a barn!", "gpt-image-2", "1024x1024", "low"),
+            cache_key("a barn", "dall-e-3", "1024x1024", "low"),
+            cache_key("a barn", "gpt-image-2", "1536x1024", "low"),
+            cache_key("a barn", "gpt-image-2", "1024x1024", "high"),
+            cache_key("a barn", "gpt-image-2", "1024x1024", None),
+        ]
+        self.assertEqual(len(set(variants + [base])), 6)
+
+    def test_fresh_flag(self):
+        self.assertEqual(parse_fresh_flag("abc123 --FRESH --george"), ("abc123 --george", True))
+        self.assertEqual(parse_fresh_flag("abc123 --freshness"), ("abc123 --freshness", False))
+
+
+class CacheTest(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.dir = self._dir.name
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def _key(self, n):
+        return cache_key(f"prompt {n}", "gpt-image-2", "1024x1024", "low")
+
+    def test_round_trip_and_rewinds_the_source(self):
+        cache = ImageCache(self.dir)
+        source = _image(7)
+        source.read(10)
+        cache.put(self._key(1), source, "a revised barn", {"prompt": "prompt 1"})
+        self.assertEqual(source.tell(), 0)
+        hit = cache.get(self._key(1))
+        with hit.file:
+            self.assertEqual(hit.file.read(), source.getvalue())
+        self.assertEqual(hit.revised_prompt, "a revised barn")
+        self.assertIsNone(cache.get(self._key(2)))
+
+    def test_least_recently_used_is_evicted_by_bytes(self):
+        cache = ImageCache(self.dir)
+        cache.put(self._key(0), _image(0))
+        entry_bytes = cache.total_bytes
+        cache.max_bytes = 3 * entry_bytes
+        for n in (1, 2):
+            cache.put(self._key(n), _image(n))
+        cache.get(self._key(0)).file.close()  # 0 is now the most recently used
+        cache.put(self._key(3), _image(3))
+        self.assertIsNone(cache.get(self._key(1)))
+        for n in (0, 2, 3):
+            hit = cache.get(self._key(n))
+            self.assertIsNotNone(hit, n)
+            hit.file.close()
+        self.assertLessEqual(cache.total_bytes, cache.max_bytes)
+        self.assertEqual(sorted(os.listdir(self.dir)),
+                         sorted(f"{self._key(n)}{ext}" for n in (0, 2, 3) for ext in (".png", ".json")))
+
+    def test_recency_survives_a_restart(self):
+        cache = ImageCache(self.dir)
+        for n in range(3):
+            cache.put(self._key(n), _image(n))
+            time.sleep(0.01)  # distinct mtimes
+        entry_bytes = cache.total_bytes // 3
+        time.sleep(0.01)
+        cache.get(self._key(0)).file.close()
+        reopened = ImageCache(self.dir, max_bytes=2 * entry_bytes)
+        self.assertEqual(len(reopened), 2)
+        self.assertIsNone(reopened.get(self._key(1)))
+
+    def test_half_written_entries_are_swept_on_load(self):
+        cache = ImageCache(self.dir)
+        cache.put(self._key(1), _image(1))
+        orphan = os.path.join(self.dir, self._key(2) + ".png")
+        with open(orphan, "wb") as f:
+            f.write(b"image written, metadata never was")
+        temp = os.path.join(self.dir, f".{self._key(3)}.png.abc.tmp")
+        open(temp, "wb").close()
+        reopened = ImageCache(self.dir)
+        self.assertEqual(len(reopened), 1)
+        self.assertFalse(os.path.exists(orphan))
+        self.assertFalse(os.path.exists(temp))
+
+    def test_unreadable_entry_is_a_miss(self):
+        cache = ImageCache(self.dir)
+        cache.put(self._key(1), _image(1))
+        with open(os.path.join(self.dir, self._key(1) + ".json"), "w") as f:
+            f.write("{ not json")
+        self.assertIsNone(cache.get(self._key(1)))
+        self.assertEqual(len(cache), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
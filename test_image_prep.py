@@ -0,0 +1,276 @@
+"""Tests for &remix input preprocessing.
+
+These exercise image_prep.py in isolation (no Discord/OpenAI), asserting: the box an
+input must fit is the edit size plus margin in either orientation, large inputs are
+shrunk into it (with their EXIF rotation applied) and re-encoded, small inputs that
+already fit are left alone, undecodable data is sent as-is, and the work runs in a
+process pool without stalling the event loop, reading no more images into memory at
+once than there are workers.
+
+The benchmark at the end builds synthetic phone-photo-sized images and sends them to
+a local edits stub that reads uploads at a capped bandwidth, through OpenAIClient,
+with and without preprocessing: the preprocessed request must move a fraction of the
+bytes and finish sooner end to end, preprocessing time included.
+
+Skipped when Pillow is not installed. Run from the repo root:
+    python -m unittest test_image_prep -v
+"""
+
+import asyncio
+import concurrent.futures
+import functools
+import io
+import time
+import unittest
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+import image_prep
+from openai_client import OpenAIClient
+from retry_policy import RetryPolicy
+from spooled_attachments import SpooledAttachment
+
+if image_prep.AVAILABLE:
+    from PIL import Image
+
+MB = 1024 * 1024
+
+
+def _photo(width, height):
+    """A synthetic photo: smooth gradients plus sensor-like noise, which compresses
+    about as badly as a real high-detail phone shot."""
+    gradient = Image.linear_gradient("L").resize((width, height))
+    noise = Image.effect_noise((width, height), 40)
+    return Image.merge("RGB", [gradient, noise, gradient.transpose(Image.Transpose.ROTATE_180)])
+
+
+@functools.lru_cache(maxsize=None)
+def _phone_jpeg():
+    """A 12 MP phone photo as a high-quality JPEG (~10 MB)."""
+    return _encode(_photo(4032, 3024), "JPEG", quality=95)
+
+
+def _encode(im, fmt, **params):
+    out = io.BytesIO()
+    im.save(out, fmt, **params)
+    return out.getvalue()
+
+
+def _spooled(data, content_type):
+    return SpooledAttachment(io.BytesIO(data), content_type, len(data))
+
+
+class TargetBoxTest(unittest.TestCase):
+    def test_edit_size_plus_margin_in_either_orientation(self):
+        self.assertEqual(image_prep.target_box("1536x1024"), (1920, 1280))
+        self.assertEqual(image_prep.target_box("1024x1536"), (1920, 1280))
+        self.assertEqual(image_prep.target_box("1024x1024", margin=1), (1024, 1024))
+
+    def test_auto_falls_back_to_the_max_box(self):
+        self.assertEqual(image_prep.target_box("auto"), (3840, 2160))
+
+
+@unittest.skipUnless(image_prep.AVAILABLE, "Pillow is not installed")
+class PrepareImageTest(unittest.TestCase):
+    def test_large_photo_is_shrunk_into_the_box(self):
+        data = _phone_jpeg()
+        encoded, content_type = image_prep.prepare_image(data, (1920, 1280))
+        with Image.open(io.BytesIO(encoded)) as im:
+            self.assertEqual(im.size, (1707, 1280))
+            self.assertEqual(Image.MIME[im.format], content_type)
+        self.assertLess(len(encoded) * 4, len(data))
+
+    def test_portrait_input_keeps_its_orientation(self):
+        data = _encode(_photo(1500, 3000), "JPEG", quality=90)
+        encoded, _ = image_prep.prepare_image(data, (1920, 1280))
+        with Image.open(io.BytesIO(encoded)) as im:
+            self.assertEqual(im.size, (960, 1920))
+
+    def test_exif_rotation_is_applied(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # rotate 90 degrees clockwise on display
+        data = _encode(_photo(4032, 3024), "JPEG", quality=95, exif=exif)
+        encoded, _ = image_prep.prepare_image(data, (1920, 1280))
+        with Image.open(io.BytesIO(encoded)) as im:
+            self.assertEqual(im.size, (1280, 1707))
+
+    def test_small_input_that_fits_is_left_alone(self):
+        data = _encode(_photo(800, 600), "PNG")
+        self.assertLess(len(data), image_prep.PASSTHROUGH_BYTES)
+        self.assertIsNone(image_prep.prepare_image(data, (1920, 1280)))
+
+    def test_palette_image_with_transparency_keeps_alpha(self):
+        im = Image.new("P", (3000, 3000), 0)
+        im.info["transparency"] = 0
+        encoded, _ = image_prep.prepare_image(_encode(im, "PNG", transparency=0), (1280, 1280))
+        with Image.open(io.BytesIO(encoded)) as out:
+            self.assertEqual(out.size, (1280, 1280))
+            self.assertIn("A", out.mode)
+
+
+@unittest.skipUnless(image_prep.AVAILABLE, "Pillow is not installed")
+class PreprocessorTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.prep = image_prep.ImagePreprocessor(workers=2)
+        self.prep.start()
+
+    async def asyncTearDown(self):
+        self.prep.close()
+
+    async def test_replaces_spooled_files_in_place(self):
+        big = _encode(_photo(3000, 2000), "JPEG", quality=95)
+        small = _encode(_photo(300, 200), "PNG")
+        images = [_spooled(big, "image/jpeg"), _spooled(small, "image/png"), _spooled(b"not an image", "image/png")]
+        before, after = await self.prep.prepare(images, "1536x1024")
+        self.assertEqual(before, len(big) + len(small) + 12)
+        self.assertEqual(after, sum(image.size for image in images))
+        self.assertNotEqual(images[0].content_type, "image/jpeg")
+        self.assertEqual(len(images[0].file.read()), images[0].size)
+        self.assertEqual(images[1].file.read(), small)
+        self.assertEqual(images[2].file.read(), b"not an image")
+
+    async def test_one_image_per_worker_is_read_at_a_time(self):
+        held, peak = 0, 0
+
+        class TrackedFile(io.BytesIO):
+            """Counts as held in memory from read() until rewound after the work."""
+            reading = False
+
+            def read(self, *args):
+                nonlocal held, peak
+                if not self.reading:
+                    self.reading = True
+                    held += 1
+                    peak = max(peak, held)
+                return super().read(*args)
+
+            def seek(self, *args):
+                nonlocal held
+                if self.reading and args == (0,):
+                    self.reading = False
+                    held -= 1
+                return super().seek(*args)
+
+        data = _encode(_photo(3000, 2000), "JPEG", quality=95)
+        images = [SpooledAttachment(TrackedFile(data), "image/jpeg", len(data)) for _ in range(5)]
+        await self.prep.prepare(images, "1536x1024")
+        self.assertEqual(peak, self.prep.workers)
+        self.assertTrue(all(image.content_type != "image/jpeg" for image in images))
+
+    async def test_broken_pool_is_shut_down_and_replaced(self):
+        class BrokenPool:
+            shutdown_calls = []
+
+            def submit(self, *args):
+                raise concurrent.futures.process.BrokenProcessPool("a worker died")
+
+            def shutdown(self, **kwargs):
+                self.shutdown_calls.append(kwargs)
+
+        self.prep.close()
+        broken = self.prep._pool = BrokenPool()
+        data = _encode(_photo(3000, 2000), "JPEG", quality=95)
+        images = [_spooled(data, "image/jpeg")]
+        with self.assertLogs("bot_ross.image_prep", "WARNING"):
+            await self.prep.prepare(images, "1536x1024")
+        self.assertEqual(images[0].file.read(), data)
+        self.assertEqual(broken.shutdown_calls, [{"wait": False, "cancel_futures": True}])
+        self.assertIsInstance(self.prep._pool, concurrent.futures.ProcessPoolExecutor)
+
+    async def test_event_loop_stays_responsive(self):
+        images = [_spooled(_phone_jpeg(), "image/jpeg") for _ in range(2)]
+        gaps = []
+
+        async def ticker():
+            last = time.monotonic()
+            while True:
+                await asyncio.sleep(0.01)
+                now = time.monotonic()
+                gaps.append(now - last)
+                last = now
+
+        task = asyncio.create_task(ticker())
+        try:
+            await self.prep.prepare(images, "1536x1024")
+        finally:
+            task.cancel()
+        self.assertGreater(len(gaps), 5)
+        self.assertLess(max(gaps), 0.25, f"event loop stalled for {max(gaps):.2f}s")
+
+
+EDIT_CONFIG = {
+    "model": "gpt-image-2",
+    "params": {"size": "1536x1024", "quality": "low"},
+    "has_revised_prompt": False,
+    "supports_moderation": False,
+    "supports_edit": True,
+}
+# Upload bandwidth the stub reads at: ~32 Mbit/s, a typical home uplink.
+UPLINK_BYTES_PER_SECOND = 4 * MB
+
+
+class SlowUplinkEditsStub:
+    """/v1/images/edits reading the request body at UPLINK_BYTES_PER_SECOND."""
+
+    def __init__(self):
+        self.received = []
+        app = web.Application(client_max_size=64 * MB)
+        app.router.add_post("/v1/images/edits", self.edits)
+        self.server = TestServer(app)
+
+    async def edits(self, request):
+        received = 0
+        started = time.monotonic()
+        async for chunk in request.content.iter_chunked(64 * 1024):
+            received += len(chunk)
+            ahead = received / UPLINK_BYTES_PER_SECOND - (time.monotonic() - started)
+            if ahead > 0:
+                await asyncio.sleep(ahead)
+        self.received.append(received)
+        return web.json_response({"data": [{"b64_json": "aGk="}]})
+
+
+@unittest.skipUnless(image_prep.AVAILABLE, "Pillow is not installed")
+class UploadBenchmark(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.stub = SlowUplinkEditsStub()
+        await self.stub.server.start_server()
+        self.client = OpenAIClient("sk-test", base_url=str(self.stub.server.make_url("/v1")),
+                                   retry_policy=RetryPolicy(base_delay=0))
+        await self.client.start()
+        self.prep = image_prep.ImagePreprocessor(workers=2)
+        self.prep.start()
+        # A phone photo plus a screenshot-sized PNG.
+        self.inputs = [(_phone_jpeg(), "image/jpeg"),
+                       (_encode(_photo(2400, 1600), "PNG", compress_level=1), "image/png")]
+
+    async def asyncTearDown(self):
+        self.prep.close()
+        await self.client.close()
+        await self.stub.server.close()
+
+    async def _remix(self, preprocess):
+        images = [_spooled(data, content_type) for data, content_type in self.inputs]
+        started = time.monotonic()
+        if preprocess:
+            await self.prep.prepare(images, "1536x1024")
+        result = await self.client.edit_image("a barn", EDIT_CONFIG, [(i.file, i.content_type) for i in images])
+        elapsed = time.monotonic() - started
+        for image_file in result["images"]:
+            image_file.close()
+        for image in images:
+            image.close()
+        return self.stub.received[-1], elapsed
+
+    async def test_preprocessing_cuts_upload_bytes_and_latency(self):
+        raw_bytes, raw_seconds = await self._remix(preprocess=False)
+        prepped_bytes, prepped_seconds = await self._remix(preprocess=True)
+        summary = (f"raw {raw_bytes / MB:.1f} MB in {raw_seconds:.2f}s vs "
+                   f"preprocessed {prepped_bytes / MB:.1f} MB in {prepped_seconds:.2f}s")
+        self.assertLess(prepped_bytes * 4, raw_bytes, summary)
+        self.assertLess(prepped_seconds, raw_seconds, summary)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -16,11 +16,14 @@ from image_size import (
     GEN_MIN_PIXELS,
     GEN_STEP,
     LANDSCAPE,
+    MAX_COUNT,
     ORIENTATIONS,
     PORTRAIT,
     SQUARE,
     coerce_generation_size,
     describe_edit_size,
+    parse_count,
+    parse_count_flag,
     parse_resolution,
     parse_size_flags,
     resolve_edit_size,
@@ -153,6 +156,24 @@ class ParseResolutionTest(unittest.TestCase):
                     parse_resolution(bad)
 
 
+class ParseCountTest(unittest.TestCase):
+    def test_count_flag_stripped_in_either_form(self):
+        self.assertEqual(parse_count_flag("a barn --n 3 --landscape"), ("a barn --landscape", "3"))
+        self.assertEqual(parse_count_flag("--N=2 a barn"), ("a barn", "2"))
+        self.assertEqual(parse_count_flag("a barn --n"), ("a barn", None))
+
+    def test_no_flag_passthrough_and_lookalikes_kept(self):
+        text = "  a barn  --no-frills --nx 2 "
+        self.assertEqual(parse_count_flag(text), (text, None))
+
+    def test_valid_and_invalid_counts(self):
+        self.assertEqual(parse_count("1"), 1)
+        self.assertEqual(parse_count(str(MAX_COUNT)), MAX_COUNT)
+        for raw in ("0", str(MAX_COUNT + 1), "two", "2.5", "", None):
+            with self.assertRaises(ValueError, msg=raw):
+                parse_count(raw)
+
+
 class CoerceGenerationSizeTest(unittest.TestCase):
     # (w, h, expected) -- worked table. Large inputs pass through the ratio/box/round
     # steps unchanged; small inputs (area < GEN_MIN_PIXELS) are scaled UP to the pixel
@@ -0,0 +1,248 @@
+"""Tests for the incremental image-response decoder.
+
+These exercise image_stream.py in isolation (no Discord/OpenAI), asserting: the
+decoded image and every other field come out the same as json.loads + b64decode no
+matter where the chunk boundaries fall, JSON escapes are handled, large images spill
+to a temp file while small ones stay in memory, a truncated body is an error, a
+streamed (event-stream) body yields its partial images and completed image
+wherever its chunk boundaries fall, and a batch of images is split into uploads by
+file count and total size.
+
+The benchmark at the end streams a 3840x2160-class image (12 MB decoded, 16 MB of
+base64) from a local stub server and measures peak Python memory with tracemalloc:
+the incremental path must stay within a few megabytes, against the ~50 MB the old
+response.json() -> b64decode -> BytesIO path peaks at.
+
+Run from the repo root:  python -m unittest test_image_stream -v
+"""
+
+import base64
+import hashlib
+import io
+import json
+import os
+import random
+import tracemalloc
+import unittest
+
+import aiohttp
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from image_stream import (
+    ImageEventParser,
+    ImagePayloadParser,
+    ImageSpool,
+    ImageStreamError,
+    copy_image,
+    read_image_response,
+    upload_batches,
+)
+
+IMAGE = bytes(range(256)) * 40 + b"\x89PNG trailing bytes"
+
+
+def _body(**item):
+    return json.dumps({"created": 1, "data": [{"b64_json": base64.b64encode(IMAGE).decode(), **item}]}).encode()
+
+
+def _parse(body, chunk_size, spool_max_size=1 << 20):
+    parser = ImagePayloadParser(spool_max_size)
+    for i in range(0, len(body), chunk_size):
+        parser.feed(body[i:i + chunk_size])
+    return parser.result()
+
+
+class ParserTest(unittest.TestCase):
+    def test_every_chunk_boundary(self):
+        body = _body(revised_prompt='a "quoted" barn \\ with b64_json in it')
+        for chunk_size in list(range(1, 40)) + [4096, len(body)]:
+            with self.subTest(chunk_size=chunk_size):
+                data = _parse(body, chunk_size)
+                item = data["data"][0]
+                self.assertEqual(item["b64_json"].read(), IMAGE)
+                self.assertEqual(item["revised_prompt"], 'a "quoted" barn \\ with b64_json in it')
+                self.assertEqual(data["created"], 1)
+
+    def test_escaped_slashes_in_base64(self):
+        encoded = base64.b64encode(bytes(range(256)) * 4).decode()
+        self.assertIn("/", encoded)
+        body = ('{"data": [{"b64_json": "%s"}]}' % encoded.replace("/", "\\/")).encode()
+        for chunk_size in (1, 2, 3, 7, 1000):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(_parse(body, chunk_size)["data"][0]["b64_json"].read(), bytes(range(256)) * 4)
+
+    def test_key_named_b64_json_as_a_value_is_not_decoded(self):
+        body = b'{"note": "b64_json", "data": [{"b64_json" : "aGk="}]}'
+        data = _parse(body, 3)
+        self.assertEqual(data["note"], "b64_json")
+        self.assertEqual(data["data"][0]["b64_json"].read(), b"hi")
+
+    def test_several_images_keep_their_order(self):
+        images = [os.urandom(1000 + i) for i in range(4)]
+        body = json.dumps({"data": [{"b64_json": base64.b64encode(img).decode()} for img in images]}).encode()
+        data = _parse(body, 333)
+        self.assertEqual([item["b64_json"].read() for item in data["data"]], images)
+
+    def test_large_image_spills_to_disk_small_stays_in_memory(self):
+        small = _parse(_body(), 4096, spool_max_size=1 << 20)["data"][0]["b64_json"]
+        self.assertIsInstance(small, io.BytesIO)
+        large = _parse(_body(), 4096, spool_max_size=1000)["data"][0]["b64_json"]
+        self.assertNotIsInstance(large, io.BytesIO)
+        self.assertIsInstance(large, io.IOBase)  # what discord.File accepts
+        self.assertEqual(large.read(), IMAGE)
+
+    def test_truncated_body_raises(self):
+        body = _body()
+        parser = ImagePayloadParser()
+        parser.feed(body[:len(body) // 2])
+        with self.assertRaises(ValueError):
+            parser.result()
+
+    def test_copy_is_independent_of_the_original(self):
+        original = _parse(_body(), 4096, spool_max_size=1000)["data"][0]["b64_json"]
+        original.read(10)
+        copy = copy_image(original, spool_max_size=1000)
+        self.assertEqual(original.tell(), 0)
+        original.close()
+        self.assertEqual(copy.read(), IMAGE)
+
+    def test_spool_rewinds_on_finish(self):
+        spool = ImageSpool(max_size=4)
+        spool.write(b"ab")
+        spool.write(b"cdef")
+        self.assertEqual(spool.size, 6)
+        self.assertEqual(spool.finish().read(), b"abcdef")
+
+    def test_upload_batches_respect_count_and_bytes(self):
+        files = [io.BytesIO(b"x" * size) for size in (40, 40, 30, 100, 10, 10, 10)]
+        files[0].read(5)
+        batches = upload_batches(files, max_bytes=100, max_files=2)
+        self.assertEqual([[len(f.getvalue()) for f in batch] for batch in batches],
+                         [[40, 40], [30], [100], [10, 10], [10]])
+        self.assertEqual(files[0].tell(), 0)
+        self.assertEqual(upload_batches([], 100, 2), [])
+
+
+def _event(kind, newline=b"\n", **fields):
+    data = json.dumps({"type": kind, **fields}).encode()
+    return b"event: " + kind.encode() + newline + b"data: " + data + newline + newline
+
+
+def _b64(data):
+    return base64.b64encode(data).decode()
+
+
+class EventStreamTest(unittest.TestCase):
+    def _parse_events(self, body, chunk_size):
+        partials = []
+        parser = ImageEventParser(on_partial=lambda f, i: partials.append((i, f.read())))
+        for i in range(0, len(body), chunk_size):
+            parser.feed(body[i:i + chunk_size])
+        return parser.result(), partials
+
+    def test_partials_and_completed_image_at_every_chunk_boundary(self):
+        body = (b": keep-alive comment\n\n"
+                + _event("image_generation.partial_image", b64_json=_b64(b"rough"), partial_image_index=0)
+                + _event("image_generation.partial_image", b"\r\n", b64_json=_b64(b"less rough"),
+                         partial_image_index=1)
+                + _event("image_generation.completed", b64_json=_b64(IMAGE), usage={"total_tokens": 9}))
+        for chunk_size in (1, 2, 3, 7, 64, len(body)):
+            with self.subTest(chunk_size=chunk_size):
+                result, partials = self._parse_events(body, chunk_size)
+                self.assertEqual(partials, [(0, b"rough"), (1, b"less rough")])
+                self.assertEqual(len(result["data"]), 1)
+                self.assertEqual(result["data"][0]["b64_json"].read(), IMAGE)
+                self.assertEqual(result["data"][0]["usage"], {"total_tokens": 9})
+
+    def test_last_event_without_a_trailing_blank_line(self):
+        body = _event("image_generation.completed", b64_json=_b64(IMAGE)).rstrip(b"\n")
+        result, _ = self._parse_events(body, 5)
+        self.assertEqual(result["data"][0]["b64_json"].read(), IMAGE)
+
+    def test_error_event_raises(self):
+        body = _event("error", error={"message": "safety system"})
+        with self.assertRaisesRegex(ImageStreamError, "safety system"):
+            self._parse_events(body, 16)
+
+    def test_stream_without_a_completed_image_is_an_error(self):
+        body = _event("image_generation.partial_image", b64_json=_b64(b"rough"), partial_image_index=0)
+        with self.assertRaises(ValueError):
+            self._parse_events(body, 16)
+
+
+# 3840x2160 at high quality: PNGs of this size run well past 10 MB.
+BENCH_IMAGE_BYTES = 12 * 1024 * 1024
+BENCH_RAW_CHUNK = 48 * 1024  # a multiple of 3, so each chunk encodes to whole base64 quads
+
+
+class StreamingStub:
+    """Images API streaming one large generated image, built chunk by chunk so the
+    server side never holds the whole body (it shares the process being measured)."""
+
+    def __init__(self):
+        self.digest = None
+        app = web.Application()
+        app.router.add_post("/v1/images/generations", self.generations)
+        self.server = TestServer(app)
+
+    async def generations(self, request):
+        response = web.StreamResponse(headers={"Content-Type": "application/json"})
+        await response.prepare(request)
+        await response.write(b'{"created": 1, "data": [{"revised_prompt": "a barn", "b64_json": "')
+        rng = random.Random(1)
+        digest = hashlib.sha256()
+        for _ in range(BENCH_IMAGE_BYTES // BENCH_RAW_CHUNK):
+            raw = rng.randbytes(BENCH_RAW_CHUNK)
+            digest.update(raw)
+            await response.write(base64.b64encode(raw))
+        await response.write(b'"}]}')
+        await response.write_eof()
+        self.digest = digest.hexdigest()
+        return response
+
+
+class PeakMemoryBenchmark(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.stub = StreamingStub()
+        await self.stub.server.start_server()
+        self.session = aiohttp.ClientSession()
+        self.url = str(self.stub.server.make_url("/v1/images/generations"))
+
+    async def asyncTearDown(self):
+        await self.session.close()
+        await self.stub.server.close()
+
+    async def _measure(self, read):
+        tracemalloc.start()
+        try:
+            async with self.session.post(self.url, json={}) as response:
+                image_file = await read(response)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        digest = hashlib.sha256()
+        with image_file:
+            for block in iter(lambda: image_file.read(1 << 20), b""):
+                digest.update(block)
+        self.assertEqual(digest.hexdigest(), self.stub.digest)
+        return peak
+
+    async def test_peak_memory_per_request(self):
+        async def streamed(response):
+            return (await read_image_response(response))["data"][0]["b64_json"]
+
+        async def buffered(response):  # the old do_the_art path
+            data = await response.json()
+            return io.BytesIO(base64.b64decode(data["data"][0]["b64_json"]))
+
+        streamed_peak = await self._measure(streamed)
+        buffered_peak = await self._measure(buffered)
+        mb = 1024 * 1024
+        summary = f"streamed peak {streamed_peak / mb:.1f} MB vs buffered {buffered_peak / mb:.1f} MB"
+        self.assertLess(streamed_peak, 4 * mb, summary)
+        self.assertLess(streamed_peak * 8, buffered_peak, summary)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,135 @@
+"""Unit tests for the bounded, per-user round-robin generation queue.
+
+These exercise job_queue.py in isolation (no Discord/OpenAI), asserting: no more than
+`workers` jobs ever run at once, a full queue rejects new work, waiting jobs are
+served round-robin across users (one spammer can't monopolize the workers), the
+reported positions match the order jobs actually start in, and results/exceptions
+reach the submitter.
+
+Run from the repo root:  python -m unittest test_job_queue -v
+"""
+
+import asyncio
+import unittest
+
+from job_queue import DEFAULT_JOB_SECONDS, GenerationQueue, QueueFullError
+
+
+class QueueTestCase(unittest.IsolatedAsyncioTestCase):
+    async def asyncTearDown(self):
+        await self.queue.close()
+
+
+class ConcurrencyTest(QueueTestCase):
+    async def test_never_more_than_workers_in_flight(self):
+        self.queue = GenerationQueue(workers=3, maxsize=100)
+        self.queue.start()
+        in_flight = 0
+        peak = 0
+
+        async def job():
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            return "done"
+
+        tickets = [self.queue.submit(f"user{i % 5}", job) for i in range(30)]
+        results = await asyncio.gather(*(t.future for t in tickets))
+        self.assertEqual(results, ["done"] * 30)
+        self.assertEqual(peak, 3)
+
+    async def test_full_queue_rejects(self):
+        self.queue = GenerationQueue(workers=1, maxsize=2)  # not started: nothing drains
+        self.queue.submit("a", asyncio.sleep)
+        self.queue.submit("a", asyncio.sleep)
+        with self.assertRaises(QueueFullError):
+            self.queue.submit("b", asyncio.sleep)
+
+    async def test_exception_reaches_submitter(self):
+        self.queue = GenerationQueue(workers=1)
+        self.queue.start()
+
+        async def boom():
+            raise ValueError("no paint")
+
+        ticket = self.queue.submit("a", boom)
+        with self.assertRaises(ValueError):
+            await ticket.future
+        # The worker survives a failing job.
+        ok = self.queue.submit("a", lambda: asyncio.sleep(0, result=1))
+        self.assertEqual(await ok.future, 1)
+
+    async def test_close_cancels_waiting_jobs(self):
+        self.queue = GenerationQueue(workers=1)
+        ticket = self.queue.submit("a", asyncio.sleep)
+        await self.queue.close()
+        self.assertTrue(ticket.future.cancelled())
+
+
+class FairnessTest(QueueTestCase):
+    async def test_round_robin_across_users_matches_reported_positions(self):
+        self.queue = GenerationQueue(workers=1, maxsize=100)
+        order = []
+
+        def job(name):
+            async def run():
+                order.append(name)
+            return run
+
+        # A spammer queues five before anyone else shows up.
+        tickets = {}
+        for i in range(5):
+            tickets[f"spam{i}"] = self.queue.submit("spammer", job(f"spam{i}"))
+        tickets["alice0"] = self.queue.submit("alice", job("alice0"))
+        tickets["bob0"] = self.queue.submit("bob", job("bob0"))
+        tickets["alice1"] = self.queue.submit("alice", job("alice1"))
+
+        self.queue.start()
+        await asyncio.gather(*(t.future for t in tickets.values()))
+        self.assertEqual(order, ["spam0", "alice0", "bob0", "spam1", "alice1", "spam2", "spam3", "spam4"])
+        # Everyone was told the position they were actually served at -- alice and bob
+        # jumped ahead of the spammer's backlog at submit time.
+        self.assertEqual(tickets["alice0"].position, 2)
+        self.assertEqual(tickets["bob0"].position, 3)
+        self.assertEqual(tickets["alice1"].position, 5)
+        self.assertEqual(tickets["spam4"].position, 5)
+
+    async def test_idle_worker_means_no_wait(self):
+        self.queue = GenerationQueue(workers=2)
+        self.queue.start()
+        release = asyncio.Event()
+        first = self.queue.submit("a", release.wait)
+        second = self.queue.submit("b", release.wait)
+        self.assertFalse(first.waits)
+        self.assertFalse(second.waits)
+        await asyncio.sleep(0)  # both workers pick up a job
+        third = self.queue.submit("c", release.wait)
+        self.assertTrue(third.waits)
+        self.assertEqual(third.position, 1)
+        self.assertEqual(self.queue.depth, 1)
+        self.assertEqual(self.queue.running, 2)
+        release.set()
+        await asyncio.gather(first.future, second.future, third.future)
+
+
+class EstimatedWaitTest(QueueTestCase):
+    async def test_defaults_before_any_job_finishes(self):
+        self.queue = GenerationQueue(workers=2)
+        self.assertEqual(self.queue.estimated_wait(1), 0.0)
+        self.assertEqual(self.queue.estimated_wait(2), 0.0)
+        self.queue._running = 2
+        self.assertEqual(self.queue.estimated_wait(1), DEFAULT_JOB_SECONDS)
+        self.assertEqual(self.queue.estimated_wait(3), 2 * DEFAULT_JOB_SECONDS)
+
+    async def test_tracks_measured_durations(self):
+        self.queue = GenerationQueue(workers=1)
+        self.queue.start()
+        await self.queue.submit("a", lambda: asyncio.sleep(0.05)).future
+        self.assertLess(self.queue.average_job_seconds, 1.0)
+        self.assertGreater(self.queue.average_job_seconds, 0.04)
+
+
+if __name__ == "__main__":
+    unittest.main()
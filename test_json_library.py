@@ -0,0 +1,183 @@
+"""Unit tests for the shared library save path.
+
+These exercise json_library.py in isolation (no Discord/OpenAI), asserting: a save
+replaces the file atomically, so a writer killed mid-flush -- at the fsync, or at any
+random moment while saving a large library -- leaves the old library intact and
+loadable; rapid saves with a delay are coalesced into one write that load_library()
+already sees, made off the event loop and tried again if it fails; and
+flush_pending() writes whatever is still held.
+
+Run from the repo root:  python -m unittest test_json_library -v
+"""
+
+import asyncio
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import textwrap
+import threading
+import time
+import unittest
+from unittest import mock
+
+import json_library
+from json_library import flush_pending, load_library, save_library
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+OLD_ENTRIES = [{"id": "old", "text": "the old library ♥️"}]
+
+
+def _run_writer(script, *args):
+    return subprocess.Popen([sys.executable, "-c", textwrap.dedent(script), *args], cwd=REPO_DIR)
+
+
+class CrashSafetyTest(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._dir.name, "macros.json")
+        save_library(OLD_ENTRIES, self.path)
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def test_writer_killed_at_fsync_leaves_old_library(self):
+        # The new library is fully written to the temp file, then the process dies
+        # before the rename: the target must still be the old library.
+        writer = _run_writer("""
+            import os, sys
+            import json_library
+            os.fsync = lambda fd: os._exit(9)
+            json_library.save_library([{"id": "new", "text": "x" * 100000}], sys.argv[1])
+        """, self.path)
+        self.assertEqual(writer.wait(timeout=30), 9)
+        self.assertEqual(load_library(self.path, "macro"), OLD_ENTRIES)
+
+    def test_writer_sigkilled_mid_save_leaves_a_complete_library(self):
+        # Save two large libraries back to back until SIGKILLed at an arbitrary
+        # point: whatever is on disk must parse as one of them (or the original),
+        # never a truncated file that would load as empty.
+        big_a = [{"id": f"a{i}", "text": "a" * 200} for i in range(5000)]
+        big_b = [{"id": f"b{i}", "text": "b" * 200} for i in range(5000)]
+        for delay in (0.15, 0.3, 0.45):
+            writer = _run_writer("""
+                import sys
+                import json_library
+                a = [{"id": f"a{i}", "text": "a" * 200} for i in range(5000)]
+                b = [{"id": f"b{i}", "text": "b" * 200} for i in range(5000)]
+                while True:
+                    json_library.save_library(a, sys.argv[1])
+                    json_library.save_library(b, sys.argv[1])
+            """, self.path)
+            time.sleep(delay)
+            writer.send_signal(signal.SIGKILL)
+            writer.wait(timeout=30)
+            with open(self.path, encoding="utf-8") as f:
+                on_disk = json.load(f)
+            self.assertIn(on_disk, (OLD_ENTRIES, big_a, big_b))
+
+    def test_failed_write_leaves_old_library_and_no_temp_file(self):
+        with mock.patch("json.dump", side_effect=OSError(28, "No space left on device")):
+            with self.assertRaises(OSError):
+                save_library([{"id": "new", "text": "new"}], self.path)
+        self.assertEqual(load_library(self.path, "macro"), OLD_ENTRIES)
+        self.assertEqual(os.listdir(self._dir.name), ["macros.json"])
+
+
+class CoalescedSaveTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._dir.name, "macros.json")
+        save_library(OLD_ENTRIES, self.path)
+
+    def tearDown(self):
+        json_library._pending.clear()
+        self._dir.cleanup()
+
+    def _on_disk(self):
+        with open(self.path, encoding="utf-8") as f:
+            return json.load(f)
+
+    async def test_rapid_saves_are_one_write(self):
+        with mock.patch.object(json_library, "_write", wraps=json_library._write) as write:
+            entries = list(OLD_ENTRIES)
+            for i in range(5):  # five &macro_add in a row
+                entries = load_library(self.path, "macro") + [{"id": f"m{i}", "text": f"macro {i}"}]
+                save_library(entries, self.path, delay=0.05)
+            self.assertEqual(write.call_count, 0)
+            self.assertEqual(self._on_disk(), OLD_ENTRIES)
+            await asyncio.sleep(0.15)
+            self.assertEqual(write.call_count, 1)
+        self.assertEqual(self._on_disk(), entries)
+        self.assertEqual(len(entries), 6)
+
+    async def test_pending_entries_are_a_snapshot(self):
+        entries = [{"id": "new", "text": "new"}]
+        save_library(entries, self.path, delay=10)
+        entries[0]["text"] = "mutated after saving"
+        loaded = load_library(self.path, "macro")
+        self.assertEqual(loaded, [{"id": "new", "text": "new"}])
+        loaded.append({"id": "stray"})
+        self.assertEqual(load_library(self.path, "macro"), [{"id": "new", "text": "new"}])
+
+    async def test_flush_pending_writes_now(self):
+        save_library([{"id": "new", "text": "new"}], self.path, delay=10)
+        flush_pending()
+        self.assertEqual(self._on_disk(), [{"id": "new", "text": "new"}])
+        self.assertEqual(json_library._pending, {})
+
+    async def test_immediate_save_supersedes_pending(self):
+        save_library([{"id": "stale", "text": "stale"}], self.path, delay=0.05)
+        save_library([{"id": "now", "text": "now"}], self.path)
+        await asyncio.sleep(0.1)
+        self.assertEqual(self._on_disk(), [{"id": "now", "text": "now"}])
+
+    async def test_failed_deferred_write_stays_pending(self):
+        with mock.patch.object(json_library, "_write", side_effect=OSError(28, "No space left on device")):
+            save_library([{"id": "new", "text": "new"}], self.path, delay=0.01)
+            await asyncio.sleep(0.05)
+        self.assertEqual(load_library(self.path, "macro"), [{"id": "new", "text": "new"}])
+        self.assertEqual(self._on_disk(), OLD_ENTRIES)
+        flush_pending()
+        self.assertEqual(self._on_disk(), [{"id": "new", "text": "new"}])
+
+    async def test_deferred_write_runs_off_the_loop(self):
+        threads = []
+
+        def write(entries, path):
+            threads.append(threading.get_ident())
+            real_write(entries, path)
+
+        real_write = json_library._write
+        with mock.patch.object(json_library, "_write", side_effect=write):
+            save_library([{"id": "new", "text": "new"}], self.path, delay=0.01)
+            await asyncio.sleep(0.1)
+        self.assertEqual(len(threads), 1)
+        self.assertNotEqual(threads[0], threading.get_ident())
+        self.assertEqual(self._on_disk(), [{"id": "new", "text": "new"}])
+
+    async def test_failed_deferred_write_is_retried(self):
+        failures = [OSError(28, "No space left on device")]
+
+        def write(entries, path):
+            if failures:
+                raise failures.pop()
+            real_write(entries, path)
+
+        real_write = json_library._write
+        with mock.patch.object(json_library, "_write", side_effect=write):
+            save_library([{"id": "new", "text": "new"}], self.path, delay=0.01)
+            await asyncio.sleep(0.1)
+        self.assertEqual(self._on_disk(), [{"id": "new", "text": "new"}])
+        self.assertEqual(json_library._pending, {})
+
+    def test_delay_without_a_loop_writes_now(self):
+        save_library([{"id": "new", "text": "new"}], self.path, delay=10)
+        self.assertEqual(self._on_disk(), [{"id": "new", "text": "new"}])
+
+
+if __name__ == "__main__":
+    unittest.main()
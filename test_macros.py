@@ -2,18 +2,23 @@
 
 These exercise macros.py in isolation (no Discord/OpenAI), asserting: in-place
 substitution, fallback behavior on a miss, no-recursion, id
-normalization/validation, library I/O, and seed-data integrity. Mirrors
+normalization/validation, library I/O, the cached/hot-reloading library handle,
+and seed-data integrity. Mirrors
 test_magic_paint.py's structure.
 
 Run from the repo root:  python -m unittest test_macros -v
 """
 
+import builtins
 import os
 import tempfile
 import unittest
+from unittest import mock
 
+import json_library
 from macros import (
     FALLBACK_EXPANSIONS,
+    build_lookup,
     entry_id,
     expand_macros,
     is_valid_macro_id,
@@ -187,6 +192,60 @@ class LibraryIoTest(unittest.TestCase):
             self.assertEqual(load_macro_library(path), [])
 
 
+class CachedLibraryTest(unittest.TestCase):
+    """expand_macros(path=...) reads through json_library's cached handle."""
+
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._dir.name, "macros.json")
+        save_macro_library([{"id": "cat", "text": "CAT,"}], self.path)
+        json_library._handles.clear()
+
+    def tearDown(self):
+        json_library._handles.clear()
+        self._dir.cleanup()
+
+    def test_repeat_expansions_do_no_file_io(self):
+        expand_macros("A ;cat", path=self.path)
+        with mock.patch.object(builtins, "open", side_effect=AssertionError("file read")), \
+                mock.patch.object(os, "stat", side_effect=AssertionError("file stat")):
+            for _ in range(100):
+                prompt, hits, _ = expand_macros("A ;cat", path=self.path)
+                self.assertEqual(prompt, "A CAT,")
+                self.assertEqual(hits, ["cat"])
+
+    def test_save_library_shows_up_on_the_next_prompt(self):
+        expand_macros("A ;cat", path=self.path)
+        save_macro_library([{"id": "cat", "text": "DOG,"}, {"id": "new", "text": "NEW,"}], self.path)
+        prompt, hits, _ = expand_macros("A ;cat and a ;new", path=self.path)
+        self.assertEqual(prompt, "A DOG, and a NEW,")
+        self.assertEqual(hits, ["cat", "new"])
+
+    def test_hand_edit_is_picked_up_after_recheck_interval(self):
+        handle = json_library.cached_library(self.path, "macro", build_index=build_lookup)
+        handle.recheck_interval = 0
+        expand_macros("A ;cat", path=self.path)
+        with open(self.path, "w") as f:  # outside save_library: only the stat notices
+            f.write('[{"id": "cat", "text": "a much longer cat,"}]')
+        prompt, _, _ = expand_macros("A ;cat", path=self.path)
+        self.assertEqual(prompt, "A a much longer cat,")
+
+    def test_unchanged_file_is_not_reparsed(self):
+        handle = json_library.cached_library(self.path, "macro", build_index=build_lookup)
+        handle.recheck_interval = 0
+        first = handle.index()
+        with mock.patch.object(json_library, "load_library", side_effect=AssertionError("reparsed")):
+            self.assertIs(handle.index(), first)
+
+    def test_library_appearing_later_is_loaded(self):
+        missing = os.path.join(self._dir.name, "later.json")
+        handle = json_library.cached_library(missing, "macro", build_index=build_lookup)
+        handle.recheck_interval = 0
+        self.assertEqual(expand_macros("A ;cat", path=missing)[1], [])
+        save_macro_library([{"id": "cat", "text": "CAT,"}], missing)
+        self.assertEqual(expand_macros("A ;cat", path=missing)[1], ["cat"])
+
+
 class SeedLibraryDataTest(unittest.TestCase):
     """The shipped seed library must be structurally sound."""
 
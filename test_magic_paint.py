@@ -12,7 +12,9 @@ import os
 import random
 import tempfile
 import unittest
+from unittest import mock
 
+import json_library
 import magic_paint
 from magic_paint import (
     apply_random_magic_entry,
@@ -94,6 +96,16 @@ class ApplyMixinTest(unittest.TestCase):
         _, hit = maybe_apply_magic_paint("a barn", 0.0, entries=STUB_ENTRIES)
         self.assertFalse(hit)
 
+    def test_path_reads_are_cached_until_saved(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "lib.json")
+            save_magic_library([{"id": "x", "text": "with a cat"}], path)
+            self.assertEqual(apply_random_magic_entry("a barn", path=path), "a barn with a cat")
+            with mock.patch.object(json_library, "load_library", side_effect=AssertionError("reread")):
+                self.assertEqual(apply_random_magic_entry("a barn", path=path), "a barn with a cat")
+            save_magic_library([{"id": "x", "text": "with a dog"}], path)
+            self.assertEqual(apply_random_magic_entry("a barn", path=path), "a barn with a dog")
+
     def test_only_reads_library_when_roll_succeeds(self):
         # path points at a nonexistent file; at rate 0 it must never be consulted.
         random.seed(0)
@@ -0,0 +1,139 @@
+"""Tests for the Prometheus metrics endpoint.
+
+These exercise metrics.py against a local scrape (no Discord): the text format
+(HELP/TYPE lines, label escaping, values), perf histograms exported as cumulative
+buckets with requests by command and model alongside, the persisted counters read
+from the store, an in-flight OpenAI call showing up in a scrape taken while a stub
+images API is still answering, and a failing collect() answered with a 500 instead of
+taking the endpoint down.
+
+Run from the repo root:  python -m unittest test_metrics -v
+"""
+
+import asyncio
+import unittest
+
+import aiohttp
+
+import metrics
+from metrics import Metric, MetricsServer, render
+from openai_client import OpenAIClient
+from perf import PerfRecorder
+from retry_policy import RetryPolicy
+from stub_images import SlowImagesStub
+
+CONFIG = {
+    "model": "gpt-image-2",
+    "params": {"size": "1024x1024", "quality": "low"},
+    "has_revised_prompt": False,
+    "supports_moderation": False,
+    "supports_edit": True,
+}
+
+
+def parse(text):
+    """{(name, frozenset(labels)): value} for every sample line of a scrape."""
+    samples = {}
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        series, value = line.rsplit(" ", 1)
+        name, _, labels = series.partition("{")
+        pairs = frozenset(tuple(pair.split("=", 1)) for pair in labels.rstrip("}").split(",") if pair)
+        samples[name, frozenset((k, v.strip('"')) for k, v in pairs)] = float(value)
+    return samples
+
+
+class RenderTest(unittest.TestCase):
+    def test_text_format(self):
+        text = render([
+            Metric("bot_ross_queue_depth", "gauge", "Paintings waiting.").add(3),
+            Metric("bot_ross_in_flight", "gauge", "Calls.").add(1, {"model": 'odd "name"\\'}),
+        ])
+        self.assertEqual(text.splitlines(), [
+            "# HELP bot_ross_queue_depth Paintings waiting.",
+            "# TYPE bot_ross_queue_depth gauge",
+            "bot_ross_queue_depth 3",
+            "# HELP bot_ross_in_flight Calls.",
+            "# TYPE bot_ross_in_flight gauge",
+            'bot_ross_in_flight{model="odd \\"name\\"\\\\"} 1',
+        ])
+
+    def test_histograms_are_cumulative_with_requests_by_command_and_model(self):
+        recorder = PerfRecorder()
+        for seconds in (0.3, 12.0, 14.0):
+            recorder.observe("total", seconds, "paint", "gpt-image-2-low")
+        recorder.observe("api", 11.0, "paint", "gpt-image-2-low")
+        samples = parse(render(metrics.stage_metrics(recorder)))
+        total = {"stage": "total", "command": "paint", "model": "gpt-image-2-low"}
+        bucket = lambda le: samples["bot_ross_stage_seconds_bucket", frozenset({**total, "le": le}.items())]
+        self.assertEqual((bucket("0.25"), bucket("0.5"), bucket("10"), bucket("15"), bucket("+Inf")),
+                         (0, 1, 1, 3, 3))
+        self.assertAlmostEqual(samples["bot_ross_stage_seconds_sum", frozenset(total.items())], 26.3)
+        requests = frozenset({"command": "paint", "model": "gpt-image-2-low"}.items())
+        self.assertEqual(samples["bot_ross_requests_total", requests], 3)
+
+    def test_store_counters(self):
+        store = {'safety_trips': 2, 'macros': 5, 'retry_backoff_seconds': 7.5}
+        samples = parse(render(metrics.store_metrics(store.get)))
+        self.assertEqual(samples["bot_ross_safety_trips_total", frozenset()], 2)
+        self.assertEqual(samples["bot_ross_macro_hits_total", frozenset()], 5)
+        self.assertEqual(samples["bot_ross_retry_backoff_seconds_total", frozenset()], 7.5)
+        self.assertEqual(samples["bot_ross_memes_total", frozenset()], 0)
+
+
+class ScrapeTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.session = aiohttp.ClientSession()
+        self.addAsyncCleanup(self.session.close)
+
+    async def _serve(self, collect):
+        server = MetricsServer(collect, port=0)
+        await server.start()
+        self.addAsyncCleanup(server.close)
+        return f"http://127.0.0.1:{server.port}{metrics.METRICS_PATH}"
+
+    async def _scrape(self, url):
+        async with self.session.get(url) as response:
+            self.assertEqual(response.status, 200)
+            self.assertEqual(response.headers["Content-Type"], metrics.CONTENT_TYPE)
+            return parse(await response.text())
+
+    async def test_in_flight_calls_show_in_a_scrape(self):
+        stub = SlowImagesStub()
+        await stub.server.start_server()
+        self.addAsyncCleanup(stub.server.close)
+        client = OpenAIClient("sk-test", base_url=stub.base_url,
+                              retry_policy=RetryPolicy(base_delay=0))
+        await client.start()
+        self.addAsyncCleanup(client.close)
+
+        def collect():
+            in_flight = Metric("bot_ross_openai_in_flight", "gauge", "Image API calls under way.")
+            for model, count in client.in_flight.items():
+                in_flight.add(count, {"model": model})
+            return [in_flight]
+
+        url = await self._serve(collect)
+        request = asyncio.create_task(client.generate_image("a barn", CONFIG))
+        await stub.arrived.wait()
+        during = await self._scrape(url)
+        stub.release.set()
+        result = await request
+        result["images"][0].close()
+        after = await self._scrape(url)
+        series = ("bot_ross_openai_in_flight", frozenset({("model", "gpt-image-2")}))
+        self.assertEqual((during[series], after[series]), (1, 0))
+
+    async def test_a_failing_collect_is_a_500(self):
+        def collect():
+            raise RuntimeError("store unavailable")
+
+        url = await self._serve(collect)
+        with self.assertLogs("bot_ross.metrics", level="ERROR"):
+            async with self.session.get(url) as response:
+                self.assertEqual(response.status, 500)
+
+
+if __name__ == "__main__":
+    unittest.main()
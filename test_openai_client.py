@@ -0,0 +1,331 @@
+"""Tests for the shared OpenAI HTTP client, against a local stub server.
+
+These exercise openai_client.py without touching api.openai.com: an aiohttp stub
+impersonates /v1/images/generations, /v1/images/edits and /v1/chat/completions and
+records which client connection each request arrived on, so the tests can assert
+that consecutive &paint-style calls reuse one pooled keep-alive connection. Also
+covers the payload shape, error classification, the retry loops, and the &meme chat
+call's per-attempt timeout.
+
+Run from the repo root:  python -m unittest test_openai_client -v
+"""
+
+import asyncio
+import base64
+import unittest
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+import openai_client
+from openai_client import ChatAPIError, ImageAPIError, OpenAIClient, classify_status
+from retry_policy import RetryPolicy
+
+PNG_BYTES = b"\x89PNG fake image bytes"
+PNG_B64 = base64.b64encode(PNG_BYTES).decode()
+
+GPT_IMAGE_CONFIG = {
+    "model": "gpt-image-2",
+    "params": {"size": "1024x1024", "quality": "low"},
+    "has_revised_prompt": False,
+    "supports_moderation": True,
+    "supports_edit": True,
+}
+DALLE_CONFIG = {
+    "model": "dall-e-3",
+    "params": {"size": "1024x1024", "quality": "hd", "style": "vivid", "response_format": "b64_json"},
+    "has_revised_prompt": True,
+    "supports_moderation": False,
+    "supports_edit": False,
+}
+
+
+class StubOpenAI:
+    """Minimal images + chat API. `statuses` is a queue of non-200 image statuses to return
+    before succeeding, and the first `drops` image generations are cut off without a
+    response; every request's peer address and body are recorded."""
+
+    def __init__(self):
+        self.peers = []
+        self.payloads = []
+        self.forms = []
+        self.statuses = []
+        self.drops = 0
+        self.delay = 0
+        self.chat_statuses = []
+        self.chat_delays = []
+        app = web.Application()
+        app.router.add_post("/v1/images/generations", self.generations)
+        app.router.add_post("/v1/images/edits", self.edits)
+        app.router.add_post("/v1/chat/completions", self.chat)
+        self.server = TestServer(app)
+
+    @property
+    def base_url(self):
+        return str(self.server.make_url("/v1"))
+
+    def _record_peer(self, request):
+        self.peers.append(request.transport.get_extra_info("peername"))
+
+    def _maybe_fail(self):
+        if self.statuses:
+            status = self.statuses.pop(0)
+            return web.json_response({"error": {"message": f"stub {status}"}}, status=status)
+        return None
+
+    async def generations(self, request):
+        self._record_peer(request)
+        payload = await request.json()
+        self.payloads.append(payload)
+        await asyncio.sleep(self.delay)
+        if self.drops:
+            self.drops -= 1
+            request.transport.abort()
+            return web.Response()
+        failure = self._maybe_fail()
+        if failure is not None:
+            return failure
+        return web.json_response({"data": [{"b64_json": PNG_B64, "revised_prompt": "revised!"}] * payload["n"]})
+
+    async def edits(self, request):
+        self._record_peer(request)
+        form = await request.post()
+        self.forms.append(form)
+        failure = self._maybe_fail()
+        if failure is not None:
+            return failure
+        return web.json_response({"data": [{"b64_json": PNG_B64}] * int(form["n"])})
+
+    async def chat(self, request):
+        self._record_peer(request)
+        self.payloads.append(await request.json())
+        if self.chat_delays:
+            await asyncio.sleep(self.chat_delays.pop(0))
+        if self.chat_statuses:
+            status = self.chat_statuses.pop(0)
+            return web.json_response({"error": {"message": f"stub {status}"}}, status=status)
+        return web.json_response({"choices": [{"message": {"role": "assistant", "content": " a meme prompt "}}]})
+
+
+class StubServerTestCase(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.stub = StubOpenAI()
+        await self.stub.server.start_server()
+        self.client = OpenAIClient("sk-test", moderation="low", base_url=self.stub.base_url,
+                                   retry_policy=RetryPolicy(base_delay=0), chat_timeout=0.2, chat_retry_delay=0)
+        await self.client.start()
+
+    async def asyncTearDown(self):
+        await self.client.close()
+        await self.stub.server.close()
+
+
+class ConnectionReuseTest(StubServerTestCase):
+    async def test_consecutive_paints_share_one_connection(self):
+        for i in range(5):
+            result = await self.client.generate_image(f"a happy little tree {i}", GPT_IMAGE_CONFIG)
+            self.assertEqual([f.read() for f in result["images"]], [PNG_BYTES])
+        self.assertEqual(len(self.stub.peers), 5)
+        self.assertEqual(len(set(self.stub.peers)), 1, "every paint should reuse the pooled connection")
+
+    async def test_generations_and_edits_share_the_pool(self):
+        await self.client.generate_image("a barn", GPT_IMAGE_CONFIG)
+        await self.client.edit_image("a barn", GPT_IMAGE_CONFIG, [(b"img", "image/png")])
+        await self.client.generate_image("a barn", GPT_IMAGE_CONFIG)
+        self.assertEqual(len(set(self.stub.peers)), 1)
+
+    async def test_meme_chat_shares_the_pool(self):
+        await self.client.generate_image("a barn", GPT_IMAGE_CONFIG)
+        await self.client.chat_completion("gpt-test", [{"role": "user", "content": "hi"}])
+        self.assertEqual(len(set(self.stub.peers)), 1)
+
+    async def test_close_then_start_opens_a_fresh_session(self):
+        await self.client.generate_image("a barn", GPT_IMAGE_CONFIG)
+        await self.client.close()
+        self.assertIsNone(self.client.session)
+        await self.client.start()
+        await self.client.generate_image("a barn", GPT_IMAGE_CONFIG)
+        self.assertEqual(len(set(self.stub.peers)), 2)
+
+
+class PayloadTest(StubServerTestCase):
+    async def test_generation_payload_and_size_override(self):
+        await self.client.generate_image("a barn", GPT_IMAGE_CONFIG, size="1536x1024")
+        payload = self.stub.payloads[-1]
+        self.assertEqual(payload["model"], "gpt-image-2")
+        self.assertEqual(payload["size"], "1536x1024")
+        self.assertEqual(payload["quality"], "low")
+        self.assertEqual(payload["moderation"], "low")
+        self.assertEqual(payload["n"], 1)
+        # The shared config is never mutated by a size override.
+        self.assertEqual(GPT_IMAGE_CONFIG["params"]["size"], "1024x1024")
+
+    async def test_dalle_has_no_moderation_and_returns_revised_prompt(self):
+        result = await self.client.generate_image("a barn", DALLE_CONFIG)
+        self.assertNotIn("moderation", self.stub.payloads[-1])
+        self.assertEqual(result["revised_prompt"], "revised!")
+
+    async def test_edit_form_fields(self):
+        images = [(b"one", "image/png"), (b"two", "image/jpeg")]
+        result = await self.client.edit_image("a barn", GPT_IMAGE_CONFIG, images, size="1536x640")
+        self.assertIsNone(result["revised_prompt"])
+        form = self.stub.forms[-1]
+        self.assertEqual(form["size"], "1536x640")
+        self.assertEqual(form["moderation"], "low")
+        files = form.getall("image[]")
+        self.assertEqual([f.filename for f in files], ["image_0.png", "image_1.jpeg"])
+        self.assertEqual(files[1].file.read(), b"two")
+
+    async def test_n_images_come_back_from_one_call(self):
+        result = await self.client.generate_image("a barn", GPT_IMAGE_CONFIG, n=3)
+        self.assertEqual(self.stub.payloads[-1]["n"], 3)
+        self.assertEqual([f.read() for f in result["images"]], [PNG_BYTES] * 3)
+        self.assertEqual(len(set(map(id, result["images"]))), 3)
+        result = await self.client.edit_image("a barn", GPT_IMAGE_CONFIG, [(b"img", "image/png")], n=2)
+        self.assertEqual(self.stub.forms[-1]["n"], "2")
+        self.assertEqual(len(result["images"]), 2)
+        self.assertEqual(len(self.stub.payloads) + len(self.stub.forms), 2)
+
+
+class ErrorHandlingTest(StubServerTestCase):
+    async def test_transient_error_is_retried(self):
+        self.stub.statuses = [503]
+        result = await self.client.generate_image("a barn", GPT_IMAGE_CONFIG)
+        self.assertEqual([f.read() for f in result["images"]], [PNG_BYTES])
+        self.assertEqual(result["attempts"], 2)
+        self.assertEqual(len(result["attempt_seconds"]), 2)
+        self.assertLessEqual(result["decode_seconds"], result["attempt_seconds"][-1])
+        self.assertEqual(len(self.stub.payloads), 2)
+
+    async def test_edit_retry_rebuilds_the_form(self):
+        self.stub.statuses = [500]
+        await self.client.edit_image("a barn", GPT_IMAGE_CONFIG, [(b"img", "image/png")])
+        self.assertEqual(len(self.stub.forms), 2)
+        self.assertEqual(self.stub.forms[1].getall("image[]")[0].file.read(), b"img")
+
+    async def test_safety_rejection_is_not_retried(self):
+        self.stub.statuses = [400, 400]
+        with self.assertRaises(ImageAPIError) as cm:
+            await self.client.generate_image("a barn", GPT_IMAGE_CONFIG)
+        self.assertEqual(cm.exception.verdict, "safety")
+        self.assertEqual(str(cm.exception), "response: 400: stub 400")
+        self.assertEqual(len(self.stub.payloads), 1)
+
+    async def test_retries_exhausted(self):
+        attempts = self.client.retry_policy.max_attempts
+        self.stub.statuses = [429] * attempts
+        with self.assertRaises(ImageAPIError) as cm:
+            await self.client.generate_image("a barn", GPT_IMAGE_CONFIG)
+        self.assertEqual(cm.exception.status, 429)
+        self.assertEqual(cm.exception.attempts, attempts)
+        self.assertEqual(len(self.stub.payloads), attempts)
+
+    async def test_non_retryable_error_stops_immediately(self):
+        self.stub.statuses = [401]
+        with self.assertRaises(ImageAPIError) as cm:
+            await self.client.generate_image("a barn", GPT_IMAGE_CONFIG)
+        self.assertEqual(cm.exception.verdict, "stop")
+        self.assertEqual(len(self.stub.payloads), 1)
+
+    async def test_deadline_bounds_a_hung_request(self):
+        self.client.retry_policy = RetryPolicy(base_delay=0, deadline=0.1)
+        self.stub.delay = 1.0
+        with self.assertRaises(ImageAPIError) as cm:
+            await self.client.generate_image("a barn", GPT_IMAGE_CONFIG)
+        self.assertEqual(cm.exception.status, "timeout")
+
+    async def test_spent_deadline_sends_nothing(self):
+        self.client.retry_policy = RetryPolicy(base_delay=0, deadline=0)
+        with self.assertRaises(ImageAPIError) as cm:
+            await self.client.generate_image("a barn", GPT_IMAGE_CONFIG)
+        self.assertEqual(cm.exception.status, "timeout")
+        self.assertEqual(self.stub.payloads, [])
+
+    async def test_deadline_bounds_the_rate_limit_wait(self):
+        class ClosedLimiter:
+            async def acquire(self, key):
+                await asyncio.Event().wait()
+
+        self.client.rate_limiter = ClosedLimiter()
+        self.client.retry_policy = RetryPolicy(base_delay=0, deadline=0.1)
+        with self.assertRaises(ImageAPIError) as cm:
+            await self.client.generate_image("a barn", GPT_IMAGE_CONFIG)
+        self.assertEqual(cm.exception.status, "timeout")
+        self.assertEqual(self.stub.payloads, [])
+
+    async def test_dropped_connection_is_retried(self):
+        self.stub.drops = 1
+        result = await self.client.generate_image("a barn", GPT_IMAGE_CONFIG)
+        self.assertEqual([f.read() for f in result["images"]], [PNG_BYTES])
+        self.assertEqual(result["attempts"], 2)
+        self.assertEqual(len(self.stub.payloads), 2)
+
+    async def test_dropped_connections_exhaust_the_retries(self):
+        attempts = self.client.retry_policy.max_attempts
+        self.stub.drops = attempts
+        with self.assertRaises(ImageAPIError) as cm:
+            await self.client.generate_image("a barn", GPT_IMAGE_CONFIG)
+        self.assertEqual(cm.exception.status, "connection")
+        self.assertEqual(cm.exception.verdict, "retry")
+        self.assertEqual(cm.exception.attempts, attempts)
+        self.assertEqual(len(self.stub.payloads), attempts)
+
+
+class ChatCompletionTest(StubServerTestCase):
+    async def test_returns_first_choice_content(self):
+        messages = [{"role": "user", "content": "make a meme"}]
+        content = await self.client.chat_completion("gpt-test", messages)
+        self.assertEqual(content, " a meme prompt ")
+        self.assertEqual(self.stub.payloads[-1], {"model": "gpt-test", "messages": messages})
+
+    async def test_slow_attempt_times_out_and_is_retried(self):
+        self.stub.chat_delays = [1.0]
+        content = await self.client.chat_completion("gpt-test", [])
+        self.assertEqual(content, " a meme prompt ")
+        self.assertEqual(len(self.stub.payloads), 2)
+
+    async def test_rate_limit_is_retried(self):
+        self.stub.chat_statuses = [429, 503]
+        self.assertEqual(await self.client.chat_completion("gpt-test", []), " a meme prompt ")
+        self.assertEqual(len(self.stub.payloads), 3)
+
+    async def test_client_error_is_not_retried(self):
+        self.stub.chat_statuses = [401]
+        with self.assertRaises(ChatAPIError):
+            await self.client.chat_completion("gpt-test", [])
+        self.assertEqual(len(self.stub.payloads), 1)
+
+    async def test_attempts_exhausted(self):
+        self.stub.chat_statuses = [500] * openai_client.CHAT_ATTEMPTS
+        with self.assertRaises(ChatAPIError):
+            await self.client.chat_completion("gpt-test", [])
+        self.assertEqual(len(self.stub.payloads), openai_client.CHAT_ATTEMPTS)
+
+    async def test_does_not_use_the_default_executor(self):
+        loop = asyncio.get_running_loop()
+        original = loop.run_in_executor
+        calls = []
+
+        def spy(executor, func, *args):
+            calls.append(func)
+            return original(executor, func, *args)
+
+        loop.run_in_executor = spy
+        try:
+            await asyncio.gather(*(self.client.chat_completion("gpt-test", []) for _ in range(20)))
+        finally:
+            loop.run_in_executor = original
+        self.assertEqual(calls, [])
+
+
+class ClassifyStatusTest(unittest.TestCase):
+    def test_classification(self):
+        self.assertEqual(classify_status(400), "safety")
+        for status in (429, 500, 503):
+            self.assertEqual(classify_status(status), "retry")
+        for status in (401, 404, 502):
+            self.assertEqual(classify_status(status), "stop")
+
+
+if __name__ == "__main__":
+    unittest.main()
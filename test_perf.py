@@ -0,0 +1,132 @@
+"""Unit tests for the per-stage latency histograms.
+
+These exercise perf.py in isolation (no Discord/OpenAI), asserting: quantiles read
+from the fixed buckets land close to the true ones and never past the largest value
+seen, a trace files the stages recorded before its model was known under that model
+(or under "-" when it never learns one) and adds the request's total, the current
+trace follows a command into the tasks it starts but not past end(), summaries merge
+and filter by command and model in pipeline order, and the periodic log line is only
+written when something new was recorded.
+
+Run from the repo root:  python -m unittest test_perf -v
+"""
+
+import asyncio
+import random
+import unittest
+
+import perf
+from perf import Histogram, PerfRecorder, Trace
+
+
+class HistogramTest(unittest.TestCase):
+    def test_quantiles_track_the_distribution(self):
+        rng = random.Random(7)
+        values = sorted(rng.uniform(5, 60) for _ in range(2000))
+        histogram = Histogram()
+        for value in values:
+            histogram.observe(value)
+        for q in perf.QUANTILES:
+            exact = values[int(q * len(values)) - 1]
+            self.assertAlmostEqual(histogram.quantile(q), exact, delta=exact * 0.15)
+        self.assertLessEqual(histogram.quantile(0.99), histogram.max)
+        self.assertEqual(histogram.count, 2000)
+
+    def test_empty_and_overflow(self):
+        histogram = Histogram()
+        self.assertIsNone(histogram.quantile(0.5))
+        histogram.observe(900)  # past the last bucket
+        self.assertTrue(300 < histogram.quantile(0.99) <= 900)
+        histogram.observe(0.0001)
+        self.assertLessEqual(histogram.quantile(0.5), 0.001)
+
+    def test_merge(self):
+        a, b = Histogram(), Histogram()
+        a.observe(1.5)
+        b.observe(40)
+        a.merge(b)
+        self.assertEqual((a.count, a.max, round(a.total, 1)), (2, 40, 41.5))
+
+
+class TraceTest(unittest.TestCase):
+    def test_early_stages_wait_for_the_model(self):
+        recorder = PerfRecorder()
+        trace = Trace(recorder, "paint")
+        trace.record("flags", 0.002)
+        with trace.stage("macros"):
+            pass
+        self.assertEqual(recorder.histograms, {})
+        trace.set_model("gpt-image-2")
+        trace.record("api", 30.0)
+        trace.finish()
+        self.assertEqual(sorted(recorder.histograms), [
+            ("api", "paint", "gpt-image-2"), ("flags", "paint", "gpt-image-2"),
+            ("macros", "paint", "gpt-image-2"), ("total", "paint", "gpt-image-2")])
+
+    def test_several_models_file_the_rest_under_no_model(self):
+        recorder = PerfRecorder()
+        trace = Trace(recorder, "compare")
+        trace.record("macros", 0.001)
+        trace.record("api", 20.0, model="dall-e-3")
+        trace.record("api", 40.0, model="gpt-image-2")
+        trace.finish()
+        self.assertIn(("api", "compare", "dall-e-3"), recorder.histograms)
+        self.assertIn(("macros", "compare", perf.NO_MODEL), recorder.histograms)
+        self.assertIn(("total", "compare", perf.NO_MODEL), recorder.histograms)
+
+    def test_a_trace_with_nothing_recorded_adds_no_total(self):
+        recorder = PerfRecorder()
+        Trace(recorder, "ping").finish()
+        self.assertEqual(recorder.observations, 0)
+
+    def test_summary_merges_filters_and_orders(self):
+        recorder = PerfRecorder()
+        recorder.observe("upload", 0.4, "paint", "gpt-image-2")
+        recorder.observe("api", 30.0, "paint", "gpt-image-2")
+        recorder.observe("api", 10.0, "lpaint", "gpt-image-2-low")
+        recorder.observe("flags", 0.001, "lpaint", "gpt-image-2-low")
+        self.assertEqual([stage for stage, _ in recorder.summary()], ["flags", "api", "upload"])
+        self.assertEqual(dict(recorder.summary())["api"].count, 2)
+        self.assertEqual(dict(recorder.summary(command="paint"))["api"].max, 30.0)
+        self.assertEqual([stage for stage, _ in recorder.summary(model="gpt-image-2-low")], ["flags", "api"])
+        self.assertEqual(recorder.names(), ({"paint", "lpaint"}, {"gpt-image-2", "gpt-image-2-low"}))
+
+
+class CurrentTraceTest(unittest.IsolatedAsyncioTestCase):
+    async def test_the_trace_follows_the_command_into_its_tasks(self):
+        recorder = PerfRecorder()
+
+        async def command():
+            perf.begin(recorder, "compare")
+            with perf.stage("macros"):
+                pass
+
+            async def render(model):
+                perf.record("api", 1.0, model=model)
+
+            await asyncio.gather(render("a"), asyncio.create_task(render("b")))
+            perf.end()
+            perf.record("api", 1.0, model="late")  # after end(): dropped
+
+        await asyncio.create_task(command())
+        models = {model for stage, _, model in recorder.histograms if stage == "api"}
+        self.assertEqual(models, {"a", "b"})
+        self.assertIsNone(perf.current())
+        with perf.stage("flags"):  # untraced: a no-op
+            pass
+
+
+class LogLoopTest(unittest.IsolatedAsyncioTestCase):
+    async def test_logs_only_when_something_new_was_recorded(self):
+        recorder = PerfRecorder(log_interval=0.05)
+        recorder.observe("api", 12.0, "paint", "gpt-image-2")
+        with self.assertLogs("bot_ross.perf", level="INFO") as logs:
+            recorder.start()
+            await asyncio.sleep(0.18)
+        await recorder.close()
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn("api 12.0s / 12.0s / 12.0s (n=1)", logs.output[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
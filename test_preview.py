@@ -0,0 +1,190 @@
+"""Tests for streamed partial-image previews.
+
+These exercise preview.py in isolation, and end to end against a local stub images
+API that streams server-sent events (no Discord), asserting: previews are published
+no more than once per interval with the newest frame winning (stale frames are
+closed unsent), close() drops a waiting frame but lets an edit in progress finish,
+a streamed generation hands each partial image over as it arrives and still returns
+the final image, an error event fails the request, and a config that can't stream
+is requested without it.
+
+Run from the repo root:  python -m unittest test_preview -v
+"""
+
+import asyncio
+import base64
+import io
+import json
+import time
+import unittest
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from openai_client import ImageAPIError, OpenAIClient
+from preview import PreviewThrottle
+from retry_policy import RetryPolicy
+
+FINAL = b"\x89PNG the finished painting"
+STREAM_CONFIG = {
+    "model": "gpt-image-2",
+    "params": {"size": "1024x1024", "quality": "high"},
+    "has_revised_prompt": False,
+    "supports_moderation": False,
+    "supports_edit": True,
+    "supports_streaming": True,
+}
+
+
+class Frame(io.BytesIO):
+    pass
+
+
+class Publisher:
+    """Records each published frame's index and time, taking `delay` per publish."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.published = []  # (index, monotonic time the publish started)
+
+    async def __call__(self, frame, index):
+        self.published.append((index, time.monotonic()))
+        await asyncio.sleep(self.delay)
+        frame.close()
+
+
+class ThrottleTest(unittest.IsolatedAsyncioTestCase):
+    async def test_newest_frame_wins_and_publishes_are_spaced(self):
+        publisher = Publisher()
+        throttle = PreviewThrottle(publisher, interval=0.1)
+        frames = [Frame() for _ in range(5)]
+        for index, frame in enumerate(frames):
+            throttle.offer(frame, index)
+            await asyncio.sleep(0.03)
+        await asyncio.sleep(0.15)
+        await throttle.close()
+        indexes = [index for index, _ in publisher.published]
+        self.assertEqual(indexes[0], 0)
+        self.assertEqual(indexes[-1], 4)
+        self.assertLess(len(indexes), 5)
+        self.assertEqual(throttle.dropped, 5 - len(indexes))
+        self.assertTrue(all(frame.closed for frame in frames))
+        starts = [started for _, started in publisher.published]
+        self.assertTrue(all(b - a >= 0.095 for a, b in zip(starts, starts[1:])), starts)
+
+    async def test_close_drops_the_waiting_frame_but_finishes_the_edit_in_progress(self):
+        publisher = Publisher(delay=0.1)
+        throttle = PreviewThrottle(publisher, interval=0.05)
+        first, second = Frame(), Frame()
+        throttle.offer(first, 0)
+        await asyncio.sleep(0.01)  # the first publish is under way
+        throttle.offer(second, 1)
+        started = time.monotonic()
+        await throttle.close()
+        self.assertGreater(time.monotonic() - started, 0.05)  # waited for the edit
+        self.assertEqual([index for index, _ in publisher.published], [0])
+        self.assertTrue(first.closed and second.closed)
+        late = Frame()
+        throttle.offer(late, 2)
+        self.assertTrue(late.closed)
+
+
+def _event(kind, **fields):
+    return f"event: {kind}\ndata: {json.dumps({'type': kind, **fields})}\n\n".encode()
+
+
+class StreamingImagesStub:
+    """/v1/images/generations answering a "stream": true request with server-sent
+    events: a partial image every `gap` seconds, then the completed image (or an
+    error event). A request without "stream" gets a plain JSON body."""
+
+    def __init__(self, partials=3, gap=0.05, error=None):
+        self.partials = partials
+        self.gap = gap
+        self.error = error
+        self.payloads = []
+        app = web.Application()
+        app.router.add_post("/v1/images/generations", self.generations)
+        self.server = TestServer(app)
+
+    async def generations(self, request):
+        payload = await request.json()
+        self.payloads.append(payload)
+        final = base64.b64encode(FINAL).decode()
+        if not payload.get("stream"):
+            return web.json_response({"data": [{"b64_json": final}]})
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for index in range(self.partials):
+            await asyncio.sleep(self.gap)
+            partial = base64.b64encode(f"partial {index}".encode()).decode()
+            await response.write(_event("image_generation.partial_image", b64_json=partial,
+                                        partial_image_index=index))
+        await asyncio.sleep(self.gap)
+        if self.error:
+            await response.write(_event("error", error={"message": self.error}))
+        else:
+            await response.write(_event("image_generation.completed", b64_json=final))
+        await response.write_eof()
+        return response
+
+
+class StreamedGenerationTest(unittest.IsolatedAsyncioTestCase):
+    async def _client(self, stub):
+        await stub.server.start_server()
+        client = OpenAIClient("sk-test", base_url=str(stub.server.make_url("/v1")),
+                              retry_policy=RetryPolicy(base_delay=0), partial_images=stub.partials)
+        await client.start()
+        self.addAsyncCleanup(stub.server.close)
+        self.addAsyncCleanup(client.close)
+        return client
+
+    async def test_partials_are_previewed_then_the_final_image_returned(self):
+        stub = StreamingImagesStub(partials=3, gap=0.05)
+        client = await self._client(stub)
+        received = []
+
+        async def publish(frame, index):
+            received.append((index, frame.read()))
+            frame.close()
+
+        throttle = PreviewThrottle(publish, interval=0.0)
+        result = await client.generate_image("a barn", STREAM_CONFIG, on_partial=throttle.offer)
+        await throttle.close()
+        self.assertEqual(stub.payloads[-1]["stream"], True)
+        self.assertEqual(stub.payloads[-1]["partial_images"], 3)
+        self.assertEqual(received, [(i, f"partial {i}".encode()) for i in range(3)])
+        self.assertEqual([f.read() for f in result["images"]], [FINAL])
+
+    async def test_edits_are_throttled_against_fast_frames(self):
+        stub = StreamingImagesStub(partials=3, gap=0.02)
+        client = await self._client(stub)
+        publisher = Publisher()
+        throttle = PreviewThrottle(publisher, interval=0.5)
+        result = await client.generate_image("a barn", STREAM_CONFIG, on_partial=throttle.offer)
+        await throttle.close()
+        # The first frame goes out at once; the rest land inside the interval and
+        # are superseded, then dropped once the final image is in.
+        self.assertEqual([index for index, _ in publisher.published], [0])
+        self.assertEqual(throttle.dropped, 1)
+        result["images"][0].close()
+
+    async def test_error_event_fails_the_request(self):
+        stub = StreamingImagesStub(partials=1, error="safety system")
+        client = await self._client(stub)
+        with self.assertRaises(ImageAPIError) as cm:
+            await client.generate_image("a barn", STREAM_CONFIG, on_partial=lambda f, i: f.close())
+        self.assertEqual(cm.exception.status, "stream")
+        self.assertEqual(len(stub.payloads), 1)
+
+    async def test_config_without_streaming_is_not_streamed(self):
+        stub = StreamingImagesStub()
+        client = await self._client(stub)
+        config = dict(STREAM_CONFIG, supports_streaming=False)
+        result = await client.generate_image("a barn", config, on_partial=lambda f, i: f.close())
+        self.assertNotIn("stream", stub.payloads[-1])
+        self.assertEqual(result["images"][0].read(), FINAL)
+
+
+if __name__ == "__main__":
+    unittest.main()
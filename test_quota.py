@@ -0,0 +1,126 @@
+"""Unit tests for the monthly quota reservations.
+
+These exercise quota.py over a real StatsStore (no Discord/OpenAI), asserting: a
+reservation counts against the limit until it is committed (in full or in part)
+or released, concurrent requests at LIMIT-1 let exactly one through, a failed
+request gives its slot back, committed requests persist write-behind with the other
+counters, and a reservation is charged to the month it was made in.
+
+Run from the repo root:  python -m unittest test_quota -v
+"""
+
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+
+from quota import MonthlyQuota, QuotaExceededError
+from stats_store import StatsStore
+
+
+class QuotaTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._dir.name, "request_data.json")
+        self.store = StatsStore(self.path)
+        self.month = "2026-10"
+        self.quota = MonthlyQuota(self.store, limit=3, month=lambda: self.month)
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    async def test_pending_reservations_count_against_the_limit(self):
+        await self.quota.reserve()
+        await self.quota.reserve()
+        await self.quota.reserve()
+        self.assertEqual(self.quota.pending(), 3)
+        self.assertEqual(self.quota.used(), 0)
+        with self.assertRaises(QuotaExceededError):
+            await self.quota.reserve()
+
+    async def test_commit_moves_pending_to_used(self):
+        reservation = await self.quota.reserve()
+        self.assertEqual(reservation.commit(), 1)
+        self.assertEqual(self.quota.used(), 1)
+        self.assertEqual(self.quota.pending(), 0)
+        self.assertEqual(self.quota.remaining(), 2)
+
+    async def test_partial_commit_hands_the_rest_back(self):
+        reservation = await self.quota.reserve(3)
+        self.assertEqual(reservation.commit(2), 2)
+        self.assertEqual(self.quota.pending(), 0)
+        self.assertEqual(self.quota.remaining(), 1)
+
+    async def test_release_gives_the_slot_back(self):
+        reservation = await self.quota.reserve(3)
+        with self.assertRaises(QuotaExceededError):
+            await self.quota.reserve()
+        reservation.release()
+        self.assertEqual(self.quota.used(), 0)
+        self.assertEqual(self.quota.remaining(), 3)
+        await self.quota.reserve()
+
+    async def test_settling_twice_is_a_no_op(self):
+        reservation = await self.quota.reserve()
+        reservation.commit()
+        reservation.release()
+        self.assertEqual(reservation.commit(), 1)
+        self.assertEqual(self.quota.used(), 1)
+        self.assertEqual(self.quota.pending(), 0)
+
+    async def test_concurrent_requests_at_limit_minus_one(self):
+        self.store.set(self.month, 2)
+        paid = 0
+
+        async def request():
+            nonlocal paid
+            try:
+                reservation = await self.quota.reserve()
+            except QuotaExceededError:
+                return False
+            try:
+                await asyncio.sleep(0.01)  # the OpenAI call
+                paid += 1
+                reservation.commit()
+                return True
+            finally:
+                reservation.release()
+
+        results = await asyncio.gather(*(request() for _ in range(20)))
+        self.assertEqual(results.count(True), 1)
+        self.assertEqual(paid, 1)
+        self.assertEqual(self.quota.used(), 3)
+
+    async def test_failures_never_spend_quota(self):
+        async def failing_request():
+            reservation = await self.quota.reserve()
+            try:
+                raise RuntimeError("safety system rejected the prompt")
+            finally:
+                reservation.release()
+
+        for _ in range(10):
+            with self.assertRaises(RuntimeError):
+                await failing_request()
+        self.assertEqual(self.quota.used(), 0)
+        self.assertEqual(self.quota.remaining(), 3)
+
+    async def test_commit_persists_write_behind(self):
+        (await self.quota.reserve()).commit()
+        self.assertFalse(os.path.exists(self.path))
+        await self.store.flush_async()
+        with open(self.path) as f:
+            self.assertEqual(json.load(f), {self.month: 1})
+
+    async def test_reservation_commits_to_the_month_it_was_made_in(self):
+        reservation = await self.quota.reserve()
+        self.month = "2026-11"
+        reservation.commit()
+        self.assertEqual(self.quota.used("2026-10"), 1)
+        self.assertEqual(self.quota.used(), 0)
+        self.assertEqual(self.quota.remaining(), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
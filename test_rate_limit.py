@@ -0,0 +1,231 @@
+"""Tests for the header-driven client-side rate limiter.
+
+Covers rate_limit.py's header parsing and bucket behavior in isolation, plus the
+acceptance scenario end to end through openai_client.OpenAIClient: against a local
+stub server that enforces N requests per window (answering the overflow with 429 and
+the usual x-ratelimit-* headers), a burst of 50 paints must finish without a single
+429, with each model paced by its own bucket.
+
+Run from the repo root:  python -m unittest test_rate_limit -v
+"""
+
+import asyncio
+import base64
+import time
+import unittest
+from email.utils import formatdate
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from openai_client import OpenAIClient
+from rate_limit import AdaptiveRateLimiter, parse_duration, parse_retry_after
+from retry_policy import RetryPolicy
+
+PNG_B64 = base64.b64encode(b"\x89PNG fake").decode()
+
+
+def _config(model):
+    return {
+        "model": model,
+        "params": {"size": "1024x1024"},
+        "has_revised_prompt": False,
+        "supports_moderation": False,
+        "supports_edit": False,
+    }
+
+
+class ParseTest(unittest.TestCase):
+    def test_openai_reset_durations(self):
+        self.assertAlmostEqual(parse_duration("1s"), 1.0)
+        self.assertAlmostEqual(parse_duration("20ms"), 0.02)
+        self.assertAlmostEqual(parse_duration("6m0s"), 360.0)
+        self.assertAlmostEqual(parse_duration("1h2m3.5s"), 3723.5)
+        self.assertAlmostEqual(parse_duration("2.5"), 2.5)
+
+    def test_unparseable_duration(self):
+        for bad in (None, "", "soon", "5 parsecs", "1s and then some"):
+            self.assertIsNone(parse_duration(bad), bad)
+
+    def test_retry_after_seconds_and_http_date(self):
+        self.assertEqual(parse_retry_after("3"), 3.0)
+        now = time.time()
+        self.assertAlmostEqual(parse_retry_after(formatdate(now + 30, usegmt=True), now=now), 30, delta=1)
+        self.assertEqual(parse_retry_after(formatdate(now - 30, usegmt=True), now=now), 0.0)
+        self.assertIsNone(parse_retry_after("whenever"))
+
+
+def _headers(limit, remaining, reset="1s"):
+    return {
+        "x-ratelimit-limit-requests": str(limit),
+        "x-ratelimit-remaining-requests": str(remaining),
+        "x-ratelimit-reset-requests": reset,
+    }
+
+
+class BucketTest(unittest.IsolatedAsyncioTestCase):
+    async def _acquired(self, limiter, key, timeout=0.05):
+        try:
+            await asyncio.wait_for(limiter.acquire(key), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def test_unknown_model_lets_one_probe_through(self):
+        limiter = AdaptiveRateLimiter()
+        self.assertTrue(await self._acquired(limiter, "gpt-image-2"))
+        self.assertFalse(await self._acquired(limiter, "gpt-image-2"))
+        limiter.update("gpt-image-2", 200, _headers(10, 9))
+        self.assertTrue(await self._acquired(limiter, "gpt-image-2"))
+
+    async def test_models_have_separate_buckets(self):
+        limiter = AdaptiveRateLimiter()
+        await limiter.acquire("dall-e-3")
+        limiter.update("dall-e-3", 200, _headers(1, 0, reset="10s"))
+        self.assertFalse(await self._acquired(limiter, "dall-e-3"))
+        self.assertTrue(await self._acquired(limiter, "gpt-image-2"))
+
+    async def test_empty_bucket_refills_at_reset(self):
+        limiter = AdaptiveRateLimiter()
+        await limiter.acquire("m")
+        limiter.update("m", 200, _headers(2, 1, reset="100ms"))
+        self.assertTrue(await self._acquired(limiter, "m"))
+        self.assertFalse(await self._acquired(limiter, "m", timeout=0.02))
+        self.assertTrue(await self._acquired(limiter, "m", timeout=0.5))
+
+    async def test_in_flight_requests_are_held_back_from_remaining(self):
+        limiter = AdaptiveRateLimiter()
+        await limiter.acquire("m")
+        limiter.update("m", 200, _headers(10, 9, reset="10s"))
+        for _ in range(3):
+            await limiter.acquire("m")
+        # The first of the three comes back; the other two may not be counted yet.
+        limiter.update("m", 200, _headers(10, 2, reset="10s"))
+        self.assertFalse(await self._acquired(limiter, "m"))
+
+    async def _refill_with_one_in_flight(self, limiter):
+        await limiter.acquire("m")
+        limiter.update("m", 200, _headers(2, 1, reset="100ms"))
+        stamp = await limiter.acquire("m")  # the last request of this window
+        # The bucket refills, but keeps a slot back for the request still in flight.
+        self.assertTrue(await self._acquired(limiter, "m", timeout=0.5))
+        self.assertFalse(await self._acquired(limiter, "m", timeout=0.02))
+        return stamp
+
+    async def test_late_response_from_the_old_window_returns_its_slot(self):
+        limiter = AdaptiveRateLimiter()
+        stamp = await self._refill_with_one_in_flight(limiter)
+        # Counted just before the old window ended: must not schedule another refill.
+        limiter.update("m", 200, _headers(2, 0, reset="1ms"), stamp)
+        self.assertTrue(await self._acquired(limiter, "m"))
+        self.assertFalse(await self._acquired(limiter, "m", timeout=0.2))
+
+    async def test_late_response_with_no_slot_held_returns_nothing(self):
+        limiter = AdaptiveRateLimiter()
+        stamp = await self._refill_with_one_in_flight(limiter)
+        limiter.update("m", 200, _headers(2, 0, reset="1ms"), stamp)
+        self.assertTrue(await self._acquired(limiter, "m"))
+        # Nothing is held for the old window any more: no slot to give back.
+        limiter.update("m", 200, _headers(2, 0, reset="1ms"), stamp)
+        self.assertFalse(await self._acquired(limiter, "m", timeout=0.2))
+
+    async def test_late_request_counted_in_the_new_window_updates_the_bucket(self):
+        limiter = AdaptiveRateLimiter()
+        stamp = await self._refill_with_one_in_flight(limiter)
+        limiter.update("m", 200, _headers(2, 0, reset="100ms"), stamp)
+        self.assertFalse(await self._acquired(limiter, "m", timeout=0.02))
+        self.assertTrue(await self._acquired(limiter, "m", timeout=0.5))
+
+    async def test_429_blocks_for_retry_after(self):
+        limiter = AdaptiveRateLimiter()
+        await limiter.acquire("m")
+        limiter.update("m", 429, {"retry-after": "0.2"})
+        self.assertFalse(await self._acquired(limiter, "m", timeout=0.1))
+        self.assertTrue(await self._acquired(limiter, "m", timeout=0.5))
+
+    async def test_exhausted_token_budget_blocks(self):
+        limiter = AdaptiveRateLimiter()
+        await limiter.acquire("m")
+        limiter.update("m", 200, {"x-ratelimit-remaining-tokens": "0", "x-ratelimit-reset-tokens": "150ms"})
+        self.assertFalse(await self._acquired(limiter, "m", timeout=0.05))
+        self.assertTrue(await self._acquired(limiter, "m", timeout=0.5))
+
+    async def test_no_headers_means_unthrottled(self):
+        limiter = AdaptiveRateLimiter()
+        await limiter.acquire("m")
+        limiter.update("m", 200, {})
+        for _ in range(20):
+            self.assertTrue(await self._acquired(limiter, "m"))
+
+    async def test_release_frees_the_probe(self):
+        limiter = AdaptiveRateLimiter()
+        await limiter.acquire("m")
+        limiter.release("m")
+        self.assertTrue(await self._acquired(limiter, "m"))
+
+
+class FixedWindowStub:
+    """Images API enforcing `limit` requests per `window` seconds per model, the way
+    OpenAI reports it: x-ratelimit-* headers on every response, 429 over the limit."""
+
+    def __init__(self, limit, window):
+        self.limit = limit
+        self.window = window
+        self.started = time.monotonic()
+        self.counts = {}
+        self.statuses = []
+        app = web.Application()
+        app.router.add_post("/v1/images/generations", self.generations)
+        self.server = TestServer(app)
+
+    async def generations(self, request):
+        model = (await request.json())["model"]
+        elapsed = time.monotonic() - self.started
+        window_index = int(elapsed // self.window)
+        reset = (window_index + 1) * self.window - elapsed
+        key = (model, window_index)
+        self.counts[key] = self.counts.get(key, 0) + 1
+        remaining = self.limit - self.counts[key]
+        headers = {
+            "x-ratelimit-limit-requests": str(self.limit),
+            "x-ratelimit-remaining-requests": str(max(remaining, 0)),
+            "x-ratelimit-reset-requests": f"{int(reset * 1000)}ms",
+        }
+        await asyncio.sleep(0.005)  # a little server-side latency keeps requests overlapping
+        if remaining < 0:
+            self.statuses.append(429)
+            headers["retry-after"] = f"{reset:.3f}"
+            return web.json_response({"error": {"message": "Rate limit reached"}}, status=429, headers=headers)
+        self.statuses.append(200)
+        return web.json_response({"data": [{"b64_json": PNG_B64}]}, headers=headers)
+
+
+class BurstAcceptanceTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.stub = FixedWindowStub(limit=8, window=0.25)
+        await self.stub.server.start_server()
+        self.client = OpenAIClient("sk-test", base_url=str(self.stub.server.make_url("/v1")),
+                                   retry_policy=RetryPolicy(base_delay=0))
+        await self.client.start()
+
+    async def asyncTearDown(self):
+        await self.client.close()
+        await self.stub.server.close()
+
+    async def test_burst_of_50_paints_gets_zero_429s(self):
+        results = await asyncio.gather(*(
+            self.client.generate_image(f"a happy little tree {i}", _config("gpt-image-2")) for i in range(50)
+        ))
+        self.assertEqual(len(results), 50)
+        self.assertEqual(self.stub.statuses.count(429), 0)
+        self.assertEqual(len(self.stub.statuses), 50)
+
+    async def test_mixed_models_are_paced_independently(self):
+        configs = [_config("gpt-image-2"), _config("dall-e-3")]
+        await asyncio.gather(*(self.client.generate_image("a barn", configs[i % 2]) for i in range(30)))
+        self.assertEqual(self.stub.statuses.count(429), 0)
+        self.assertEqual(len(self.stub.statuses), 30)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+"""Unit tests for bulk &release_image.
+
+These exercise release_batch.py in isolation (no Discord/OpenAI), asserting: --batch
+is stripped from the command text, hash-list files yield the first word of every
+line that isn't blank or a comment, inputs that build the same prompt fold into one
+entry (repeats dropped, first appearance kept), gallery captions name the other
+inputs of an entry and cut long ones short, and the bounded fan-out never runs more
+renders at once than its limit while keeping outcomes in order and failures apart.
+
+Run from the repo root:  python -m unittest test_release_batch -v
+"""
+
+import asyncio
+import unittest
+
+import release_batch
+from release_batch import caption, fan_out_bounded, group_by_prompt, parse_batch_flag, sources_from_file
+from release_image import build_release_prompts
+
+
+class ParseTest(unittest.TestCase):
+    def test_batch_flag(self):
+        self.assertEqual(parse_batch_flag("--BATCH  abc --v1 def"), ("abc --v1 def", True))
+        self.assertEqual(parse_batch_flag("abc --batched"), ("abc --batched", False))
+
+    def test_hash_list_file(self):
+        text = "# tags since 2.0\n1a2b3c4 Fix the easel\n\n  5d6e7f8\n#9999999 skipped\r\n0a0b0c0\n"
+        self.assertEqual(sources_from_file(text), ["1a2b3c4", "5d6e7f8", "0a0b0c0"])
+
+    def test_is_hash_list(self):
+        self.assertTrue(release_batch.is_hash_list("tags.TXT", None))
+        self.assertTrue(release_batch.is_hash_list("tags", "text/plain; charset=utf-8"))
+        self.assertFalse(release_batch.is_hash_list("tags.png", "image/png"))
+
+
+class GroupTest(unittest.TestCase):
+    def test_identical_prompts_fold_into_one_entry(self):
+        sources = ["abc", "def", "abc", "ghi"]
+        built = build_release_prompts(sources)
+        built[3] = (built[1][0], "5eed5eed", built[3][2])  # "ghi" happens to build def's prompt
+        entries = group_by_prompt(sources, built)
+        self.assertEqual([entry.sources for entry in entries], [["abc"], ["def", "ghi"]])
+        self.assertEqual(entries[1].seeds, [built[1][1], "5eed5eed"])
+        self.assertEqual(entries[0].prompt, built[0][0])
+
+    def test_caption(self):
+        entries = group_by_prompt(["a" * 64, "bbb"], [("same", "1234abcd", "2")] * 2)
+        line = caption(3, entries[0], "from the cache")
+        self.assertTrue(line.startswith(f"3. `{'a' * 39}…` seed 1234abcd (also `bbb`)"))
+        self.assertTrue(line.endswith(" — from the cache"))
+
+
+class FanOutBoundedTest(unittest.IsolatedAsyncioTestCase):
+    async def test_never_more_than_the_limit_at_once(self):
+        running, peak = 0, 0
+
+        async def render(name):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            if name == 4:
+                raise RuntimeError("safety system")
+            return name * 10
+
+        outcomes = await fan_out_bounded(list(range(10)), render, 3)
+        self.assertEqual(peak, 3)
+        self.assertEqual([outcome.name for outcome in outcomes], list(range(10)))
+        self.assertEqual(str(outcomes[4].error), "safety system")
+        self.assertEqual([outcome.result for outcome in outcomes if outcome.ok],
+                         [0, 10, 20, 30, 50, 60, 70, 80, 90])
+
+
+if __name__ == "__main__":
+    unittest.main()
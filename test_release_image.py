@@ -2,21 +2,31 @@
 
 These exercise release_image.py in isolation (no Discord/OpenAI), asserting the core
 promise: the same input always yields the same prompt, different inputs yield
-different prompts, and every generated prompt is well-formed and sensible.
+different prompts, and every generated prompt is well-formed and sensible. Also that
+compiling a version changes nothing v1 produces, the newer versions' picks come from
+one digest sliced per category, and the batch API matches one prompt at a time.
 
 Run from the repo root:  python -m unittest test_release_image -v
 """
 
+import hashlib
+import json
+import os
 import re
+import shutil
+import tempfile
 import unittest
 
 import release_image
 from release_image import (
     RELEASE_ALGORITHMS,
     build_release_prompt,
+    build_release_prompts,
+    compile_release_algorithm,
     get_release_algorithm,
     latest_version,
     parse_release_args,
+    release_indices,
     release_seed,
 )
 
@@ -61,8 +71,7 @@ class VarietyTest(unittest.TestCase):
         for src in SAMPLE_INPUTS:
             _, sub_algo = get_release_algorithm()
             for cat in sub_algo["categories"]:
-                wl = sub_algo["word_lists"][cat]
-                idx = release_image._release_index(src, latest_version(), cat, len(wl))
+                idx = release_indices(src)[cat]
                 seen[cat].add(idx)
         # Over 500 inputs, selection should spread across most of every list, not
         # collapse onto a handful of values.
@@ -84,7 +93,7 @@ class StructuralValidityTest(unittest.TestCase):
             # Every category's chosen phrase actually appears in the output.
             for cat in algo["categories"]:
                 wl = algo["word_lists"][cat]
-                pick = wl[release_image._release_index(src, latest_version(), cat, len(wl))]
+                pick = wl[release_indices(src)[cat]]
                 self.assertIn(pick, prompt, f"{cat} pick missing from prompt for {src}")
 
 
@@ -101,7 +110,7 @@ class GeorgifyTest(unittest.TestCase):
             if cat == "subject":
                 continue
             wl = algo["word_lists"][cat]
-            pick = wl[release_image._release_index("deadbeef", latest_version(), cat, len(wl))]
+            pick = wl[release_indices("deadbeef")[cat]]
             self.assertIn(pick, plain)
             self.assertIn(pick, george)
 
@@ -109,7 +118,7 @@ class GeorgifyTest(unittest.TestCase):
         george, _, _ = build_release_prompt("deadbeef", georgify=True)
         _, algo = get_release_algorithm()
         wl = algo["word_lists"]["subject"]
-        subject = wl[release_image._release_index("deadbeef", latest_version(), "subject", len(wl))]
+        subject = wl[release_indices("deadbeef")["subject"]]
         self.assertIn(f"George Costanza if he were {subject}", george)
 
 
@@ -153,6 +162,50 @@ class ArgParsingTest(unittest.TestCase):
         self.assertEqual(parse_release_args("--george")[0], "")
 
 
+class CompiledAlgorithmTest(unittest.TestCase):
+    def test_v1_prompts_are_unchanged(self):
+        # Minted before versions were compiled; must never change.
+        self.assertEqual(build_release_prompt("deadbeef", version="1"), (
+            "A delicate watercolor of a curious harbor seal pup in a bustling Moroccan spice market, with a "
+            "jar of fireflies. Rendered as a detailed steampunk engraving. A dramatic extreme close-up. "
+            "Shimmering under underwater caustics. Shadowed by lonely solitude. In a monochrome charcoal palette.",
+            "2baf1f40", "1"))
+
+    def test_digest_picks_slice_one_hash(self):
+        algorithm = compile_release_algorithm()
+        self.assertEqual(algorithm.picks, release_image.PICKS_DIGEST)
+        digest = hashlib.shake_256(f"deadbeef|{algorithm.version}".encode()).digest(8 * len(algorithm.categories))
+        expected = tuple(int.from_bytes(digest[8 * i:8 * i + 8], "big") % size
+                         for i, size in enumerate(algorithm.sizes))
+        self.assertEqual(algorithm.indices(" deadbeef "), expected)
+
+    def test_batch_matches_one_at_a_time(self):
+        for version in release_image.release_versions():
+            for georgify in (False, True):
+                self.assertEqual(build_release_prompts(SAMPLE_INPUTS[:50], version, georgify),
+                                 [build_release_prompt(src, version, georgify) for src in SAMPLE_INPUTS[:50]])
+        with self.assertRaises(KeyError):
+            build_release_prompts(["deadbeef"], version="999")
+
+    def test_compiled_once_with_a_sorted_version_index(self):
+        self.assertIs(compile_release_algorithm(), compile_release_algorithm(latest_version()))
+        algos = {"10": RELEASE_ALGORITHMS["1"], "9": RELEASE_ALGORITHMS["1"]}
+        self.assertEqual(release_image.release_versions(algos), ("9", "10"))
+        self.assertEqual(latest_version(algos), "10")
+
+    def test_extends_and_literal_percent_signs(self):
+        path = os.path.join(tempfile.mkdtemp(), "algorithms.json")
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        base = {"template": "{subject}, 100% {mood}", "georgify_template": "George as {subject}",
+                "categories": ["subject", "mood"], "word_lists": {"subject": ["an otter"], "mood": ["calm"]}}
+        with open(path, "w") as f:
+            json.dump({"1": base, "2": {"extends": "1", "picks": "digest"}}, f)
+        algorithms = release_image.load_release_algorithms(path)
+        self.assertEqual(algorithms["2"]["word_lists"], base["word_lists"])
+        self.assertNotIn("extends", algorithms["2"])
+        self.assertEqual(build_release_prompt("x", "2", True, algorithms)[0], "George as an otter, 100% calm")
+
+
 class DataIntegrityTest(unittest.TestCase):
     MINIMUMS = {"subject": 100, "setting": 100}
     DEFAULT_MINIMUM = 24
@@ -180,6 +233,13 @@ class DataIntegrityTest(unittest.TestCase):
             # georgify_template must reference {subject} and subject must be a category.
             self.assertIn("{subject}", algo["georgify_template"])
             self.assertIn("subject", categories)
+            compile_release_algorithm(version)  # a known "picks" scheme
+
+    def test_the_artifact_is_read_on_first_use(self):
+        algorithms = release_image._LazyAlgorithms("/nonexistent/release_algorithms.json")
+        with self.assertRaises(FileNotFoundError):
+            list(algorithms)
+        self.assertEqual(sorted(release_image._LazyAlgorithms()), sorted(RELEASE_ALGORITHMS))
 
     def test_no_stray_format_braces_in_word_lists(self):
         # Word-list phrases feed str.format via the template; stray braces would raise.
@@ -0,0 +1,89 @@
+"""Unit tests for the image-request retry policy.
+
+These exercise retry_policy.py in isolation (no Discord/OpenAI), asserting: backoff
+grows exponentially with full jitter and is capped, Retry-After is honored, attempts
+stop at the limit and at the deadline, the shared budget caps retry amplification,
+and attempts/backoff are recorded per request.
+
+Run from the repo root:  python -m unittest test_retry_policy -v
+"""
+
+import random
+import unittest
+
+from retry_policy import RetryBudget, RetryPolicy
+
+
+class BackoffTest(unittest.TestCase):
+    def test_full_jitter_within_exponential_ceiling(self):
+        policy = RetryPolicy(base_delay=1.0, max_delay=30.0, rng=random.Random(7).random)
+        for n in range(1, 10):
+            ceiling = min(30.0, 2 ** (n - 1))
+            for _ in range(200):
+                delay = policy.backoff(n)
+                self.assertGreaterEqual(delay, 0.0)
+                self.assertLessEqual(delay, ceiling)
+
+    def test_jitter_spreads_across_the_range(self):
+        policy = RetryPolicy(base_delay=1.0, max_delay=30.0, rng=random.Random(7).random)
+        delays = [policy.backoff(4) for _ in range(1000)]  # ceiling 8s
+        self.assertLess(min(delays), 1.0)
+        self.assertGreater(max(delays), 7.0)
+
+    def test_retry_after_is_a_floor(self):
+        policy = RetryPolicy(base_delay=1.0, rng=lambda: 0.0)
+        self.assertEqual(policy.backoff(1, retry_after=12.0), 12.0)
+        self.assertEqual(policy.backoff(1), 0.0)
+
+
+class TrackerTest(unittest.TestCase):
+    def test_attempts_capped_and_recorded(self):
+        policy = RetryPolicy(max_attempts=3, base_delay=1.0, rng=lambda: 0.5)
+        tracker = policy.start()
+        self.assertEqual(tracker.next_delay(), 0.5)   # retry 1: ceiling 1
+        self.assertEqual(tracker.next_delay(), 1.0)   # retry 2: ceiling 2
+        self.assertIsNone(tracker.next_delay())       # 3 attempts used
+        self.assertEqual(tracker.attempts, 3)
+        self.assertEqual(tracker.backoff, 1.5)
+
+    def test_wait_past_deadline_gives_up(self):
+        policy = RetryPolicy(deadline=10.0, rng=lambda: 0.0)
+        tracker = policy.start()
+        self.assertIsNone(tracker.next_delay(retry_after=60.0))
+        self.assertEqual(tracker.attempts, 1)
+        self.assertEqual(tracker.backoff, 0.0)
+
+    def test_empty_budget_stops_retries(self):
+        budget = RetryBudget(ratio=0.0, capacity=2.0)
+        policy = RetryPolicy(max_attempts=10, budget=budget, rng=lambda: 0.0)
+        tracker = policy.start()
+        self.assertIsNotNone(tracker.next_delay())
+        self.assertIsNotNone(tracker.next_delay())
+        self.assertIsNone(tracker.next_delay())
+        # The budget is global: a brand new request can't retry either.
+        self.assertIsNone(policy.start().next_delay())
+
+
+class BudgetTest(unittest.TestCase):
+    def test_outage_amplification_is_bounded(self):
+        # 1000 requests during a total outage, each wanting to retry 3 times: the
+        # budget allows the initial reserve plus ~20% of requests, not 3000 retries.
+        budget = RetryBudget(ratio=0.2, capacity=10.0)
+        policy = RetryPolicy(max_attempts=4, budget=budget, rng=lambda: 0.0)
+        retries = 0
+        for _ in range(1000):
+            tracker = policy.start()
+            while tracker.next_delay() is not None:
+                retries += 1
+        self.assertLessEqual(retries, 10 + 0.2 * 1000)
+        self.assertGreater(retries, 150)
+
+    def test_deposits_are_capped(self):
+        budget = RetryBudget(ratio=1.0, capacity=3.0)
+        for _ in range(10):
+            budget.deposit()
+        self.assertEqual(budget.balance, 3.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
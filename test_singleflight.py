@@ -0,0 +1,170 @@
+"""Unit tests for single-flight de-duplication.
+
+These exercise singleflight.py in isolation, and end to end through
+bot_ross.do_the_art on a bot built by create_bot() against a local stub images API
+(no Discord), asserting: concurrent calls with one key run the work once and every
+caller gets a result (followers through `share`), different keys and calls that do
+not overlap each run on their own, a failure or cancellation of the leader reaches
+its followers while a cancelled follower affects no one, and a burst of identical
+paints spends one API call and one quota slot, with each caller receiving its own
+readable copy of the image.
+
+Run from the repo root:  python -m unittest test_singleflight -v
+"""
+
+import asyncio
+import os
+import shutil
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+import bot_ross
+from singleflight import SingleFlight
+from stub_images import PNG_BYTES, SlowImagesStub
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class SingleFlightTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.flights = SingleFlight()
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def _work(self, value="painted"):
+        self.calls += 1
+        await self.release.wait()
+        return value
+
+    async def _start(self, key, n, **kwargs):
+        tasks = [asyncio.create_task(self.flights.run(key, self._work, **kwargs)) for _ in range(n)]
+        await asyncio.sleep(0)
+        return tasks
+
+    async def test_concurrent_calls_share_one_run(self):
+        tasks = await self._start("k", 5, share=lambda result: f"copy of {result}")
+        self.assertIn("k", self.flights)
+        self.release.set()
+        results = await asyncio.gather(*tasks)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results, ["painted"] + ["copy of painted"] * 4)
+        self.assertNotIn("k", self.flights)
+
+    async def test_different_keys_and_later_calls_run_separately(self):
+        tasks = await self._start("a", 2) + await self._start("b", 2)
+        self.release.set()
+        await asyncio.gather(*tasks)
+        self.assertEqual(self.calls, 2)
+        await self.flights.run("a", self._work)
+        self.assertEqual(self.calls, 3)
+
+    async def test_failure_reaches_every_caller(self):
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise ValueError("safety system")
+
+        tasks = [asyncio.create_task(self.flights.run("k", fail)) for _ in range(3)]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        self.assertTrue(all(isinstance(r, ValueError) for r in results))
+        self.assertEqual(len(self.flights), 0)
+
+    async def test_cancelled_follower_leaves_the_others_alone(self):
+        tasks = await self._start("k", 3)
+        tasks[1].cancel()
+        await asyncio.sleep(0)
+        self.release.set()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        self.assertEqual(results[0], "painted")
+        self.assertIsInstance(results[1], asyncio.CancelledError)
+        self.assertEqual(results[2], "painted")
+
+    async def test_cancelled_leader_cancels_its_followers(self):
+        tasks = await self._start("k", 3)
+        tasks[0].cancel()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        self.assertTrue(all(isinstance(r, asyncio.CancelledError) for r in results))
+        self.assertNotIn("k", self.flights)
+
+    async def test_follow_joins_before_the_result_lands(self):
+        leader = (await self._start("k", 1))[0]
+        waiter = self.flights.follow("k")
+        self.assertIsNone(self.flights.follow("other"))
+        self.release.set()
+        await leader
+        # The leader finished while this caller was busy elsewhere: the result waits.
+        self.assertEqual(await waiter, "painted")
+
+
+class FakeChannel:
+    """Enough of a Discord channel for do_the_art: every upload is read through and
+    kept, as Discord would."""
+
+    def __init__(self):
+        self.uploads = []
+
+    def upload(self, files):
+        self.uploads.extend(file.fp.read() for file in files or ())
+
+    async def send(self, content=None, files=None):
+        self.upload(files)
+        return FakeMessage(self)
+
+
+class FakeMessage:
+    def __init__(self, channel):
+        self.channel = channel
+
+    async def edit(self, content=None, attachments=None):
+        self.channel.upload(attachments)
+
+    async def delete(self):
+        pass
+
+
+class SharedPaintTest(unittest.IsolatedAsyncioTestCase):
+    """bot_ross.do_the_art with `dedupe`, on a bot built by create_bot() against the
+    stub images API."""
+
+    async def asyncSetUp(self):
+        self.stub = SlowImagesStub()
+        await self.stub.server.start_server()
+        self.addAsyncCleanup(self.stub.server.close)
+        workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workdir, ignore_errors=True)
+        for name in (bot_ross.DEFAULT_MAGIC_PROMPTS_FILE, bot_ross.DEFAULT_MACROS_FILE):
+            shutil.copy(os.path.join(REPO_DIR, name), workdir)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(workdir)
+        config = bot_ross.load_config({"API_LIMIT": "10", "PERF_LOG_INTERVAL": "0", "PREVIEW_PARTIALS": "0",
+                                       "REMIX_PREPROCESS": "0"})
+        bot = bot_ross.create_bot({**config, "openai_api_key": "sk-test", "openai_base_url": self.stub.base_url})
+        await bot.setup_hook()
+        self.addAsyncCleanup(bot.close)
+
+    async def _paint(self, user, prompt):
+        channel = FakeChannel()
+        ctx = SimpleNamespace(author=SimpleNamespace(id=user, name=f"user-{user}"), guild=None, send=channel.send)
+        self.assertTrue(await bot_ross.do_the_art(ctx, prompt, "paint", "gpt-image-2", dedupe=True))
+        return channel.uploads
+
+    async def test_burst_of_identical_paints_costs_one_call_and_one_slot(self):
+        paints = [asyncio.create_task(self._paint(user, "release abc123")) for user in range(6)]
+        await self.stub.arrived.wait()
+        self.stub.release.set()
+        uploads = await asyncio.gather(*paints)
+        self.assertEqual(uploads, [[PNG_BYTES]] * 6)
+        self.assertEqual(len(self.stub.payloads), 1)
+        self.assertEqual(bot_ross.monthly_quota.used(), 1)
+        self.assertEqual(bot_ross.monthly_quota.pending(), 0)
+        self.assertEqual(bot_ross.counters.get('shared_paintings'), 5)
+
+    async def test_different_prompts_are_not_merged(self):
+        self.stub.release.set()
+        await asyncio.gather(self._paint(1, "release abc123"), self._paint(2, "release def456"))
+        self.assertEqual(len(self.stub.payloads), 2)
+        self.assertEqual(bot_ross.monthly_quota.used(), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
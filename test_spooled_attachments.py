@@ -0,0 +1,195 @@
+"""Tests for streamed &remix attachment ingestion.
+
+These exercise spooled_attachments.py against a local stub server (no Discord/OpenAI),
+asserting: attachments download concurrently (total time tracks the slowest, not
+the sum), bodies are spooled rather than held in memory, the size cap is enforced
+both from the declared size and mid-stream, a failed download closes the others,
+and an edits request built from spooled files replays the full images on a retry,
+with a Content-Length, and leaves the files open for the caller.
+
+Run from the repo root:  python -m unittest test_spooled_attachments -v
+"""
+
+import asyncio
+import io
+import os
+import time
+import tracemalloc
+import unittest
+
+import aiohttp
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from openai_client import OpenAIClient
+from retry_policy import RetryPolicy
+from spooled_attachments import AttachmentTooLargeError, fetch_attachments, part_for
+
+MB = 1024 * 1024
+IMAGES = {name: os.urandom(size) for name, size in (("small.png", 200_000), ("big.png", 3 * MB),
+                                                    ("huge.png", 6 * MB))}
+
+EDIT_CONFIG = {
+    "model": "gpt-image-2",
+    "params": {"size": "1024x1024", "quality": "low"},
+    "has_revised_prompt": False,
+    "supports_moderation": False,
+    "supports_edit": True,
+}
+
+
+class AttachmentCdnStub:
+    """Discord's CDN: serves IMAGES after a per-request delay, streamed in chunks."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+        app = web.Application()
+        app.router.add_get("/attachments/{name}", self.attachment)
+        self.server = TestServer(app)
+
+    def url(self, name):
+        return str(self.server.make_url(f"/attachments/{name}"))
+
+    async def attachment(self, request):
+        name = request.match_info["name"]
+        if name not in IMAGES:
+            raise web.HTTPNotFound()
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+            response = web.StreamResponse(headers={"Content-Type": "image/png"})
+            await response.prepare(request)
+            data = memoryview(IMAGES[name])
+            for i in range(0, len(data), 256 * 1024):
+                await response.write(bytes(data[i:i + 256 * 1024]))
+            await response.write_eof()
+            return response
+        finally:
+            self.in_flight -= 1
+
+
+class FetchTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.cdn = AttachmentCdnStub(delay=0.2)
+        await self.cdn.server.start_server()
+        self.session = aiohttp.ClientSession()
+
+    async def asyncTearDown(self):
+        await self.session.close()
+        await self.cdn.server.close()
+
+    def _sources(self, *names, declared=True):
+        return [(self.cdn.url(name), "image/png", len(IMAGES[name]) if declared else None) for name in names]
+
+    async def test_downloads_run_concurrently_and_keep_order(self):
+        started = time.monotonic()
+        spooled = await fetch_attachments(self.session, self._sources("small.png", "big.png", "huge.png"))
+        elapsed = time.monotonic() - started
+        try:
+            self.assertEqual(self.cdn.max_in_flight, 3)
+            self.assertLess(elapsed, 0.5)  # three 0.2s downloads, not 0.6s+
+            self.assertEqual([image.file.read() for image in spooled],
+                             [IMAGES["small.png"], IMAGES["big.png"], IMAGES["huge.png"]])
+            self.assertEqual([image.size for image in spooled], [200_000, 3 * MB, 6 * MB])
+        finally:
+            for image in spooled:
+                image.close()
+
+    async def test_large_images_are_spooled_to_disk(self):
+        spooled = await fetch_attachments(self.session, self._sources("small.png", "huge.png"))
+        try:
+            self.assertIsInstance(spooled[0].file, io.BytesIO)
+            self.assertNotIsInstance(spooled[1].file, io.BytesIO)
+        finally:
+            for image in spooled:
+                image.close()
+
+    async def test_peak_memory_stays_flat(self):
+        tracemalloc.start()
+        try:
+            spooled = await fetch_attachments(self.session, self._sources("big.png", "huge.png", "huge.png"))
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        for image in spooled:
+            image.close()
+        # 15 MB downloaded. Buffered reads would peak above that; spooled ones stay
+        # around socket-buffer size (the stub server shares this process's count).
+        self.assertLess(peak, 8 * MB, f"peak {peak / MB:.1f} MB")
+
+    async def test_declared_size_over_cap_is_refused_without_downloading(self):
+        with self.assertRaises(AttachmentTooLargeError) as caught:
+            await fetch_attachments(self.session, self._sources("small.png", "huge.png"), max_bytes=5 * MB)
+        self.assertEqual(caught.exception.size, 6 * MB)
+
+    async def test_cap_is_enforced_mid_stream(self):
+        with self.assertRaises(AttachmentTooLargeError) as caught:
+            await fetch_attachments(self.session, self._sources("huge.png", declared=False), max_bytes=5 * MB)
+        self.assertLessEqual(caught.exception.size, 5 * MB + 256 * 1024)
+
+    async def test_failed_download_closes_the_rest(self):
+        sources = self._sources("small.png") + [(self.cdn.url("missing.png"), "image/png", None)]
+        with self.assertRaises(aiohttp.ClientResponseError):
+            await fetch_attachments(self.session, sources)
+
+
+class EditsStub:
+    """/v1/images/edits that fails the first `failures` attempts with 503 and records
+    every attempt's uploaded images and Content-Length."""
+
+    def __init__(self, failures=1):
+        self.failures = failures
+        self.uploads = []
+        self.content_lengths = []
+        app = web.Application(client_max_size=64 * MB)
+        app.router.add_post("/v1/images/edits", self.edits)
+        self.server = TestServer(app)
+
+    async def edits(self, request):
+        self.content_lengths.append(request.content_length)
+        form = await request.post()
+        self.uploads.append([f.file.read() for f in form.getall("image[]")])
+        if self.failures:
+            self.failures -= 1
+            return web.json_response({"error": {"message": "busy"}}, status=503)
+        return web.json_response({"data": [{"b64_json": "aGk="}]})
+
+
+class ReplayTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.stub = EditsStub(failures=2)
+        await self.stub.server.start_server()
+        self.client = OpenAIClient("sk-test", base_url=str(self.stub.server.make_url("/v1")),
+                                   retry_policy=RetryPolicy(base_delay=0))
+        await self.client.start()
+
+    async def asyncTearDown(self):
+        await self.client.close()
+        await self.stub.server.close()
+
+    async def test_spooled_files_replay_on_every_retry(self):
+        files = [io.BytesIO(IMAGES["small.png"]), io.BytesIO(IMAGES["big.png"])]
+        result = await self.client.edit_image("a barn", EDIT_CONFIG, [(f, "image/png") for f in files])
+        self.assertEqual(result["attempts"], 3)
+        self.assertEqual(self.stub.uploads, [[IMAGES["small.png"], IMAGES["big.png"]]] * 3)
+        self.assertTrue(all(length is not None for length in self.stub.content_lengths))
+        self.assertFalse(any(f.closed for f in files))
+
+    async def test_bytes_are_still_accepted(self):
+        self.stub.failures = 0
+        await self.client.edit_image("a barn", EDIT_CONFIG, [(b"raw", "image/png")])
+        self.assertEqual(self.stub.uploads, [[b"raw"]])
+
+    def test_part_for_reports_size_and_rewinds(self):
+        data = io.BytesIO(b"0123456789")
+        data.read(4)
+        part = part_for(data, "image/png", "image_0.png")
+        self.assertEqual(part.size, 10)
+        self.assertEqual(data.tell(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,210 @@
+"""Unit tests for the optional SQLite storage engine.
+
+These exercise sqlite_store.py in isolation (no Discord/OpenAI) and through the
+surfaces that sit on top of it -- StatsStore(db=...), json_library's load/save/cache
+once a library is attached, and macros.expand_macros -- asserting: the database runs
+in WAL mode, counters and rate history round-trip and flush only what changed,
+library saves touch only the rows that differ and keep order, the one-shot JSON
+migration imports everything exactly once, and the JSON export loads back as-is.
+
+Run from the repo root:  python -m unittest test_sqlite_store -v
+"""
+
+import json
+import os
+import tempfile
+import unittest
+
+import json_library
+from macros import expand_macros
+from sqlite_store import HISTORY_KEY, SqliteStore, main
+from stats_store import StatsStore
+
+LIBRARY = [
+    {"id": "cat", "text": "the world's most patient cat,"},
+    {"id": "heart", "text": "I ♥️ this — really,", "added_by": "bob"},
+]
+
+
+class _DbTestCase(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.dir = self._dir.name
+        self.db_path = os.path.join(self.dir, "bot_ross.db")
+        self.db = SqliteStore(self.db_path)
+
+    def tearDown(self):
+        self.db.close()
+        json_library._backends.clear()
+        json_library._handles.clear()
+        self._dir.cleanup()
+
+    def _write_json(self, name, value):
+        path = os.path.join(self.dir, name)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(value, f, ensure_ascii=False)
+        return path
+
+    def _count_changes(self):
+        """Rows written by the next statement(s), via sqlite's total_changes."""
+        return self.db._conn.total_changes
+
+
+class CountersTest(_DbTestCase):
+    def test_wal_mode(self):
+        (mode,) = self.db._conn.execute("PRAGMA journal_mode").fetchone()
+        self.assertEqual(mode, "wal")
+
+    def test_counters_and_history_round_trip(self):
+        history = [{"user": "bob", "rate": 0.1, "time": "2026-10-01T00:00:00+00:00"}]
+        self.db.write_counters({"2026-10": 7, "retry_backoff_seconds": 1.5, HISTORY_KEY: history})
+        reopened = SqliteStore(self.db_path)
+        try:
+            self.assertEqual(reopened.load_counters(),
+                             {"2026-10": 7, "retry_backoff_seconds": 1.5, HISTORY_KEY: history})
+        finally:
+            reopened.close()
+
+    def test_history_trim_and_append_touch_two_rows(self):
+        history = [{"user": "u", "rate": i / 100, "time": str(i)} for i in range(10)]
+        self.db.write_counters({HISTORY_KEY: history})
+        before = self._count_changes()
+        history = history[1:] + [{"user": "u", "rate": 0.5, "time": "10"}]
+        self.db.write_counters({HISTORY_KEY: history})
+        self.assertEqual(self._count_changes() - before, 2)  # one delete, one insert
+        self.assertEqual(self.db.load_counters()[HISTORY_KEY], history)
+
+    def test_stats_store_flushes_only_changed_keys(self):
+        self.db.write_counters({f"counter{i}": i for i in range(100)})
+        store = StatsStore(os.path.join(self.dir, "unused.json"), db=self.db)
+        self.assertEqual(store.get("counter42"), 42)
+        store.increment("counter42")
+        store.increment("2026-10")
+        before = self._count_changes()
+        store.flush()
+        self.assertEqual(self._count_changes() - before, 2)
+        self.assertFalse(store.dirty)
+        self.assertEqual(self.db.load_counters()["counter42"], 43)
+        self.assertFalse(os.path.exists(os.path.join(self.dir, "unused.json")))
+
+    def test_failed_db_flush_keeps_keys_dirty(self):
+        store = StatsStore(os.path.join(self.dir, "unused.json"), db=self.db)
+        store.increment("2026-10")
+        self.db.close()
+        with self.assertRaises(Exception):
+            store.flush()
+        self.assertTrue(store.dirty)
+        self.db = SqliteStore(self.db_path)
+        store.db = self.db
+        store.flush()
+        self.assertEqual(self.db.load_counters(), {"2026-10": 1})
+
+
+class LibraryTest(_DbTestCase):
+    def test_round_trip_preserves_order_and_unicode(self):
+        self.db.save_library("macro", LIBRARY)
+        self.assertEqual(self.db.load_library("macro"), LIBRARY)
+        self.assertEqual(self.db.load_library("magic"), [])
+
+    def test_edits_touch_only_the_changed_rows(self):
+        entries = [{"id": f"m{i}", "text": f"macro {i},"} for i in range(500)]
+        self.db.save_library("macro", entries)
+        cases = [
+            ("append", entries + [{"id": "new", "text": "new,"}], 1),
+            ("update", [dict(e, text="edited,") if e["id"] == "m250" else e for e in entries], 1),
+            ("remove", [e for e in entries if e["id"] != "m10"], 1),
+            ("insert at front", [{"id": "first", "text": "first,"}] + entries, 1),
+        ]
+        for name, new_entries, rows in cases:
+            with self.subTest(name):
+                self.db.save_library("macro", entries)
+                before = self._count_changes()
+                self.db.save_library("macro", new_entries)
+                self.assertEqual(self._count_changes() - before, rows)
+                self.assertEqual(self.db.load_library("macro"), new_entries)
+
+    def test_repeated_inserts_in_the_middle_keep_order(self):
+        entries = [{"id": "a"}, {"id": "z"}]
+        self.db.save_library("macro", entries)
+        # Far past the ~50 halvings a float gap allows: the positions get renumbered.
+        for i in range(200):
+            entries = entries[:1] + [{"id": f"mid{i}"}] + entries[1:]
+            self.db.save_library("macro", entries)
+            self.assertEqual(self.db.load_library("macro"), entries)
+        positions = [p for (p,) in self.db._conn.execute(
+            "SELECT position FROM library_entries WHERE library = 'macro' ORDER BY position")]
+        self.assertEqual(len(set(positions)), len(entries))
+
+    def test_json_library_surfaces_route_to_the_table(self):
+        path = os.path.join(self.dir, "macros.json")
+        json_library.attach_library(path, self.db, "macro")
+        json_library.save_library(LIBRARY, path)
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(json_library.load_library(path, "macro"), LIBRARY)
+        self.assertEqual(expand_macros("A ;cat", path=path)[0], "A the world's most patient cat,")
+        json_library.save_library([{"id": "cat", "text": "DOG,"}], path)
+        self.assertEqual(expand_macros("A ;cat", path=path)[0], "A DOG,")
+
+    def test_cached_library_sees_another_connection_commit(self):
+        path = os.path.join(self.dir, "macros.json")
+        json_library.attach_library(path, self.db, "macro")
+        json_library.save_library(LIBRARY, path)
+        handle = json_library.cached_library(path, "macro")
+        handle.recheck_interval = 0
+        self.assertEqual(handle.entries(), LIBRARY)
+        other = SqliteStore(self.db_path)
+        try:
+            other.save_library("macro", [{"id": "cat", "text": "edited elsewhere,"}])
+        finally:
+            other.close()
+        self.assertEqual(handle.entries(), [{"id": "cat", "text": "edited elsewhere,"}])
+
+
+class MigrationTest(_DbTestCase):
+    def setUp(self):
+        super().setUp()
+        self.history = [{"user": "bob", "rate": 0.1, "time": "2026-10-01T00:00:00+00:00"}]
+        self.counters_path = self._write_json("request_data.json",
+                                              {"2026-10": 12, "memes": 3, HISTORY_KEY: self.history})
+        self.paths = {
+            "macro": self._write_json("macros.json", LIBRARY),
+            "magic": self._write_json("magic_prompts.json", [{"id": "george", "text": "...but it's George."}]),
+        }
+
+    def test_imports_everything_once(self):
+        self.assertTrue(self.db.migrate_from_json(self.counters_path, self.paths))
+        self.assertEqual(self.db.load_counters(), {"2026-10": 12, "memes": 3, HISTORY_KEY: self.history})
+        self.assertEqual(self.db.load_library("macro"), LIBRARY)
+        self.assertEqual(self.db.load_library("magic"), [{"id": "george", "text": "...but it's George."}])
+        # A later start must not re-import (and clobber) anything.
+        self.db.write_counters({"2026-10": 13})
+        self.assertFalse(self.db.migrate_from_json(self.counters_path, self.paths))
+        self.assertEqual(self.db.load_counters()["2026-10"], 13)
+
+    def test_missing_and_malformed_files_import_as_empty(self):
+        with open(self.paths["magic"], "w") as f:
+            f.write("{ not valid json")
+        self.assertTrue(self.db.migrate_from_json(os.path.join(self.dir, "nope.json"), self.paths))
+        self.assertEqual(self.db.load_counters(), {})
+        self.assertEqual(self.db.load_library("magic"), [])
+        self.assertEqual(self.db.load_library("macro"), LIBRARY)
+
+    def test_export_loads_back_through_the_json_storage(self):
+        self.db.migrate_from_json(self.counters_path, self.paths)
+        backup = os.path.join(self.dir, "backup")
+        self.db.export_json(backup)
+        self.assertEqual(json_library.load_library(os.path.join(backup, "macros.json"), "macro"), LIBRARY)
+        self.assertEqual(StatsStore(os.path.join(backup, "request_data.json")).snapshot(),
+                         {"2026-10": 12, "memes": 3, HISTORY_KEY: self.history})
+        with open(os.path.join(backup, "magic_prompts.json"), encoding="utf-8") as f:
+            self.assertEqual(json.load(f), [{"id": "george", "text": "...but it's George."}])
+
+    def test_command_line_export(self):
+        self.db.migrate_from_json(self.counters_path, self.paths)
+        backup = os.path.join(self.dir, "cli-backup")
+        main(["export", self.db_path, backup])
+        self.assertEqual(sorted(os.listdir(backup)), ["macros.json", "magic_prompts.json", "request_data.json"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+"""Unit tests for the in-memory request counters and their write-behind flushing.
+
+These exercise stats_store.py (and the atomic_write.py helper it persists through)
+in isolation (no Discord/OpenAI), asserting: increments land in memory without
+touching disk, a flush writes one complete snapshot atomically, a failed write
+loses nothing, and close() persists whatever is still pending.
+
+Run from the repo root:  python -m unittest test_stats_store -v
+"""
+
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import stats_store
+from atomic_write import write_json_atomic
+from stats_store import StatsStore
+
+
+class InMemoryCountersTest(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._dir.name, "request_data.json")
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def test_missing_file_starts_empty(self):
+        store = StatsStore(self.path)
+        self.assertEqual(store.get("2026-10", 0), 0)
+        self.assertFalse(store.dirty)
+
+    def test_loads_existing_counters(self):
+        with open(self.path, "w") as f:
+            json.dump({"2026-10": 7, "memes": 2}, f)
+        store = StatsStore(self.path)
+        self.assertEqual(store.get("2026-10"), 7)
+        self.assertEqual(store.get("memes"), 2)
+
+    def test_increment_returns_new_value_and_never_writes(self):
+        store = StatsStore(self.path)
+        self.assertEqual(store.increment("2026-10"), 1)
+        self.assertEqual(store.increment("2026-10"), 2)
+        self.assertEqual(store.increment("macros", 3), 3)
+        self.assertTrue(store.dirty)
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_snapshot_is_detached_from_live_data(self):
+        store = StatsStore(self.path)
+        store.set("magic_rate_history", [{"user": "bob", "rate": 0.1}])
+        snap = store.snapshot()
+        snap["magic_rate_history"].append({"user": "eve", "rate": 1.0})
+        self.assertEqual(len(store.get("magic_rate_history")), 1)
+
+
+class FlushTest(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._dir.name, "request_data.json")
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def _on_disk(self):
+        with open(self.path) as f:
+            return json.load(f)
+
+    def test_flush_writes_snapshot_and_clears_dirty(self):
+        store = StatsStore(self.path)
+        store.increment("safety_trips")
+        store.flush()
+        self.assertFalse(store.dirty)
+        self.assertEqual(self._on_disk(), {"safety_trips": 1})
+        # Round-trips through a fresh store, as after a restart.
+        self.assertEqual(StatsStore(self.path).get("safety_trips"), 1)
+
+    def test_clean_store_does_not_rewrite(self):
+        store = StatsStore(self.path)
+        with mock.patch.object(stats_store, "write_json_atomic") as write:
+            store.flush()
+        write.assert_not_called()
+
+    def test_failed_write_keeps_increments_pending(self):
+        store = StatsStore(self.path)
+        store.increment("memes")
+        with mock.patch.object(stats_store, "write_json_atomic", side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                store.flush()
+        self.assertTrue(store.dirty)
+        store.flush()
+        self.assertEqual(self._on_disk(), {"memes": 1})
+
+    def test_no_temp_files_left_behind(self):
+        store = StatsStore(self.path)
+        store.increment("magic")
+        store.flush()
+        self.assertEqual(os.listdir(self._dir.name), ["request_data.json"])
+
+    def test_concurrent_increments_all_persisted_by_close(self):
+        store = StatsStore(self.path, flush_interval=0.01)
+
+        async def scenario():
+            store.start()
+
+            async def bump():
+                for _ in range(50):
+                    store.increment("2026-10")
+                    await asyncio.sleep(0)
+
+            await asyncio.gather(*(bump() for _ in range(20)))
+            await store.close()
+
+        asyncio.run(scenario())
+        self.assertEqual(self._on_disk(), {"2026-10": 1000})
+
+
+class AtomicWriteTest(unittest.TestCase):
+    def test_failed_serialization_leaves_old_file_intact(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "data.json")
+            write_json_atomic(path, {"ok": 1})
+            with self.assertRaises(TypeError):
+                write_json_atomic(path, {"bad": object()})
+            with open(path) as f:
+                self.assertEqual(json.load(f), {"ok": 1})
+            self.assertEqual(os.listdir(d), ["data.json"])
+
+
+if __name__ == "__main__":
+    unittest.main()
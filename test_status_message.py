@@ -0,0 +1,108 @@
+"""Unit tests for the per-request status message.
+
+These exercise status_message.py against a fake channel (no Discord), asserting: a
+paint's notes, stage and result take two Discord calls instead of the five separate
+sends it used to make, stage edits closer together than the interval are folded
+into the next one while attachments and the result always go out, a failed edit
+doesn't fail the request, nothing lands after finish(), and overlong notes are cut
+to fit Discord's message limit.
+
+Run from the repo root:  python -m unittest test_status_message -v
+"""
+
+import asyncio
+import io
+import unittest
+
+from status_message import MESSAGE_LIMIT, StatusMessage
+
+
+class FakeMessage:
+    def __init__(self, channel, content, files):
+        self.channel = channel
+        self.content = content
+        self.attachments = files
+
+    async def edit(self, content=None, attachments=None):
+        self.channel.calls.append(("edit", content))
+        if self.channel.fail_edits:
+            raise RuntimeError("429 Too Many Requests")
+        self.content = content
+        if attachments is not None:
+            self.attachments = attachments
+
+
+class FakeChannel:
+    def __init__(self):
+        self.calls = []
+        self.fail_edits = False
+        self.messages = []
+
+    async def send(self, content, files):
+        self.calls.append(("send", content))
+        message = FakeMessage(self, content, files)
+        self.messages.append(message)
+        return message
+
+
+class StatusMessageTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.channel = FakeChannel()
+        self.status = StatusMessage(self.channel.send, min_interval=0.05)
+
+    async def test_a_paint_is_one_post_and_one_edit(self):
+        self.status.note("We don't make mistakes, just happy little accidents.")
+        self.status.note("expanded prompt: a barn at dusk")
+        await self.status.update("Painting…")
+        image = io.BytesIO(b"png")
+        await self.status.finish("Generated in 12.0s | Monthly requests: 3", [image])
+        # Quote, expanded prompt, image, summary: four sends before, two calls now.
+        self.assertEqual([kind for kind, _ in self.channel.calls], ["send", "edit"])
+        self.assertEqual(self.status.calls, 2)
+        message = self.channel.messages[0]
+        self.assertEqual(message.content.splitlines(), [
+            "We don't make mistakes, just happy little accidents.",
+            "expanded prompt: a barn at dusk",
+            "Generated in 12.0s | Monthly requests: 3",
+        ])
+        self.assertEqual(message.attachments, [image])
+
+    async def test_quick_stage_edits_are_folded_but_files_and_results_go_out(self):
+        await self.status.update("Queued at position 2")
+        await self.status.update("Painting…")  # too soon: folded
+        await self.status.update("Still painting… (preview 1/2)", file=io.BytesIO(b"rough"))
+        await asyncio.sleep(0.06)
+        await self.status.update("Still painting…")
+        await self.status.finish("Done")
+        self.assertEqual([kind for kind, _ in self.channel.calls], ["send", "edit", "edit", "edit"])
+        self.assertEqual(self.channel.messages[0].attachments, [])
+
+    async def test_finish_without_a_post_sends_once(self):
+        self.status.note("a quote")
+        await self.status.finish("Monthly limit reached.")
+        self.assertEqual(self.channel.calls, [("send", "a quote\nMonthly limit reached.")])
+
+    async def test_failed_edit_is_not_fatal_and_nothing_lands_after_finish(self):
+        await self.status.update("Queued at position 1")
+        self.channel.fail_edits = True
+        await asyncio.sleep(0.06)
+        await self.status.update("Painting…")
+        self.channel.fail_edits = False
+        self.status.update_soon("Painting…")
+        await self.status.finish("Done")
+        await asyncio.sleep(0)
+        late = io.BytesIO(b"late frame")
+        await self.status.update("Still painting…", file=late)
+        self.assertTrue(late.closed)
+        self.assertEqual(self.channel.messages[0].content, "Done")
+        self.assertEqual(self.status.calls, 2)
+
+    async def test_overlong_notes_are_cut_to_fit(self):
+        self.status.note("expanded prompt: " + "paint " * 500)
+        content = self.status.render("Generated in 1.0s")
+        self.assertLessEqual(len(content), MESSAGE_LIMIT)
+        self.assertTrue(content.endswith("…\nGenerated in 1.0s"))
+
+
+if __name__ == "__main__":
+    unittest.main()